@@ -0,0 +1,982 @@
+#!/usr/bin/env python
+
+from numpy import *
+from numpy.lib.format import open_memmap
+from tables import *
+from collections import OrderedDict
+from time import time
+import os, shutil, json, hashlib, tempfile
+import cPickle as pickle
+
+
+def replaceFile(src, dst):
+    # os.rename does not replace an existing file on Windows:
+    if os.path.isfile(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+    return
+
+
+class Particle(IsDescription):
+    bandName = StringCol(8)
+    projectionRef = StringCol(512)
+    geoTransformation = Int32Col(shape=6)
+    rasterXSize = UInt16Col()
+    rasterYSize = UInt16Col()
+    rasterCount = UInt8Col()
+
+
+class L2A_IoStatistics(object):
+    ''' Always-on counters of the band store operations, aggregated per
+        pipeline stage and band: calls, uncompressed and stored bytes and wall time.
+    '''
+    def __init__(self):
+        self._stage = 'init'
+        self._counters = {}
+
+    def get_stage(self):
+        return self._stage
+
+    def set_stage(self, value):
+        self._stage = value
+
+    def del_stage(self):
+        del self._stage
+
+    stage = property(get_stage, set_stage, del_stage, "stage's docstring")
+
+    def record(self, op, band, nbytes=0, stored=0, seconds=0.0):
+        ops = self._counters.setdefault(self._stage, {}).setdefault(band, {})
+        counter = ops.get(op)
+        if counter is None:
+            counter = ops[op] = [0, 0, 0, 0.0]
+        counter[0] += 1
+        counter[1] += int(nbytes)
+        counter[2] += int(stored)
+        counter[3] += seconds
+        return
+
+    def summary(self):
+        # nested per stage and band, plus the totals per band and per stage:
+        def entry(counter):
+            return {'calls': counter[0], 'bytes': counter[1],
+                    'stored_bytes': counter[2], 'seconds': round(counter[3], 6)}
+
+        def add(target, op, counter):
+            total = target.setdefault(op, [0, 0, 0, 0.0])
+            for i in range(4):
+                total[i] += counter[i]
+
+        stages = {}
+        bandTotals = {}
+        stageTotals = {}
+        for stage, bands in self._counters.items():
+            stages[stage] = {}
+            for band, ops in bands.items():
+                stages[stage][band] = {}
+                for op, counter in ops.items():
+                    stages[stage][band][op] = entry(counter)
+                    add(bandTotals.setdefault(band, {}), op, counter)
+                    add(stageTotals.setdefault(stage, {}), op, counter)
+
+        def entries(totals):
+            return dict((key, dict((op, entry(counter)) for op, counter in ops.items()))
+                        for key, ops in totals.items())
+
+        return {'stages': stages, 'bands': entries(bandTotals), 'stage_totals': entries(stageTotals)}
+
+    def dump(self, filename):
+        fp = open(filename, 'w')
+        try:
+            json.dump(self.summary(), fp, indent=2, sort_keys=True)
+        finally:
+            fp.close()
+        return
+
+
+class L2A_BandStatistics(object):
+    ''' Statistics of a band, accumulated strip by strip while the band is written:
+        min, max, mean, the number of zero (no data) pixels and a coarse histogram
+        of 64 bins over the 16 bit range.
+    '''
+    bins = 64
+
+    def __init__(self):
+        self._count = 0
+        self._zeros = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+        self._histogram = zeros(self.bins, int64)
+
+    def get_max(self):
+        return self._max
+
+    max = property(get_max, None, None, "max's docstring")
+
+    def update(self, array):
+        if array.size == 0:
+            return
+        self._count += array.size
+        self._zeros += array.size - count_nonzero(array)
+        self._sum += float(array.sum(dtype=float64))
+        amin = array.min()
+        amax = array.max()
+        if self._min is None or amin < self._min:
+            self._min = amin
+        if self._max is None or amax > self._max:
+            self._max = amax
+        if array.dtype.kind == 'u' and array.dtype.itemsize <= 2:
+            self._histogram += bincount((array >> 10).ravel(), minlength=self.bins)[:self.bins]
+        else:
+            self._histogram += histogram(array, bins=self.bins, range=(0, 65536))[0]
+        return
+
+    def result(self):
+        if self._count == 0:
+            mean = 0.0
+        else:
+            mean = self._sum / self._count
+        return {'count': self._count, 'zeros': self._zeros, 'min': self._min, 'max': self._max,
+                'mean': mean, 'histogram': self._histogram}
+
+
+class L2A_BandStore(object):
+    ''' Keeps one read / write handle per HDF5 band database open
+        for the whole resolution pass, instead of opening and closing
+        the file for every single band access.
+    '''
+    extension = '.h5'
+
+    def __init__(self, config):
+        self._config = config
+        self._logger = config.logger
+        self._handles = {}
+        # catalogue of all band nodes per database: (where, name) -> (shape, dtype, codec),
+        # loaded when a database is opened and updated write-through:
+        self._catalogue = {}
+        # row numbers of the META table per database: bandName -> [rows]
+        self._metaRows = {}
+        # the counters are kept in the configuration, to sum up all resolution passes:
+        if not isinstance(config._stat, L2A_IoStatistics):
+            config._stat = L2A_IoStatistics()
+
+    def get_config(self):
+        return self._config
+
+    def set_config(self, value):
+        self._config = value
+
+    def del_config(self):
+        del self._config
+
+    def get_logger(self):
+        return self._logger
+
+    def set_logger(self, value):
+        self._logger = value
+
+    def del_logger(self):
+        del self._logger
+
+    def get_statistics(self):
+        return self._config._stat
+
+    config = property(get_config, set_config, del_config, "config's docstring")
+    logger = property(get_logger, set_logger, del_logger, "logger's docstring")
+    statistics = property(get_statistics, None, None, "statistics's docstring")
+
+    def exists(self, filename):
+        return os.path.isfile(filename)
+
+    def size(self, filename):
+        return os.path.getsize(filename)
+
+    def create(self, filename, title):
+        self.close(filename)
+        h5file = open_file(filename, mode='w', title=title)
+        try:
+            group = h5file.create_group('/', 'metadata', 'metadata information')
+            h5file.create_table(group, 'META', Particle, "Meta Data")
+            h5file.create_group('/', 'arrays', 'band arrays')
+            h5file.create_group('/', 'tmp', 'temporary arrays')
+            h5file.create_group('/', 'pyramid', 'resampled band arrays')
+        finally:
+            h5file.close()
+        return
+
+    def remove(self, filename):
+        self.close(filename)
+        os.remove(filename)
+        return
+
+    def open(self, filename):
+        h5file = self._handles.get(filename)
+        if h5file is not None and h5file.isopen:
+            return h5file
+        # a missing database must not be created implicitly by a read access:
+        if not os.path.isfile(filename):
+            raise IOError('database ' + filename + ' does not exist')
+        start = time()
+        h5file = open_file(filename, mode='a')
+        self._handles[filename] = h5file
+        catalogue = {}
+        for where in ['/arrays', '/tmp', '/pyramid']:
+            # a database of a previous version may not have all groups:
+            if not h5file.__contains__(where):
+                continue
+            for node in h5file.list_nodes(where):
+                catalogue[(where, node.name)] = (node.shape, node.dtype, self.getCodec(node.filters))
+        self._catalogue[filename] = catalogue
+        metaRows = {}
+        for row in h5file.root.metadata.META.iterrows():
+            metaRows.setdefault(row['bandName'], []).append(row.nrow)
+        self._metaRows[filename] = metaRows
+        self.statistics.record('open', os.path.basename(filename), seconds=time() - start)
+        self.logger.debug('Database %s opened', os.path.basename(filename))
+        return h5file
+
+    def getCodec(self, filters):
+        if filters is None or filters.complevel == 0:
+            return 'NONE'
+        return filters.complib.upper()
+
+    def getEntry(self, filename, where, name):
+        if filename not in self._catalogue:
+            self.open(filename)
+        return self._catalogue[filename].get((where, name))
+
+    def isOpen(self, filename):
+        h5file = self._handles.get(filename)
+        return h5file is not None and h5file.isopen
+
+    def hasNode(self, filename, where, name):
+        return self.getEntry(filename, where, name) is not None
+
+    def getNode(self, filename, where, name):
+        h5file = self.open(filename)
+        return h5file.get_node(where, name)
+
+    def readNode(self, filename, where, name):
+        start = time()
+        node = self.getNode(filename, where, name)
+        array = node.read()
+        self.statistics.record('read', name, array.nbytes, node.size_on_disk, time() - start)
+        return array
+
+    def readWindow(self, filename, where, name, rows, cols):
+        # only the chunks intersecting the window are read and decompressed:
+        start = time()
+        array = self.getNode(filename, where, name)[rows, cols]
+        self.statistics.record('read_window', name, array.nbytes, seconds=time() - start)
+        return array
+
+    def writeWindow(self, filename, where, name, rows, cols, array):
+        start = time()
+        self.getNode(filename, where, name)[rows, cols] = array
+        self.statistics.record('write_window', name, array.nbytes, seconds=time() - start)
+        return
+
+    def getFilters(self):
+        codec = self.config.db_compression_codec
+        level = self.config.db_compression_level
+        if codec == 'NONE' or level == 0:
+            return Filters(complevel=0)
+        complib = codec.lower()
+        if which_lib_version(complib.split(':')[0]) is None:
+            self.logger.warning('compression codec %s not available, zlib will be used' % codec)
+            complib = 'zlib'
+        return Filters(complib=complib, complevel=level)
+
+    def getChunkShape(self, shape):
+        # 2-D chunks, so that windowed access does not need to decode full rows:
+        chunkSize = self.config.db_chunk_size
+        if chunkSize == 0:
+            return None
+        return (min(chunkSize, shape[0]), min(chunkSize, shape[1]))
+
+    def createNode(self, filename, where, name, atom, shape):
+        # creates an empty node for a band of the given shape, to be filled by appendNode:
+        h5file = self.open(filename)
+        if h5file.__contains__(where + '/' + name):
+            h5file.get_node(where, name).remove()
+        if not h5file.__contains__(where):
+            h5file.create_group('/', where.strip('/'))
+        group = h5file.get_node(where)
+        filters = self.getFilters()
+        node = h5file.create_earray(group, name, atom, (0, shape[1]), name, filters=filters,
+                                    chunkshape=self.getChunkShape(shape), expectedrows=shape[0])
+        self._catalogue[filename][(where, name)] = (node.shape, node.dtype, self.getCodec(filters))
+        return node
+
+    def allocateNode(self, filename, where, name, atom, shape):
+        # creates a node of the given shape, read as zeros, to be filled by writeWindow.
+        # Chunks are only stored when written, the band is never held in memory:
+        h5file = self.open(filename)
+        if h5file.__contains__(where + '/' + name):
+            h5file.get_node(where, name).remove()
+        if not h5file.__contains__(where):
+            h5file.create_group('/', where.strip('/'))
+        group = h5file.get_node(where)
+        filters = self.getFilters()
+        node = h5file.create_carray(group, name, atom, shape, name, filters=filters,
+                                    chunkshape=self.getChunkShape(shape))
+        self._catalogue[filename][(where, name)] = (node.shape, node.dtype, self.getCodec(filters))
+        return node
+
+    def appendNode(self, filename, where, name, array):
+        start = time()
+        node = self.getNode(filename, where, name)
+        node.append(array)
+        entry = self._catalogue[filename][(where, name)]
+        self._catalogue[filename][(where, name)] = (node.shape,) + entry[1:]
+        self.statistics.record('append', name, array.nbytes, seconds=time() - start)
+        return node
+
+    def finishNode(self, filename, where, name):
+        return self.getNode(filename, where, name)
+
+    def writeNode(self, filename, where, name, array, atom):
+        start = time()
+        node = self.createNode(filename, where, name, atom, array.shape)
+        node.append(array)
+        entry = self._catalogue[filename][(where, name)]
+        self._catalogue[filename][(where, name)] = (node.shape,) + entry[1:]
+        self.statistics.record('write', name, array.nbytes, node.size_on_disk, time() - start)
+        return node
+
+    def removeNode(self, filename, where, name):
+        start = time()
+        h5file = self.open(filename)
+        self._catalogue[filename].pop((where, name), None)
+        if h5file.__contains__(where + '/' + name):
+            h5file.get_node(where, name).remove()
+            self.statistics.record('remove', name, seconds=time() - start)
+            return True
+        return False
+
+    def setAttrs(self, filename, where, name, attrs):
+        node = self.getNode(filename, where, name)
+        for key, value in attrs.items():
+            node._v_attrs[key] = value
+        return
+
+    def getAttrs(self, filename, where, name):
+        attrs = self.getNode(filename, where, name)._v_attrs
+        return dict((key, attrs[key]) for key in attrs._v_attrnamesuser)
+
+    def getMeta(self, filename, bandName):
+        start = time()
+        table = self.open(filename).root.metadata.META
+        rows = self._metaRows[filename].get(bandName)
+        if not rows:
+            return None
+        row = table[rows[0]]
+        self.statistics.record('meta_read', bandName, seconds=time() - start)
+        return (row['rasterYSize'], row['rasterXSize'], row['rasterCount'])
+
+    def setMeta(self, filename, bandName, nrows, ncols, count=1):
+        start = time()
+        table = self.open(filename).root.metadata.META
+        rows = self._metaRows[filename].get(bandName)
+        # if row exists, change it:
+        if rows:
+            for nrow in rows:
+                table.modify_columns(start=nrow, stop=nrow+1, columns=[[nrows], [ncols], [count]],
+                                     names=['rasterYSize', 'rasterXSize', 'rasterCount'])
+        # else append it:
+        else:
+            row = table.row
+            row['bandName'] = bandName
+            row['rasterYSize'] = nrows
+            row['rasterXSize'] = ncols
+            row['rasterCount'] = count
+            row.append()
+            table.flush()
+            self._metaRows[filename][bandName] = [table.nrows - 1]
+        table.flush()
+        self.statistics.record('meta_write', bandName, seconds=time() - start)
+        return
+
+    def listMeta(self, filename):
+        self.open(filename)
+        return self._metaRows[filename].keys()
+
+    def removeMeta(self, filename, bandName):
+        table = self.open(filename).root.metadata.META
+        rows = self._metaRows[filename].get(bandName)
+        if not rows:
+            return False
+        for nrow in sorted(rows, reverse=True):
+            table.remove_rows(nrow, nrow + 1)
+        table.flush()
+        # the rows behind the removed ones have moved:
+        metaRows = {}
+        for row in table.iterrows():
+            metaRows.setdefault(row['bandName'], []).append(row.nrow)
+        self._metaRows[filename] = metaRows
+        return True
+
+    def prune(self, filename, keep):
+        # removes all band nodes and meta entries, except of the bands in keep:
+        self.open(filename)
+        for where, name in self._catalogue[filename].keys():
+            if name not in keep:
+                self.removeNode(filename, where, name)
+        for bandName in self.listMeta(filename):
+            if bandName not in keep:
+                self.removeMeta(filename, bandName)
+        return
+
+    def flush(self, filename=None):
+        for key, h5file in self._handles.items():
+            if filename is not None and key != filename:
+                continue
+            if h5file.isopen:
+                start = time()
+                h5file.flush()
+                self.statistics.record('flush', os.path.basename(key), seconds=time() - start)
+        return
+
+    def close(self, filename=None):
+        for key in self._handles.keys():
+            if filename is not None and key != filename:
+                continue
+            h5file = self._handles.pop(key)
+            self._catalogue.pop(key, None)
+            self._metaRows.pop(key, None)
+            if h5file.isopen:
+                h5file.close()
+                self.logger.debug('Database %s closed', os.path.basename(key))
+        return
+
+
+class L2A_NpyBandStore(L2A_BandStore):
+    ''' Scratch database as a directory with one raw .npy file per band,
+        keeping the /arrays and /tmp groups and the META table of the HDF5 layout.
+        Bands are handed back as copy-on-write memory maps.
+    '''
+    extension = '.npy'
+
+    def __init__(self, config):
+        L2A_BandStore.__init__(self, config)
+        self._meta = {}
+        # nodes being filled by appendNode: (filename, where, name) -> [memory map, next row]
+        self._appending = {}
+
+    def exists(self, filename):
+        return os.path.isdir(filename)
+
+    def size(self, filename):
+        size = 0
+        for dirpath, dirnames, filenames in os.walk(filename):
+            for fn in filenames:
+                size += os.path.getsize(os.path.join(dirpath, fn))
+        return size
+
+    def create(self, filename, title):
+        self.close(filename)
+        if self.exists(filename):
+            shutil.rmtree(filename)
+        os.mkdir(filename)
+        os.mkdir(os.path.join(filename, 'arrays'))
+        os.mkdir(os.path.join(filename, 'tmp'))
+        os.mkdir(os.path.join(filename, 'pyramid'))
+        self._meta[filename] = OrderedDict()
+        self.writeMeta(filename)
+        del self._meta[filename]
+        return
+
+    def remove(self, filename):
+        self.close(filename)
+        shutil.rmtree(filename)
+        return
+
+    def open(self, filename):
+        meta = self._meta.get(filename)
+        if meta is not None:
+            return meta
+        if not self.exists(filename):
+            raise IOError('database ' + filename + ' does not exist')
+        start = time()
+        fp = open(os.path.join(filename, 'META.pic'), 'rb')
+        try:
+            meta = pickle.load(fp)
+        finally:
+            fp.close()
+        self._meta[filename] = meta
+        catalogue = {}
+        for where in ['/arrays', '/tmp', '/pyramid']:
+            # a database of a previous version may not have all groups:
+            if not os.path.isdir(os.path.join(filename, where.strip('/'))):
+                continue
+            for fn in os.listdir(os.path.join(filename, where.strip('/'))):
+                if not fn.endswith('.npy'):
+                    continue
+                node = load(os.path.join(filename, where.strip('/'), fn), mmap_mode='r')
+                catalogue[(where, fn[:-4])] = (node.shape, node.dtype, 'NONE')
+                del node
+        self._catalogue[filename] = catalogue
+        self.statistics.record('open', os.path.basename(filename), seconds=time() - start)
+        self.logger.debug('Database %s opened', os.path.basename(filename))
+        return meta
+
+    def writeMeta(self, filename):
+        # written to a temporary file first, to never leave a truncated table behind:
+        metaFn = os.path.join(filename, 'META.pic')
+        fp = open(metaFn + '.tmp', 'wb')
+        try:
+            pickle.dump(self._meta[filename], fp, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fp.close()
+        replaceFile(metaFn + '.tmp', metaFn)
+        return
+
+    def isOpen(self, filename):
+        return filename in self._meta
+
+    def nodePath(self, filename, where, name):
+        return os.path.join(filename, where.strip('/'), name + '.npy')
+
+    def makeGroup(self, filename, where):
+        path = os.path.join(filename, where.strip('/'))
+        if not os.path.isdir(path):
+            os.mkdir(path)
+        return
+
+    def attrsPath(self, filename, where, name):
+        return os.path.join(filename, where.strip('/'), name + '.pic')
+
+    def removeAttrs(self, filename, where, name):
+        # the attributes belong to the array they were computed from:
+        path = self.attrsPath(filename, where, name)
+        if os.path.isfile(path):
+            os.remove(path)
+        return
+
+    def setAttrs(self, filename, where, name, attrs):
+        path = self.attrsPath(filename, where, name)
+        current = self.getAttrs(filename, where, name)
+        current.update(attrs)
+        fp = open(path + '.tmp', 'wb')
+        try:
+            pickle.dump(current, fp, pickle.HIGHEST_PROTOCOL)
+        finally:
+            fp.close()
+        replaceFile(path + '.tmp', path)
+        return
+
+    def getAttrs(self, filename, where, name):
+        self.open(filename)
+        path = self.attrsPath(filename, where, name)
+        if not os.path.isfile(path):
+            return {}
+        fp = open(path, 'rb')
+        try:
+            return pickle.load(fp)
+        finally:
+            fp.close()
+
+    def getNode(self, filename, where, name):
+        self.open(filename)
+        path = self.nodePath(filename, where, name)
+        if not os.path.isfile(path):
+            raise KeyError(where + '/' + name + ' not found in ' + filename)
+        # copy-on-write: callers may modify the returned array without touching the store:
+        return load(path, mmap_mode='c')
+
+    def readNode(self, filename, where, name):
+        # pages are only mapped here, the time of the actual reads is spent by the caller:
+        start = time()
+        array = self.getNode(filename, where, name)
+        self.statistics.record('read', name, array.nbytes, array.nbytes, time() - start)
+        return array
+
+    def readWindow(self, filename, where, name, rows, cols):
+        # the window is detached from the memory map, so that the file can be rewritten:
+        start = time()
+        array = self.getNode(filename, where, name)[rows, cols].copy()
+        self.statistics.record('read_window', name, array.nbytes, seconds=time() - start)
+        return array
+
+    def writeWindow(self, filename, where, name, rows, cols, array):
+        start = time()
+        self.open(filename)
+        path = self.nodePath(filename, where, name)
+        if not os.path.isfile(path):
+            raise KeyError(where + '/' + name + ' not found in ' + filename)
+        node = load(path, mmap_mode='r+')
+        try:
+            node[rows, cols] = array
+            node.flush()
+        finally:
+            del node
+        self.statistics.record('write_window', name, array.nbytes, seconds=time() - start)
+        return
+
+    def writeNode(self, filename, where, name, array, atom):
+        start = time()
+        self.open(filename)
+        self.makeGroup(filename, where)
+        path = self.nodePath(filename, where, name)
+        # the array may be a memory map of the very same file, so the old file
+        # is replaced by a rename instead of being overwritten:
+        fp = open(path + '.tmp', 'wb')
+        try:
+            save(fp, array)
+        finally:
+            fp.close()
+        replaceFile(path + '.tmp', path)
+        self.removeAttrs(filename, where, name)
+        self._catalogue[filename][(where, name)] = (array.shape, array.dtype, 'NONE')
+        self.statistics.record('write', name, array.nbytes, array.nbytes, time() - start)
+        return array
+
+    def createNode(self, filename, where, name, atom, shape):
+        # the band is written to a temporary file, which replaces the node in finishNode:
+        self.open(filename)
+        self.makeGroup(filename, where)
+        path = self.nodePath(filename, where, name)
+        node = open_memmap(path + '.tmp', mode='w+', dtype=atom.dtype, shape=shape)
+        self._appending[(filename, where, name)] = [node, 0]
+        return node
+
+    def allocateNode(self, filename, where, name, atom, shape):
+        # creates a node of the given shape, read as zeros, to be filled by writeWindow.
+        # The file is created sparse, the band is never held in memory:
+        self.open(filename)
+        self.makeGroup(filename, where)
+        path = self.nodePath(filename, where, name)
+        node = open_memmap(path + '.tmp', mode='w+', dtype=atom.dtype, shape=shape)
+        del node
+        replaceFile(path + '.tmp', path)
+        self.removeAttrs(filename, where, name)
+        node = self.getNode(filename, where, name)
+        self._catalogue[filename][(where, name)] = (node.shape, node.dtype, 'NONE')
+        return node
+
+    def appendNode(self, filename, where, name, array):
+        start = time()
+        appending = self._appending[(filename, where, name)]
+        node, row = appending
+        node[row:row + array.shape[0]] = array
+        appending[1] = row + array.shape[0]
+        self.statistics.record('append', name, array.nbytes, seconds=time() - start)
+        return node
+
+    def finishNode(self, filename, where, name):
+        node, row = self._appending.pop((filename, where, name))
+        node.flush()
+        shape = node.shape
+        dtype = node.dtype
+        del node
+        path = self.nodePath(filename, where, name)
+        replaceFile(path + '.tmp', path)
+        self.removeAttrs(filename, where, name)
+        self._catalogue[filename][(where, name)] = (shape, dtype, 'NONE')
+        return self.getNode(filename, where, name)
+
+    def removeNode(self, filename, where, name):
+        start = time()
+        self.open(filename)
+        self._catalogue[filename].pop((where, name), None)
+        path = self.nodePath(filename, where, name)
+        if os.path.isfile(path):
+            os.remove(path)
+            self.removeAttrs(filename, where, name)
+            self.statistics.record('remove', name, seconds=time() - start)
+            return True
+        return False
+
+    def getMeta(self, filename, bandName):
+        start = time()
+        meta = self.open(filename).get(bandName)
+        self.statistics.record('meta_read', bandName, seconds=time() - start)
+        return meta
+
+    def setMeta(self, filename, bandName, nrows, ncols, count=1):
+        start = time()
+        meta = self.open(filename)
+        meta[bandName] = (nrows, ncols, count)
+        self.writeMeta(filename)
+        self.statistics.record('meta_write', bandName, seconds=time() - start)
+        return
+
+    def listMeta(self, filename):
+        return self.open(filename).keys()
+
+    def removeMeta(self, filename, bandName):
+        meta = self.open(filename)
+        if meta.pop(bandName, None) is None:
+            return False
+        self.writeMeta(filename)
+        return True
+
+    def flush(self, filename=None):
+        for key in self._meta.keys():
+            if filename is not None and key != filename:
+                continue
+            start = time()
+            self.writeMeta(key)
+            self.statistics.record('flush', os.path.basename(key), seconds=time() - start)
+        return
+
+    def close(self, filename=None):
+        for key in self._meta.keys():
+            if filename is not None and key != filename:
+                continue
+            if os.path.isdir(key):
+                self.writeMeta(key)
+            del self._meta[key]
+            self._catalogue.pop(key, None)
+            self.logger.debug('Database %s closed', os.path.basename(key))
+        return
+
+
+class L2A_BandCache(object):
+    ''' LRU cache for decoded bands, bounded by a memory budget in MB.
+        Bands are keyed on (band index, resolution). A budget of 0 disables the cache.
+    '''
+    def __init__(self, budget):
+        self._budget = int(budget) * 1024 * 1024
+        self._size = 0
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get_hits(self):
+        return self._hits
+
+    def get_misses(self):
+        return self._misses
+
+    def get_size(self):
+        return self._size
+
+    hits = property(get_hits, None, None, "hits's docstring")
+    misses = property(get_misses, None, None, "misses's docstring")
+    size = property(get_size, None, None, "size's docstring")
+
+    def get(self, key):
+        if self._budget == 0:
+            return None
+        try:
+            array = self._entries.pop(key)
+        except KeyError:
+            self._misses += 1
+            return None
+        # re-insert as most recently used:
+        self._entries[key] = array
+        self._hits += 1
+        # callers modify the bands in place, the cached array must stay untouched:
+        return array.copy()
+
+    def put(self, key, array):
+        if array.nbytes > self._budget:
+            return
+        self.remove(key)
+        while self._entries and (self._size + array.nbytes > self._budget):
+            dummy, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.nbytes
+        self._entries[key] = array.copy()
+        self._size += array.nbytes
+        return
+
+    def remove(self, key):
+        array = self._entries.pop(key, None)
+        if array is not None:
+            self._size -= array.nbytes
+        return
+
+    def invalidate(self, index):
+        # drops a band for all resolutions:
+        for key in self._entries.keys():
+            if key[0] == index:
+                self.remove(key)
+        return
+
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+        return
+
+
+class L2A_DecodeCache(object):
+    ''' On-disk cache of decoded L1C bands, shared between runs and processes.
+        Bands are keyed on the JPEG-2000 file (path, size, modification time) and a variant,
+        i.e. the decoding step and the region of interest,
+        the least recently used bands are evicted if the size exceeds the budget in MB.
+        A directory 'NONE' or a budget of 0 disables the cache.
+    '''
+    def __init__(self, directory, budget):
+        self._directory = directory
+        self._budget = int(budget) * 1024 * 1024
+        # bands being written: key -> (memory map, temporary file)
+        self._pending = {}
+        if self.enabled and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # may have been created concurrently:
+                if not os.path.isdir(directory):
+                    raise
+
+    def get_enabled(self):
+        return self._directory != 'NONE' and self._budget > 0
+
+    enabled = property(get_enabled, None, None, "enabled's docstring")
+
+    def key(self, filename, variant):
+        st = os.stat(filename)
+        ident = '%s|%d|%d|%s' % (os.path.abspath(filename), st.st_size, int(st.st_mtime), variant)
+        return hashlib.sha1(ident).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self._directory, key + '.npy')
+
+    def get(self, filename, variant):
+        if not self.enabled:
+            return None
+        path = self.path(self.key(filename, variant))
+        try:
+            array = load(path, mmap_mode='r')
+            # the modification time is the LRU order:
+            os.utime(path, None)
+            return array
+        except (IOError, OSError, ValueError):
+            return None
+
+    def create(self, filename, variant, shape, dtype):
+        # returns a memory map to be filled by the caller, the band is added to the cache by commit:
+        if not self.enabled:
+            return None
+        key = self.key(filename, variant)
+        fd, tmpFn = tempfile.mkstemp(suffix='.tmp', dir=self._directory)
+        os.close(fd)
+        array = open_memmap(tmpFn, mode='w+', dtype=dtype, shape=shape)
+        self._pending[key] = (array, tmpFn)
+        return array
+
+    def commit(self, filename, variant):
+        key = self.key(filename, variant)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        array, tmpFn = pending
+        array.flush()
+        del array
+        try:
+            os.rename(tmpFn, self.path(key))
+        except OSError:
+            # already added by a concurrent process (on Windows rename does not replace):
+            os.remove(tmpFn)
+        self.evict()
+        return
+
+    def discard(self, filename, variant):
+        pending = self._pending.pop(self.key(filename, variant), None)
+        if pending is None:
+            return
+        array, tmpFn = pending
+        del array
+        try:
+            os.remove(tmpFn)
+        except OSError:
+            pass
+        return
+
+    def put(self, filename, variant, array):
+        target = self.create(filename, variant, array.shape, array.dtype)
+        if target is None:
+            return
+        target[:] = array
+        del target
+        self.commit(filename, variant)
+        return
+
+    def evict(self):
+        entries = []
+        size = 0
+        for fn in os.listdir(self._directory):
+            if not fn.endswith('.npy'):
+                continue
+            try:
+                st = os.stat(os.path.join(self._directory, fn))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+            size += st.st_size
+        entries.sort()
+        for mtime, fsize, fn in entries:
+            if size <= self._budget:
+                break
+            try:
+                os.remove(os.path.join(self._directory, fn))
+            except OSError:
+                # removed by a concurrent process:
+                pass
+            size -= fsize
+        return
+
+
+class L2A_AuxCache(object):
+    ''' On-disk cache of the prepared DEM, slope and aspect of a tile, shared between runs and processes.
+        These do not depend on the acquisition. Entries are keyed on the tile, the resolution and
+        an identification of the target grid and the DEM source, and stored as compressed npz archives.
+        A directory 'NONE' disables the cache.
+    '''
+    def __init__(self, directory):
+        self._directory = directory
+        if self.enabled and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # may have been created concurrently:
+                if not os.path.isdir(directory):
+                    raise
+
+    def get_enabled(self):
+        return self._directory != 'NONE'
+
+    enabled = property(get_enabled, None, None, "enabled's docstring")
+
+    def path(self, tileId, resolution, ident):
+        digest = hashlib.sha1(ident).hexdigest()[:16]
+        return os.path.join(self._directory, '%s_%dm_%s.npz' % (tileId, resolution, digest))
+
+    def get(self, tileId, resolution, ident, shape=None):
+        # returns a dictionary of the cached arrays, or None.
+        # An entry with 2-D arrays of another shape than the given one is ignored:
+        if not self.enabled:
+            return None
+        try:
+            with load(self.path(tileId, resolution, ident)) as npz:
+                arrays = dict((name, npz[name]) for name in npz.files)
+        except Exception:
+            # not present, or incomplete:
+            return None
+        if shape is not None:
+            for value in arrays.values():
+                if (value.ndim == 2) and (value.shape != tuple(shape)):
+                    return None
+        return arrays
+
+    def put(self, tileId, resolution, ident, arrays):
+        if not self.enabled:
+            return
+        path = self.path(tileId, resolution, ident)
+        fd, tmpFn = tempfile.mkstemp(suffix='.tmp', dir=self._directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                savez_compressed(f, **arrays)
+            os.rename(tmpFn, path)
+        except Exception:
+            # no partial entry is left behind, e.g. with the disk full:
+            try:
+                os.remove(tmpFn)
+            except OSError:
+                pass
+            # already added by a concurrent process (on Windows rename does not replace):
+            if not os.path.isfile(path):
+                raise
+        return
@@ -13,6 +13,7 @@ from time import time, strftime
 from datetime import datetime
 from multiprocessing import Lock
 from shutil import copyfile, copytree
+from copy import deepcopy
 from psutil import cpu_count
 from L2A_ProcessDataStrip import L2A_ProcessDataStrip
 
@@ -217,14 +218,27 @@ class L2A_Config(object):
             self._manifestScheme = None
             self._satelliteId = 'S2A'
             self._demOutput = False
+            self._demShadeSunAngles = 'MEAN'
             self._tciOutput = False
             self._ddvOutput = False
             self._downsample20to60 = True
             self._processingStartTimestamp = datetime.utcnow()
             self._AC_Min_Ddv_Area = None
             self._demType = 'NONE'
-            self._stat = {'read':{},'write':{}}
+            self._stat = None
             self._db_compression_level = 0
+            self._db_compression_codec = 'ZLIB'
+            self._db_chunk_size = 0
+            self._db_backend = 'HDF5'
+            self._band_cache_size = 0
+            self._decode_cache_dir = 'NONE'
+            self._decode_cache_size = 0
+            self._aux_cache_dir = 'NONE'
+            self._roi = 'NONE'
+            self._roiWindow = None
+            self._roiGridRows = None
+            self._nrDecodeThreads = 1
+            self._reducedResolutionDecoding = False
             self._UP_INDEX_HTML = None
             self._INSPIRE_XML = None
 
@@ -588,6 +602,15 @@ class L2A_Config(object):
     def del_dem_output(self):
         del self._demOutput
 
+    def get_dem_shade_sun_angles(self):
+        return self._demShadeSunAngles
+
+    def set_dem_shade_sun_angles(self, value):
+        self._demShadeSunAngles = value
+
+    def del_dem_shade_sun_angles(self):
+        del self._demShadeSunAngles
+
     def get_tci_output(self):
         return self._tciOutput
 
@@ -654,6 +677,78 @@ class L2A_Config(object):
     def del_db_compression_level(self):
         del self._db_compression_level
 
+    def get_db_compression_codec(self):
+        return self._db_compression_codec
+
+    def set_db_compression_codec(self, value):
+        self._db_compression_codec = value
+
+    def del_db_compression_codec(self):
+        del self._db_compression_codec
+
+    def get_db_chunk_size(self):
+        return self._db_chunk_size
+
+    def set_db_chunk_size(self, value):
+        self._db_chunk_size = value
+
+    def del_db_chunk_size(self):
+        del self._db_chunk_size
+
+    def get_db_backend(self):
+        return self._db_backend
+
+    def set_db_backend(self, value):
+        self._db_backend = value
+
+    def del_db_backend(self):
+        del self._db_backend
+
+    def get_band_cache_size(self):
+        return self._band_cache_size
+
+    def set_band_cache_size(self, value):
+        self._band_cache_size = value
+
+    def del_band_cache_size(self):
+        del self._band_cache_size
+
+    def get_decode_cache_dir(self):
+        return self._decode_cache_dir
+
+    def set_decode_cache_dir(self, value):
+        self._decode_cache_dir = value
+
+    def del_decode_cache_dir(self):
+        del self._decode_cache_dir
+
+    def get_decode_cache_size(self):
+        return self._decode_cache_size
+
+    def set_decode_cache_size(self, value):
+        self._decode_cache_size = value
+
+    def del_decode_cache_size(self):
+        del self._decode_cache_size
+
+    def get_aux_cache_dir(self):
+        return self._aux_cache_dir
+
+    def set_aux_cache_dir(self, value):
+        self._aux_cache_dir = value
+
+    def del_aux_cache_dir(self):
+        del self._aux_cache_dir
+
+    def get_roi(self):
+        return self._roi
+
+    def set_roi(self, value):
+        self._roi = value
+
+    def del_roi(self):
+        del self._roi
+
     # fix for SIIMPC-552, UMW - making option configurable:
     def get_scaling_disabler(self):
         return self._scaling_disabler
@@ -992,6 +1087,29 @@ class L2A_Config(object):
     def del_nr_threads(self):
         del self._nrThreads
 
+    def get_nr_decode_threads(self):
+        nrDecodeThreads = self._nrDecodeThreads
+        if nrDecodeThreads == 'AUTO':
+            self._nrDecodeThreads = cpu_count()
+        else:
+            self._nrDecodeThreads = int(nrDecodeThreads)
+        return self._nrDecodeThreads
+
+    def set_nr_decode_threads(self, value):
+        self._nrDecodeThreads = value
+
+    def del_nr_decode_threads(self):
+        del self._nrDecodeThreads
+
+    def get_reduced_resolution_decoding(self):
+        return self._reducedResolutionDecoding
+
+    def set_reduced_resolution_decoding(self, value):
+        self._reducedResolutionDecoding = value
+
+    def del_reduced_resolution_decoding(self):
+        del self._reducedResolutionDecoding
+
     def get_t_start(self):
         return self._tStart
 
@@ -2854,6 +2972,7 @@ class L2A_Config(object):
     dem_terrain_correction = property(get_dem_terrain_correction, set_dem_terrain_correction, del_dem_terrain_correction,
                                       "dem_terrain_correction's docstring")
     demOutput = property(get_dem_output, set_dem_output, del_dem_output, "dem_output's docstring")
+    demShadeSunAngles = property(get_dem_shade_sun_angles, set_dem_shade_sun_angles, del_dem_shade_sun_angles, "demShadeSunAngles's docstring")
     tciOutput = property(get_tci_output, set_tci_output, del_tci_output, "tci_output's docstring")
     ddvOutput = property(get_ddv_output, set_ddv_output, del_ddv_output, "ddv_output's docstring")
     downsample20to60 = property(get_downsample_20to60, set_downsample_20to60, del_downsample_20to60, "downsample_20to60's docstring")
@@ -3054,6 +3173,9 @@ class L2A_Config(object):
     TESTMODE = property(get_testmode, set_testmode, del_testmode, "TESTMODE's docstring")
     nrTiles = property(get_nr_tiles, set_nr_tiles, del_nr_tiles, "nrTiles's docstring")
     nrThreads = property(get_nr_threads, set_nr_threads, del_nr_threads, "nrThreads's docstring")
+    nrDecodeThreads = property(get_nr_decode_threads, set_nr_decode_threads, del_nr_decode_threads, "nrDecodeThreads's docstring")
+    reducedResolutionDecoding = property(get_reduced_resolution_decoding, set_reduced_resolution_decoding,
+                                         del_reduced_resolution_decoding, "reducedResolutionDecoding's docstring")
     processingStatusFn = property(get_processing_status_fn, set_processing_status_fn, del_processing_status_fn,
                                   "processingStatusFn's docstring")
     processingEstimationFn = property(get_processing_estimation_fn, set_processing_estimation_fn,
@@ -3075,6 +3197,14 @@ class L2A_Config(object):
     min_sc_blu = property(get_min_sc_blu, set_min_sc_blu, del_min_sc_blu, "min_sc_blu's docstring")
     max_sc_blu = property(get_max_sc_blu, set_max_sc_blu, del_max_sc_blu, "max_sc_blu's docstring")
     db_compression_level = property(get_db_compression_level, set_db_compression_level, del_db_compression_level, "db_compression_level's docstring")
+    db_compression_codec = property(get_db_compression_codec, set_db_compression_codec, del_db_compression_codec, "db_compression_codec's docstring")
+    db_chunk_size = property(get_db_chunk_size, set_db_chunk_size, del_db_chunk_size, "db_chunk_size's docstring")
+    db_backend = property(get_db_backend, set_db_backend, del_db_backend, "db_backend's docstring")
+    band_cache_size = property(get_band_cache_size, set_band_cache_size, del_band_cache_size, "band_cache_size's docstring")
+    decode_cache_dir = property(get_decode_cache_dir, set_decode_cache_dir, del_decode_cache_dir, "decode_cache_dir's docstring")
+    decode_cache_size = property(get_decode_cache_size, set_decode_cache_size, del_decode_cache_size, "decode_cache_size's docstring")
+    aux_cache_dir = property(get_aux_cache_dir, set_aux_cache_dir, del_aux_cache_dir, "aux_cache_dir's docstring")
+    roi = property(get_roi, set_roi, del_roi, "roi's docstring")
     namingConvention = property(get_naming_convention, set_naming_convention, del_naming_convention,
                                 "naming_convention's docstring")
     datatakeSensingTime = property(get_datatake_sensing_time, set_datatake_sensing_time, del_datatake_sensing_time,
@@ -4507,6 +4637,36 @@ class L2A_Config(object):
         if par is None: self.parNotFound(par)
         self.nrThreads = par.pyval
 
+        par = node.Nr_Decode_Threads
+        if par is None: self.parNotFound(par)
+        self.nrDecodeThreads = par.pyval
+
+        par = node.Reduced_Resolution_Decoding
+        if par is None:
+            self.parNotFound(par)
+        elif par == 'TRUE':
+            self.reducedResolutionDecoding = True
+        else:
+            self.reducedResolutionDecoding = False
+
+        par = node.Band_Cache_Size
+        if par is None: self.parNotFound(par)
+        self.band_cache_size = int32(par.pyval)
+
+        par = node.Decode_Cache_Directory
+        if par is None: self.parNotFound(par)
+        self.decode_cache_dir = par.text
+
+        par = node.Decode_Cache_Size
+        if par is None: self.parNotFound(par)
+        self.decode_cache_size = int32(par.pyval)
+
+        par = node.Region_Of_Interest
+        if par is None: self.parNotFound(par)
+        # the command line argument has precedence:
+        if self.roi == 'NONE':
+            self.roi = par.text.strip()
+
         par = node.DEM_Directory
         if par is None: self.parNotFound(par)
         self.demDirectory = par.text
@@ -4515,6 +4675,14 @@ class L2A_Config(object):
         if par is None: self.parNotFound(par)
         self.demReference = par.text
 
+        par = node.Aux_Cache_Directory
+        if par is None: self.parNotFound(par)
+        self.aux_cache_dir = par.text
+
+        par = node.DEM_Shade_Sun_Angles
+        if par is None: self.parNotFound(par)
+        self.demShadeSunAngles = par.text
+
         par = node.Generate_DEM_Output
         if par is None:
             self.parNotFound(par)
@@ -4647,6 +4815,18 @@ class L2A_Config(object):
         if par is None: self.parNotFound(par)
         self.db_compression_level = int32(par.pyval)
 
+        par = node.Database_Compression_Codec
+        if par is None: self.parNotFound(par)
+        self.db_compression_codec = par.text
+
+        par = node.Database_Chunk_Size
+        if par is None: self.parNotFound(par)
+        self.db_chunk_size = int32(par.pyval)
+
+        par = node.Database_Backend
+        if par is None: self.parNotFound(par)
+        self.db_backend = par.text
+
         return True
 
 
@@ -4688,7 +4868,13 @@ class L2A_Config(object):
 
         if (nrows is None or ncols is None):
             self.logger.fatal('no image dimension in metadata specified, please correct')
-        if (nrows < ncols):
+        if not self.setRoiWindow(imgSizeList, nrows, ncols):
+            return False
+        if self._roiWindow is not None:
+            # only the part of the angle grids covering the ROI is kept:
+            saa, sza = self.getRoiAngles(ang, solaz_arr, solze_arr)
+            nrows, ncols = self.getRoiWindow(nrows)[2:]
+        elif (nrows < ncols):
             last_row = int(solaz_arr[0].size * float(nrows) / float(ncols) + 0.5)
             saa = solaz_arr[0:last_row, :]
             sza = solze_arr[0:last_row, :]
@@ -4776,7 +4962,149 @@ class L2A_Config(object):
         if _max > 12.0: _max = 12.0
         vza_arr = array([_min, _min, _max, _max])
         self.vza_arr = vza_arr.reshape(2, 2)
-        return
+        return True
+
+    def setRoiWindow(self, tg, nrows, ncols):
+        ''' converts the region of interest into a window of the 60 m grid of the tile.
+
+            The ROI is either given as pixel window of the 10 m grid:
+                PIXEL <first row> <first column> <number of rows> <number of columns>
+            or as geographic bounding box in degrees:
+                LONLAT <min. longitude> <min. latitude> <max. longitude> <max. latitude>
+            The window is extended to full 60 m pixels, so that all resolutions are aligned,
+            and clipped to the tile. NONE processes the whole tile.
+        '''
+        self._roiWindow = None
+        roi = self.roi.replace(',', ' ').split()
+        if (len(roi) == 0) or (roi[0].upper() == 'NONE'):
+            return True
+        if self.TESTMODE:
+            self.logger.warning('region of interest is ignored in TESTMODE')
+            return True
+        gridRows = nrows * self._resolution // 60
+        gridCols = ncols * self._resolution // 60
+        try:
+            kind = roi[0].upper()
+            values = [float64(v) for v in roi[1:]]
+            if len(values) != 4:
+                raise ValueError('four values expected')
+            if kind == 'PIXEL':
+                row, col, rows, cols = values
+                top, left, bottom, right = row / 6.0, col / 6.0, (row + rows) / 6.0, (col + cols) / 6.0
+            elif kind == 'LONLAT':
+                lonMin, latMin, lonMax, latMax = values
+                zone = tg.HORIZONTAL_CS_NAME.text.split()[4]
+                zone1 = int(zone[:-1])
+                zone2 = zone[-1:].upper()
+                idx = getResolutionIndex(60)
+                ulx = float64(tg.Geoposition[idx].ULX)
+                uly = float64(tg.Geoposition[idx].ULY)
+                # all four corners, as the box is not rectangular in UTM:
+                xy = array([transform_wgs84_to_utm_zone(lon, lat, zone1, zone2)[:2]
+                            for lon in [lonMin, lonMax] for lat in [latMin, latMax]])
+                left = (xy[:, 0].min() - ulx) / 60.0
+                right = (xy[:, 0].max() - ulx) / 60.0
+                top = (uly - xy[:, 1].max()) / 60.0
+                bottom = (uly - xy[:, 1].min()) / 60.0
+            else:
+                raise ValueError('unknown type ' + roi[0])
+        except Exception as e:
+            self.logger.fatal('invalid region of interest "%s": %s' % (self.roi, e))
+            return False
+
+        top = max(int(floor(top)), 0)
+        left = max(int(floor(left)), 0)
+        bottom = min(int(ceil(bottom)), gridRows)
+        right = min(int(ceil(right)), gridCols)
+        if (bottom <= top) or (right <= left):
+            self.logger.fatal('region of interest "%s" is outside of the tile' % self.roi)
+            return False
+        self._roiWindow = (top, left, bottom - top, right - left)
+        self._roiGridRows = gridRows
+        self.logger.info('region of interest: rows %d - %d, columns %d - %d of the 60 m grid' %
+                         (top, bottom - 1, left, right - 1))
+        return True
+
+    def getRoiWindow(self, nrows):
+        # returns the ROI as (first row, first column, rows, columns) on a tile grid
+        # of nrows rows, or None if the whole tile is processed:
+        if self._roiWindow is None:
+            return None
+        factor = nrows // self._roiGridRows
+        return tuple([v * factor for v in self._roiWindow])
+
+    def getRoiAngles(self, ang, solaz_arr, solze_arr):
+        # cuts the sun angle grids to the nodes enclosing the ROI:
+        try:
+            step = float64(ang.Sun_Angles_Grid.Zenith.ROW_STEP.text)
+        except:
+            step = 5000.0
+        row, col, rows, cols = [v * 60.0 for v in self._roiWindow]
+        r0 = int(row // step)
+        c0 = int(col // step)
+        r1 = int(ceil((row + rows) / step)) + 1
+        c1 = int(ceil((col + cols) / step)) + 1
+        # missing angles are set to 0 instead of a grid:
+        if isinstance(solaz_arr, ndarray):
+            solaz_arr = solaz_arr[r0:r1, c0:c1]
+        if isinstance(solze_arr, ndarray):
+            solze_arr = solze_arr[r0:r1, c0:c1]
+        return solaz_arr, solze_arr
+
+    def getSunGridGeometry(self):
+        # step of the sun angle grids in m and the offset of the processed area to their first node:
+        xp = L2A_XmlParser(self, 'T2A')
+        ang = xp.getTree('Geometric_Info', 'Tile_Angles')
+        try:
+            step = float64(ang.Sun_Angles_Grid.Zenith.ROW_STEP.text)
+        except:
+            step = 5000.0
+        if self._roiWindow is None:
+            return step, 0.0, 0.0
+        # the grids are cut by getRoiAngles:
+        row, col = [v * 60.0 for v in self._roiWindow[:2]]
+        return step, row % step, col % step
+
+    def getGeoTransformation(self, tg, resolution):
+        # geotransformation of the processed area, the whole tile or the ROI:
+        idx = getResolutionIndex(resolution)
+        ulx = tg.Geoposition[idx].ULX
+        uly = tg.Geoposition[idx].ULY
+        res = float32(resolution)
+        if self._roiWindow is not None:
+            ulx = ulx + self._roiWindow[1] * 60
+            uly = uly - self._roiWindow[0] * 60
+        return [ulx, res, 0.0, uly, 0.0, -res]
+
+    def getRoiGeobox(self, geobox, nrows, ncols):
+        # returns a copy of the GeoJP2 box of the tile, georeferenced to the ROI
+        # covered by an image of nrows x ncols pixels:
+        if (self._roiWindow is None) or (geobox is None):
+            return geobox
+        geobox = deepcopy(geobox)
+        row, col, rows, cols = self._roiWindow
+        for box in geobox.box:
+            if box.longname != 'Association':
+                continue
+            for subBox in box.box:
+                if subBox.longname != 'XML':
+                    continue
+                vectors = []
+                for node in subBox.xml.getroot().iter():
+                    if not isinstance(node.tag, basestring):
+                        continue
+                    name = etree.QName(node).localname
+                    if name == 'high':
+                        node.text = '%d %d' % (ncols - 1, nrows - 1)
+                    elif (name == 'pos') and ('origin' in [etree.QName(p).localname for p in node.iterancestors()]):
+                        x, y = [float64(v) for v in node.text.split()]
+                        node.text = '%s %s' % (repr(x + col * 60.0), repr(y - row * 60.0))
+                    elif name == 'offsetVector':
+                        vectors.append(node)
+                if len(vectors) == 2:
+                    vectors[0].text = '%s 0.0' % repr(cols * 60.0 / ncols)
+                    vectors[1].text = '0.0 %s' % repr(-rows * 60.0 / nrows)
+        return geobox
 
     def _get_subNodes(self, node, valtype):
         count = int(node.attrib['count'])
@@ -5030,11 +5358,7 @@ class L2A_Config(object):
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
         nrows = self.nrows
         ncols = self.ncols
-        idx = getResolutionIndex(self.resolution)
-        ulx = tg.Geoposition[idx].ULX
-        uly = tg.Geoposition[idx].ULY
-        res = float32(self.resolution)
-        geoTransformation = [ulx, res, 0.0, uly, 0.0, -res]
+        geoTransformation = self.getGeoTransformation(tg, self.resolution)
         extent = GetExtent(geoTransformation, ncols, nrows)
         xy = asarray(extent)
         hcsName = tg.HORIZONTAL_CS_NAME.text
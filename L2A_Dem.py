@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+'''
+sen2cor-dem: prefetch of the SRTM DEM into the DEM directory, for a list of
+Sentinel-2 tiles or a bounding box, and creation of one VRT mosaic over all
+DEM tiles of the directory. The processor reads the footprint of a tile from
+this VRT, instead of mosaicking the SRTM tiles for each run.
+
+usage: python L2A_Dem.py DEM_DIR --reference URL --tiles T32TNR T33TTG
+       python L2A_Dem.py DEM_DIR --reference URL --bbox 9.0 45.0 12.0 47.0
+       python L2A_Dem.py DEM_DIR --vrt_only
+'''
+import os, sys, logging, fnmatch, shutil, tempfile, urllib, zipfile
+from L2A_Library import *
+
+# VRT mosaic of the SRTM tiles in the DEM directory:
+SRTM_VRT = 'srtm.vrt'
+# extent of a Sentinel-2 tile in m:
+TILE_EXTENT = 109800.0
+# margin in degrees around a tile footprint:
+MARGIN = 0.05
+
+LAT_BANDS = 'CDEFGHJKLMNPQRSTUVWX'
+# MGRS 100 km square letters, the column sets repeat every 3 zones:
+MGRS_COLUMNS = ['STUVWXYZ', 'ABCDEFGH', 'JKLMNPQR']
+MGRS_ROWS = 'ABCDEFGHJKLMNPQRSTUV'
+# northing of the southern edge of the latitude bands, rounded down to 100 km:
+MIN_NORTHING = {'C': 1100000, 'D': 2000000, 'E': 2800000, 'F': 3700000, 'G': 4600000,
+                'H': 5500000, 'J': 6400000, 'K': 7300000, 'L': 8200000, 'M': 9100000,
+                'N': 0, 'P': 800000, 'Q': 1700000, 'R': 2600000, 'S': 3500000,
+                'T': 4400000, 'U': 5300000, 'V': 6200000, 'W': 7000000, 'X': 7900000}
+
+
+def srtmTileIds(lonMin, latMin, lonMax, latMax):
+    ''' Column and row of the 5 x 5 degree SRTM tiles covering a bounding box in degrees.
+        A box crossing the International Date Line has lonMin > lonMax.
+        Only latitudes between -60 and 60 degrees are covered.
+    '''
+    # fix for SIIMPC-611, UMW:
+    lonMinId = min(max(int((-180-lonMin)/(-360)*72+1), 1), 72)
+    lonMaxId = min(max(int((-180-lonMax)/(-360)*72+1), 1), 72)
+    latMinId = max(int((60-latMax)/(120)*24+1), 1) # this is inverted by intention
+    latMaxId = min(int((60-latMin)/(120)*24+1), 24) # this is inverted by intention
+    # end fix SIIMPC-611
+    if lonMinId <= lonMaxId:
+        lons = range(lonMinId, lonMaxId+1)
+    else:
+        lons = range(lonMinId, 73) + range(1, lonMaxId+1)
+    return [(i, j) for i in lons for j in range(latMinId, latMaxId+1)]
+
+
+def srtmTileName(i, j):
+    return 'srtm_{:0>2d}_{:0>2d}.tif'.format(i, j)
+
+
+def mgrsBounds(tileId):
+    ''' Bounding box in degrees (lonMin, latMin, lonMax, latMax) of a Sentinel-2 tile,
+        e.g. T32TNR, extended by MARGIN. lonMin > lonMax at the International Date Line.
+    '''
+    tileId = tileId.upper()
+    if tileId.startswith('T') and len(tileId) == 6:
+        tileId = tileId[1:]
+    zone = int(tileId[:2])
+    band = tileId[2]
+    easting = (MGRS_COLUMNS[zone % 3].index(tileId[3]) + 1) * 100000.0
+    # the row letters of even zones are shifted by 5:
+    northing = ((MGRS_ROWS.index(tileId[4]) - (5 if zone % 2 == 0 else 0)) % 20) * 100000.0
+    while northing < MIN_NORTHING[band]:
+        northing += 2000000.0
+    hemisphere = 'N' if band >= 'N' else 'S'
+    # the tile extends from the north edge of the 100 km square to the east and south:
+    top = northing + 100000.0
+    corners = [transform_utm_to_wgs84(x, y, zone, hemisphere)[:2]
+               for x in [easting, easting + TILE_EXTENT] for y in [top - TILE_EXTENT, top]]
+    lons = [c[0] for c in corners]
+    lats = [c[1] for c in corners]
+    lonMin = min(lons) - MARGIN
+    lonMax = max(lons) + MARGIN
+    if max(lons) - min(lons) > 180.0:
+        # crossing the International Date Line:
+        lonMin = min([lon for lon in lons if lon > 0]) - MARGIN
+        lonMax = max([lon for lon in lons if lon < 0]) + MARGIN
+    return lonMin, min(lats) - MARGIN, lonMax, max(lats) + MARGIN
+
+
+def fetchSrtm(reference, demDir, tifFn, tmpDir, logger):
+    ''' Makes the SRTM tile tifFn available in the DEM directory, downloads it from reference if missing.
+        The DEM directory is shared with concurrent processes and runs, the tile is locked while it is
+        checked and fetched. It is prepared in tmpDir and renamed, so it never appears incomplete.
+        Returns False if the tile is not available.
+    '''
+    with FileLock(os.path.join(demDir, tifFn + '.lock')):
+        if os.path.isfile(os.path.join(demDir, tifFn)):
+            logger.info('Dem exists: %s', tifFn)
+            return True
+
+        zipFn = tifFn[:-4] + '.zip'
+        localFn = os.path.join(tmpDir, zipFn)
+        try:
+            # zipfile needs to be downloaded ...
+            logger.info('Trying to retrieve DEM from URL: %s', reference)
+            webFile = urllib.urlopen(reference + zipFn)
+            localFile = open(localFn, 'wb')
+            localFile.write(webFile.read())
+            webFile.close()
+            localFile.close()
+            logger.info('zipfile downloaded: %s', zipFn)
+        except Exception as e:
+            logger.error(e)
+            logger.error('Download error %s, flat surface will be used', zipFn)
+            return False
+        try:
+            zipf = zipfile.ZipFile(localFn, mode='r')
+        except Exception as e:
+            logger.error(e)
+            logger.error('DEM not available, flat surface will be used')
+            try:
+                os.remove(localFn)
+            except:
+                pass
+            return False
+        try:
+            corrupt = zipf.testzip() != None
+        except Exception:
+            # e.g. a damaged deflate stream:
+            corrupt = True
+        if corrupt:
+            logger.error('DEM archive corrupt: %s, flat surface will be used', zipFn)
+            zipf.close()
+            os.remove(localFn)
+            return False
+        partFn = os.path.join(demDir, tifFn + '.part')
+        try:
+            zipf.extract(tifFn, tmpDir)
+            zipf.close()
+            os.remove(localFn)
+            logger.info('zipfile removed: %s', localFn)
+            # fix for SIIMPC-577, UMW:
+            SIIMPC_577(os.path.join(tmpDir, tifFn), logger)
+            # end fix for SIIMPC-577
+            shutil.move(os.path.join(tmpDir, tifFn), partFn)
+            os.rename(partFn, os.path.join(demDir, tifFn))
+            logger.info('DEM unpacked and moved: %s', tifFn)
+        except Exception as e:
+            logger.error(e)
+            logger.error('Extraction error for DEM: %s', localFn)
+            zipf.close()
+            # nothing of the failed tile is left behind:
+            for fn in [localFn, os.path.join(tmpDir, tifFn), partFn]:
+                try:
+                    os.remove(fn)
+                except:
+                    pass
+            return False
+    return True
+
+
+def SIIMPC_577(filename, logger):
+    # fix for SIIMPC-577, UMW:
+    dataset = gdal.Open(filename, gdal.GA_Update)
+    if dataset is None:
+        return False
+
+    # display current
+    logger.info('Driver: %s / %s' % (dataset.GetDriver().ShortName, dataset.GetDriver().LongName))
+    logger.info('Size is: %d x %d x %d' % (dataset.RasterXSize, dataset.RasterYSize, dataset.RasterCount))
+    logger.info('Projection is: %s' % dataset.GetProjection())
+    geotransform = dataset.GetGeoTransform()
+    logger.info('Origin = (%f, %f)' % (geotransform[0], geotransform[3]))
+    logger.info('Pixel Size = (%f, %f)' % (geotransform[1], geotransform[5]))
+    dataset.SetGeoTransform(
+        [geotransform[0] - geotransform[1] / 2, geotransform[1], geotransform[2],
+         geotransform[3] + geotransform[5] / 2, geotransform[4], geotransform[5]])
+
+    geotransform = dataset.GetGeoTransform()
+    logger.info('Origin = (%f, %f)' % (geotransform[0], geotransform[3]))
+    logger.info('Pixel Size = (%f, %f)' % (geotransform[1], geotransform[5]))
+    dataset = None
+
+    return True
+
+
+def buildVrt(demDir, logger):
+    ''' Creates the VRT mosaic over all SRTM tiles of the DEM directory, replacing an existing one.
+        The VRT is written to a temporary file and renamed, for processes reading it concurrently.
+    '''
+    tifFns = sorted([os.path.join(demDir, fn) for fn in os.listdir(demDir) if fnmatch.fnmatch(fn, 'srtm_??_??.tif')])
+    if not tifFns:
+        logger.error('no SRTM tiles in %s, no VRT created', demDir)
+        return False
+    vrtFn = os.path.join(demDir, SRTM_VRT)
+    tmpFn = vrtFn + '.part'
+    try:
+        vrt = gdal.BuildVRT(tmpFn, tifFns)
+        vrt = None
+        if os.name == 'nt' and os.path.exists(vrtFn):
+            # rename does not replace on Windows:
+            os.remove(vrtFn)
+        os.rename(tmpFn, vrtFn)
+    except Exception as e:
+        logger.error(e)
+        logger.error('cannot create VRT %s', vrtFn)
+        return False
+    logger.info('VRT over %d SRTM tiles created: %s', len(tifFns), vrtFn)
+    return True
+
+
+def vrtCovers(vrtFn, tifFns):
+    ''' True if the VRT exists and contains all the given DEM tiles. '''
+    if not os.path.isfile(vrtFn):
+        return False
+    try:
+        vrt = gdal.Open(vrtFn, GA_ReadOnly)
+        files = set([os.path.normcase(os.path.abspath(fn)) for fn in vrt.GetFileList()])
+        vrt = None
+    except Exception:
+        return False
+    for fn in tifFns:
+        if os.path.normcase(os.path.abspath(fn)) not in files:
+            return False
+    return True
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='sen2cor-dem: prefetch of the SRTM DEM into the DEM directory '
+                                     'and creation of the VRT mosaic read by the processor.')
+    parser.add_argument('dem_dir', help='DEM directory, as DEM_Directory of the GIPP')
+    parser.add_argument('--reference', help='URL of the SRTM tiles, as DEM_Reference of the GIPP')
+    parser.add_argument('--tiles', nargs='+', default=[], help='Sentinel-2 tiles, e.g. T32TNR T33TTG')
+    parser.add_argument('--tile_file', help='Text file with one Sentinel-2 tile per line')
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('LON_MIN', 'LAT_MIN', 'LON_MAX', 'LAT_MAX'),
+                        help='Bounding box in degrees')
+    parser.add_argument('--vrt_only', action='store_true', help='Creates only the VRT over the DEM tiles present')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    logger = logging.getLogger('sen2cor.dem')
+
+    demDir = os.path.abspath(args.dem_dir)
+    if not os.path.isdir(demDir):
+        os.makedirs(demDir)
+
+    if not args.vrt_only:
+        tiles = list(args.tiles)
+        if args.tile_file:
+            with open(args.tile_file) as f:
+                tiles += [line.strip() for line in f if line.strip()]
+        boxes = [mgrsBounds(tile) for tile in tiles]
+        if args.bbox:
+            boxes.append(tuple(args.bbox))
+        if not boxes:
+            parser.error('no tiles or bounding box given')
+        if not args.reference:
+            parser.error('the reference URL is needed for the download')
+
+        ids = set()
+        for box in boxes:
+            ids.update(srtmTileIds(*box))
+        logger.info('%d SRTM tiles needed', len(ids))
+        tmpDir = tempfile.mkdtemp()
+        failed = 0
+        try:
+            for i, j in sorted(ids):
+                if not fetchSrtm(args.reference, demDir, srtmTileName(i, j), tmpDir, logger):
+                    failed += 1
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+        if failed:
+            logger.warning('%d SRTM tiles not available, e.g. over sea', failed)
+
+    if not buildVrt(demDir, logger):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -166,6 +166,20 @@ def transform_wgs84_to_utm(lon, lat):
     return wgs84_to_utm_geo_transform.TransformPoint(lon, lat, 0)  # returns easting, northing, altitude
 
 
+def transform_wgs84_to_utm_zone(lon, lat, zone1, zone2):
+    # as transform_wgs84_to_utm, but into the given zone, e.g. the zone of a tile:
+    utm_coordinate_system = osr.SpatialReference()
+    utm_coordinate_system.SetWellKnownGeogCS("WGS84")  # Set geographic coordinate system to handle lat/lon
+    if (zone2 == 'N'):  # N is Northern Hemisphere
+        utm_coordinate_system.SetUTM(zone1, 1)
+    else:
+        utm_coordinate_system.SetUTM(zone1, 0)
+    wgs84_coordinate_system = utm_coordinate_system.CloneGeogCS()  # Clone ONLY the geographic coordinate system
+    # create transform component
+    wgs84_to_utm_geo_transform = osr.CoordinateTransformation(wgs84_coordinate_system, utm_coordinate_system)
+    return wgs84_to_utm_geo_transform.TransformPoint(lon, lat, 0)  # returns easting, northing, altitude
+
+
 def get_utm_zone(longitude):
     return (int(1 + (longitude + 180.0) / 6.0))
 
@@ -192,3 +206,67 @@ def getDayOfYear(dateStr):
     doy = datetime.strptime(dateStr, '%Y-%m-%dT%H:%M:%S.%fZ').timetuple().tm_yday
     year = datetime.strptime(dateStr, '%Y-%m-%dT%H:%M:%S.%fZ').timetuple().tm_year
     return doy, isleap(year)
+
+
+class FileLock(object):
+    ''' Exclusive lock on a lock file, for resources shared between processes and independent runs,
+        e.g. the DEM directory. Usage: with FileLock(filename): ...
+        The lock file is removed on release.
+    '''
+    def __init__(self, filename):
+        self._filename = filename
+        self._fd = None
+
+    def acquire(self):
+        while True:
+            self._fd = os.open(self._filename, os.O_RDWR | os.O_CREAT)
+            if os.name == 'nt':
+                import msvcrt
+                while True:
+                    try:
+                        # blocks for 10 seconds, then raises:
+                        msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except IOError:
+                        pass
+                # an open lock file cannot be removed on Windows, it is still the current one:
+                return
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            # the previous holder may have removed the lock file while this process was waiting:
+            try:
+                if os.fstat(self._fd).st_ino == os.stat(self._filename).st_ino:
+                    return
+            except OSError:
+                pass
+            os.close(self._fd)
+
+    def release(self):
+        if os.name == 'nt':
+            import msvcrt
+            os.lseek(self._fd, 0, 0)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            os.close(self._fd)
+            try:
+                os.remove(self._filename)
+            except OSError:
+                # still open by a waiting process, which removes it later:
+                pass
+        else:
+            import fcntl
+            # removed while still locked, a waiting process then retries on a new lock file:
+            try:
+                os.remove(self._filename)
+            except OSError:
+                pass
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
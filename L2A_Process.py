@@ -300,6 +300,9 @@ def parseCommandLine(args):
     else:
         config.resolution = args.resolution
 
+    if args.roi:
+        config.roi = args.roi
+
     config.scOnly  = args.sc_only
     config.crOnly  = args.cr_only
     config.raw     = args.raw
@@ -355,6 +358,8 @@ def main(args=None):
     parser.add_argument('--sc_only', action='store_true', help='Performs only the scene classification at 60 or 20m resolution')
     parser.add_argument('--cr_only', action='store_true', help='Performs only the creation of the L2A product tree, no processing')
     parser.add_argument('--debug', action='store_true', help='Performs in debug mode')
+    parser.add_argument('--roi', help='Processes only a region of interest, given as "PIXEL row col nrows ncols" of the 10m grid '
+                                      'or as "LONLAT lon_min lat_min lon_max lat_max", overrides Region_Of_Interest of the GIPP')
     #parser.add_argument('--profile', action='store_true', help='Profiles the processor\'s performance')
     parser.add_argument('--GIP_L2A', help='Select the user GIPP')
     parser.add_argument('--GIP_L2A_SC', help='Select the scene classification GIPP')
@@ -504,11 +509,17 @@ def main(args=None):
                     result = FAILURE
 
                 # final cleanup in Toolbox mode:
-                import glob
+                import glob, shutil
                 try:
-                    files = glob.glob(os.path.join(config.L2A_UP_DIR, 'GRANULE', 'L2A_*', '*.h5'))
-                    for f in files:
-                        os.remove(f)
+                    # the scratch databases are HDF5 files or, for the NPY backend, directories,
+                    # the stage manifest is meaningless without them:
+                    granules = os.path.join(config.L2A_UP_DIR, 'GRANULE', 'L2A_*')
+                    for pattern in ['*.h5', '*_imgdb.npy', '*_resdb.npy', '*_stages.json']:
+                        for f in glob.glob(os.path.join(granules, pattern)):
+                            if os.path.isdir(f):
+                                shutil.rmtree(f)
+                            else:
+                                os.remove(f)
                 except:
                     pass
                 try:
@@ -11,6 +11,7 @@ from datetime import datetime
 
 from L2A_Manifest import L2A_Manifest
 from L2A_Tables import L2A_Tables
+from L2A_BandStore import L2A_IoStatistics
 from L2A_SceneClass import L2A_SceneClass
 from L2A_AtmCorr import L2A_AtmCorr
 from L2A_XmlParser import L2A_XmlParser
@@ -114,23 +115,18 @@ class L2A_ProcessTile(object):
         else:
             logger.stream('Selected resolution: %s m' % self.config.resolution)
 
+        result = True
         if (self.config.resolution == 0):
-            if not self.process_resolution(20):
-                return False
-            if not self.process_resolution(10):
-                return False
-            return True
+            result = self.process_resolution(20) and self.process_resolution(10)
         elif (self.config.resolution == 60):
             self.config.downsample20to60 = False
-            if not self.process_resolution(60):
-                return False
+            result = self.process_resolution(60)
         elif (self.config.resolution == 20):
-            if not self.process_resolution(20):
-                return False
+            result = self.process_resolution(20)
         elif (self.config.resolution == 10):
-            if not self.process_resolution(10):
-                return False
-        return True
+            result = self.process_resolution(10)
+        self.dumpIoStatistics()
+        return result
 
     def process_resolution(self, resolution):
         if not self.config.preprocess(resolution):
@@ -151,11 +147,14 @@ class L2A_ProcessTile(object):
         # pr = cProfile.Profile()
         # pr.enable()
         self.config.getEntriesFromDatastrip()
-        self.config.readTileMetadata()
+        if not self.config.readTileMetadata():
+            self.logger.fatal('Module %s failed' % (self.config.L2A_TILE_ID))
+            return False
         if self.tables.checkAotMapIsPresent(self.config.resolution):
             self.config.timestamp('L2A_ProcessTile: resolution '+ str(self.config.resolution) + ' m already processed')
             return True
         
+        self.setIoStage('preprocess')
         astr = 'L2A_ProcessTile: processing with resolution ' + str(self.config.resolution) + ' m'
         self.config.timestamp(astr)
         self.config.timestamp('L2A_ProcessTile: start of pre processing')
@@ -163,21 +162,28 @@ class L2A_ProcessTile(object):
             self.logger.fatal('Module %s failed' % (self.config.L2A_TILE_ID))
             return False
      
-        if self.config.resolution > 10:
+        self.setIoStage('sc')
+        if self.config.resolution > 10 and self.tables.stageCompleted('sc'):
+            self.config.timestamp('L2A_ProcessTile: Scene Classification already completed')
+        elif self.config.resolution > 10:
             self.config.timestamp('L2A_ProcessTile: start of Scene Classification')
             sc = L2A_SceneClass(self.config, self.tables)
             self.logger.info('performing Scene Classification with resolution %d m' % self.config.resolution)
             if sc.process() == False:
                 self.logger.fatal('Module %s failed' % (self.config.L2A_TILE_ID))
                 return False
+            self.setStageCompleted('sc')
 
         scl = self.tables.getBand(self.tables.SCL)
         if scl.max() == 0:
             self.config.scOnly = True
         del scl
-        if self.config.scOnly == False:
+        self.setIoStage('ac')
+        if self.config.scOnly == False and self.tables.stageCompleted('ac'):
+            self.config.timestamp('L2A_ProcessTile: Atmospheric Correction already completed')
+        elif self.config.scOnly == False:
             ac = L2A_AtmCorr(self.config, self.tables)
-            if(self.config.resolution > 10) and (self.config.aerosolType == 'AUTO'):
+            if (self.config.resolution > 10) and (self.config.aerosolType == 'AUTO'):
                 self.config.timestamp('L2A_ProcessTile: start of Automatic Aerosol Type Detection')
                 self.logger.info('performing aerosol type detection with resolution %d m' % self.config.resolution)
                 ac.automaticAerosolDetection()
@@ -187,6 +193,7 @@ class L2A_ProcessTile(object):
             if ac.process() == False:
                 self.logger.fatal('Module %s failed' % (self.config.L2A_TILE_ID))
                 return False
+            self.setStageCompleted('ac')
           
         self.config.timestamp('L2A_ProcessTile: start of post processing')
         if self.postprocess() == False:
@@ -206,6 +213,39 @@ class L2A_ProcessTile(object):
 
         return True
 
+    def setStageCompleted(self, stage):
+        # the band store and the configuration are persisted first,
+        # so that a restart resumes with the state reached after this stage:
+        self.tables.flushBandStore()
+        picFn = self.config.picFn
+        self.config.logger = None
+        try:
+            f = open(picFn, 'wb')
+            pickle.dump(self.config, f, 2)
+            f.close()
+            self.config.logger = self.logger
+        except:
+            self.config.logger = self.logger
+            self.logger.error('cannot update configuration %s' % picFn)
+            return False
+        return self.tables.setStageCompleted(stage)
+
+    def setIoStage(self, stage):
+        self.config._stat.stage = '%d m: %s' % (self.config.resolution, stage)
+        return
+
+    def dumpIoStatistics(self):
+        statistics = self.config._stat
+        if not isinstance(statistics, L2A_IoStatistics):
+            return
+        filename = os.path.join(self.config.logDir, self.config.L2A_TILE_ID + '_io_statistics.json')
+        try:
+            statistics.dump(filename)
+            self.logger.info('I/O statistics written to %s' % filename)
+        except:
+            self.logger.warning('cannot write I/O statistics %s' % filename)
+        return
+
     def setupLogger(self):
         # assign the logger to use
         logger = L2A_Logger('sen2cor', fnLog = self.config.fnLog\
@@ -248,22 +288,49 @@ class L2A_ProcessTile(object):
         elif self.config.aerosolType != 'AUTO':
             self.config.createAtmDataFilename()
 
-        if(self.tables.importBandList() == False):
-            self.logger.fatal('import of band list failed')
-            return False
+        self.setIoStage('import')
+        if self.tables.stageCompleted('import'):
+            self.config.timestamp('L2A_ProcessTile: import of band list already completed')
+            self.tables.setCornerCoordinates()
+        else:
+            if (self.tables.importBandList() == False):
+                self.logger.fatal('import of band list failed')
+                return False
+            self.setStageCompleted('import')
+
+        self.setIoStage('aux')
+        if self.tables.stageCompleted('aux'):
+            self.config.timestamp('L2A_ProcessTile: preparation of auxiliary data already completed')
+        else:
+            if (self.tables.importAuxData() == False):
+                self.logger.fatal('preparation of auxiliary data failed')
+                return False
+            self.setStageCompleted('aux')
 
         return True
 
     def postprocess(self):
         self.logger.info('post-processing with resolution %d m', self.config.resolution)
-        res = True 
-        if not self.tables.exportBandList():
-            res = False
-        if self.config.resolution == 20 and self.config.downsample20to60 == True:
-            self.tables.downsampleBandList_20to60_andExport()
+        res = True
+        self.setIoStage('export')
+        if self.tables.stageCompleted('export'):
+            self.config.timestamp('L2A_ProcessTile: export already completed')
+        else:
+            if not self.tables.exportBandList():
+                res = False
+            if self.config.resolution == 20 and self.config.downsample20to60 == True:
+                self.tables.downsampleBandList_20to60_andExport()
+            if res:
+                self.setStageCompleted('export')
+        self.tables.closeBandStore()
         self.config = self.tables.config
-        if not self.config.postprocess():
+        self.setIoStage('metadata')
+        if self.tables.stageCompleted('metadata'):
+            self.config.timestamp('L2A_ProcessTile: metadata update already completed')
+        elif not self.config.postprocess():
             res = False
+        else:
+            self.tables.setStageCompleted('metadata')
 
         #Create the manifest.safe (L2A)
         mn = L2A_Manifest(self.config)
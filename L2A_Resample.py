@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+from numpy import *
+from skimage.measure import block_reduce
+from skimage.transform import resize as skit_resize
+
+# number of source pixels processed at once by blockMean:
+STRIP_PIXELS = 8 * 1024 * 1024
+
+
+def blockMean(arr, factor):
+    ''' Mean of factor x factor blocks of pixels, rounded half up to uint16.
+
+        The result is bit-identical to uint16(block_reduce(arr, (factor, factor), func=mean) + 0.5),
+        except for block means of exactly x.5, which older skimage versions compute in float64
+        as slightly less than x.5 for some blocks of 6 x 6 pixels. These are always rounded up here.
+        Unsigned integer images are summed in uint32 by strips of rows, instead of computing
+        the mean in float64 for each block. Other types or shapes not divisible by factor
+        are passed to block_reduce.
+    '''
+    nrows, ncols = arr.shape
+    if (arr.dtype.kind not in 'ub') or (arr.dtype.itemsize > 2) or (nrows % factor) or (ncols % factor):
+        return uint16(block_reduce(arr, block_size=(factor, factor), func=mean) + 0.5)
+
+    n = factor * factor
+    out = empty((nrows // factor, ncols // factor), uint16)
+    # the builtin max is shadowed by numpy:
+    step = (STRIP_PIXELS // (ncols * factor)) or 1
+    for row in range(0, out.shape[0], step):
+        strip = arr[row * factor:(row + step) * factor]
+        blocks = strip.reshape(strip.shape[0] // factor, factor, ncols // factor, factor)
+        # at most 36 x 65535, this fits into uint32:
+        total = blocks.sum(axis=3, dtype=uint32).sum(axis=1, dtype=uint32)
+        # floor(total / n + 0.5) in integers:
+        out[row:row + step] = (total * 2 + n) // (n * 2)
+    return out
+
+
+def upsample(arr, nrows, ncols, order):
+    ''' Upsampling of a band to nrows x ncols pixels, returned as uint16.
+
+        order = 0: nearest neighbour, 1: bi-linear, 3: bi-cubic interpolation.
+        Same as (skit_resize(arr.astype(uint16), [nrows, ncols], order=order) * 65535.).round().astype(uint16):
+        for integer factors, nearest neighbour is a repetition of the pixels (bit-identical), bi-linear and
+        bi-cubic are separable convolutions in float32 (identical within rounding). Anything else is passed
+        to skimage.
+    '''
+    srcRows, srcCols = arr.shape
+    if (nrows % srcRows) or (ncols % srcCols) or (order not in [0, 1, 3]) or (arr.dtype.kind not in 'ub'):
+        return (skit_resize(arr.astype(uint16), ([nrows, ncols]), order=order) * 65535.).round().astype(uint16)
+
+    rowFactor = nrows // srcRows
+    colFactor = ncols // srcCols
+    if order == 0:
+        return arr.astype(uint16).repeat(rowFactor, axis=0).repeat(colFactor, axis=1)
+
+    out = _interpolate(arr, rowFactor, order)
+    out = _interpolate(out.T, colFactor, order).T
+    # skimage clips to the range of the image, the pixels with exactly the value outside (0) are kept:
+    low = arr.min()
+    outside = (out == 0.0) if low > 0 else None
+    clip(out, low, arr.max(), out=out)
+    if outside is not None:
+        out[outside] = 0.0
+    return rint(out).astype(uint16)
+
+
+def _weights(t, order):
+    # weights of the neighbours for the position t in [0, 1) between pixel 0 and 1,
+    # bi-cubic is the cubic convolution (a = -0.5) of skimage.transform.warp:
+    if order == 1:
+        return [1.0 - t, t]
+    return [0.5 * (-t + 2.0 * t**2 - t**3),
+            1.0 + 0.5 * (-5.0 * t**2 + 3.0 * t**3),
+            0.5 * (t + 4.0 * t**2 - 3.0 * t**3),
+            0.5 * (-t**2 + t**3)]
+
+
+def _interpolate(arr, factor, order):
+    # interpolates the rows by an integer factor, the output pixel i is located at (i + 0.5) / factor - 0.5
+    # of the input, pixels outside of the image are 0 (mode 'constant' of skimage):
+    nrows = arr.shape[0]
+    pad = 2
+    src = zeros((nrows + 2 * pad,) + arr.shape[1:], float32)
+    src[pad:pad + nrows] = arr
+    out = empty((nrows * factor,) + arr.shape[1:], float32)
+    for phase in range(factor):
+        pos = (phase + 0.5) / factor - 0.5
+        first = int(floor(pos))
+        weights = _weights(pos - first, order)
+        if order == 3:
+            first -= 1
+        dst = out[phase::factor]
+        for k in range(len(weights)):
+            row = pad + first + k
+            if k == 0:
+                multiply(src[row:row + nrows], float32(weights[k]), out=dst)
+            else:
+                dst += src[row:row + nrows] * float32(weights[k])
+    return out
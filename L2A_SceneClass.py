@@ -84,12 +84,36 @@ class L2A_SceneClass(object):
     config = property(get_config, set_config, del_config, "config's docstring")
     logger = property(get_logger, set_logger, del_logger, "logger's docstring")
 
+    def lowerDN(self, threshold, scale):
+        # smallest DN with a reflectance >= threshold, thus:
+        # (DN / scale < threshold) == (DN < lowerDN) and (DN / scale >= threshold) == (DN >= lowerDN)
+        threshold = float32(threshold)
+        dn = int(floor(threshold * scale)) - 1
+        while (float32(dn) / scale) < threshold:
+            dn += 1
+        return dn
+
+    def upperDN(self, threshold, scale):
+        # largest DN with a reflectance <= threshold, thus:
+        # (DN / scale > threshold) == (DN > upperDN) and (DN / scale <= threshold) == (DN <= upperDN)
+        threshold = float32(threshold)
+        dn = int(ceil(threshold * scale)) + 1
+        while (float32(dn) / scale) > threshold:
+            dn -= 1
+        return dn
+
     def preprocess(self):
         # fix for SIIMPC-1006.1 UMW:
-        bandIndex = self.tables.bandIndex
-        for i in bandIndex:
-            band = self.tables.getBand(i)
-            self.classificationMask[band == 0] = self._noData
+        # the union of the zero pixels of all bands is prepared during the import:
+        noDataMask = self.tables.getNoDataMask()
+        if noDataMask is not False:
+            self.classificationMask[noDataMask] = self._noData
+            del noDataMask
+        else:
+            bandIndex = self.tables.bandIndex
+            for i in bandIndex:
+                band, scale = self.tables.getBandDN(i)
+                self.classificationMask[band == 0] = self._noData
         if self.classificationMask.max() == self._noData:
             self.logger.warning('All images contain only background pixels, output product will be created without atmospheric correction')
             return False
@@ -337,7 +361,7 @@ class L2A_SceneClass(object):
         # Snow filter 5: snow boundary zones
         T1_SNOW = self.config.T1_SNOW
         T2_SNOW = self.config.T2_SNOW
-        B12 = self.tables.getBand(self.tables.B12)
+        B12, scale = self.tables.getBandDN(self.tables.B12)
         CM = self.classificationMask
         CMS = self.confidenceMaskSnow
         snow_mask = (CMS >T1_SNOW) & (CM!=self._noData)
@@ -346,7 +370,7 @@ class L2A_SceneClass(object):
         struct = iterate_structure(generate_binary_structure(2,1), 3)
         snow_mask_dil = binary_dilation(snow_mask, struct)
         ring = snow_mask_dil ^ snow_mask
-        ring_no_clouds = (ring &  (B12 < T2_SNOW))
+        ring_no_clouds = (ring &  (B12 < self.lowerDN(T2_SNOW, scale)))
         # important, if classified as snow, this should not become cloud:
         self.confidenceMaskCloud[ring_no_clouds | (CM == self._snowIce)] = 0
         # release the lock for the non snow classification
@@ -519,8 +543,9 @@ class L2A_SceneClass(object):
         T_CLOUD_HP = self.config.T_CLOUD_HP
         T1_B10 = self.config.T1_B10
         T2_B10 = self.config.T2_B10
-        B02 = self.tables.getBand(self.tables.B02)
-        B10 = self.tables.getBand(self.tables.B10)
+        # comparisons only, the thresholds are scaled into DN space instead of the bands:
+        B02, scale = self.tables.getBandDN(self.tables.B02)
+        B10, scale = self.tables.getBandDN(self.tables.B10)
         LPC = self._lowProbaClouds
         MPC = self._medProbaClouds
         HPC = self._highProbaClouds
@@ -528,7 +553,9 @@ class L2A_SceneClass(object):
         CM = self.classificationMask
         CMC = self.confidenceMaskCloud
         
-        REFL_BLUE_MAX = 0.50
+        REFL_BLUE_MAX = self.lowerDN(0.50, scale)
+        T1_B10 = self.upperDN(T1_B10, scale)
+        T2_B10 = self.lowerDN(T2_B10, scale)
         CM[(CMC > T_CLOUD_LP) & (CMC < T_CLOUD_MP) & (CM == self._notClassified)] = LPC
         self.logger.debug(statistics(CMC[(CM == LPC)], 'CM LOW_PROBA_CLOUDS'))
         CM[(CMC >= T_CLOUD_MP) & (CMC < T_CLOUD_HP) & (CM == self._notClassified)] = MPC
@@ -567,7 +594,7 @@ class L2A_SceneClass(object):
         T_water = 6.0
 
         x = self.config.nrows
-        y = self.config.nrows
+        y = self.config.ncols
         BX = zeros((6, x, y), float32)
         BX[0, :, :] = self.tables.getBand(self.tables.B02)
         BX[1, :, :] = self.tables.getBand(self.tables.B03)
@@ -646,7 +673,9 @@ class L2A_SceneClass(object):
         distr_shad = zoom(distr_clouds, factor)
 
         # Create filter for convolution (4 cases)
-        filt_b[0:distr_shad.size, 0] = distr_shad
+        # the distribution is cut, if the image is smaller, e.g. for a region of interest:
+        npts = min(distr_shad.size, y_aa)
+        filt_b[0:npts, 0] = distr_shad[0:npts]
         ys = float(y_aa/2.0)
         xs = float(x_aa/2.0)
 
@@ -830,8 +859,9 @@ class L2A_SceneClass(object):
         return
 
     def L2A_SnowRecovery(self):
-        B03 = self.tables.getBand(self.tables.B03)
-        B11 = self.tables.getBand(self.tables.B11)
+        # B11 < B03 holds for the reflectances as well as for the DNs:
+        B03, scale = self.tables.getBandDN(self.tables.B03)
+        B11, scale = self.tables.getBandDN(self.tables.B11)
         CM = self.classificationMask
         snow_mask = (CM == self._snowIce)
         struct = iterate_structure(generate_binary_structure(2,1), 3)
@@ -7,14 +7,13 @@ included fixes for: SIIMPC-792, SIIMPC-550, SIIMPC-887 and SIIMPC-944.
 fix for SCOR-6: failure due to "Tile is crossing the international date line"
 '''
 import fnmatch
-import subprocess
 import tempfile, logging, shutil
 import re
+import json
 from L2A_Library import *
 from time import sleep
 import glymur
 from PIL import Image
-from skimage.measure import block_reduce
 from skimage.transform import resize as skit_resize
 from tables import *
 from numpy import *
@@ -24,11 +23,16 @@ from scipy.ndimage.interpolation import zoom
 from scipy.ndimage.filters import median_filter
 from lxml import etree, objectify
 from L2A_XmlParser import L2A_XmlParser
+from L2A_Resample import blockMean, upsample
+from L2A_Terrain import hornTerrain, sunAngleStrips
+from L2A_Dem import SRTM_VRT, MARGIN, fetchSrtm, vrtCovers
+from L2A_BandStore import L2A_BandStore, L2A_NpyBandStore, L2A_BandCache, L2A_DecodeCache, L2A_AuxCache, L2A_BandStatistics, Particle, replaceFile
 
 from osgeo.gdal_array import BandReadAsArray
 import gdal
 
 from multiprocessing import Lock, cpu_count
+from multiprocessing.pool import ThreadPool
 l = Lock()
 
 try:
@@ -45,20 +49,10 @@ except ImportError:
 gdal.PushErrorHandler('CPLQuietErrorHandler')
 gdal.UseExceptions()
 
-class Particle(IsDescription):
-    bandName = StringCol(8)
-    projectionRef = StringCol(512)
-    geoTransformation = Int32Col(shape=6)
-    rasterXSize = UInt16Col()
-    rasterYSize = UInt16Col()
-    rasterCount = UInt8Col()
-
 class L2A_Tables(object):
     def __init__(self, config):
         self._config = config
         self._logger = config.logger
-        self._DEV0 = None
-        self._SHELL = None
         self._firstInit = False
 
         AUX_DATA = 'AUX_DATA'
@@ -69,19 +63,6 @@ class L2A_Tables(object):
         self.aux_src = None
         self._tmpdir = ''
 
-        if self._logger.level == logging.DEBUG:
-            self._DEV0 = ''
-            if os.name == 'posix':
-                self._SHELL = True
-            else:
-                self._SHELL = False
-        else:
-            if os.name == 'posix':
-                self._DEV0 = ' >/dev/null 2>&1'
-                self._SHELL = True
-            else:
-                self._DEV0 = ''
-                self._SHELL = False
         # Resolution:
         self._resolution = int(config.resolution)
         if(self._resolution == 10):
@@ -225,11 +206,36 @@ class L2A_Tables(object):
         self._L2A_Tile_SLP_File = os.path.join(self._L2A_AuxDataDir     , L2A_TILE_ID + '_SLP_' + str(self._resolution) + 'm' + self._L2A_ImageExtention)
         self._L2A_Tile_ASP_File = os.path.join(self._L2A_AuxDataDir     , L2A_TILE_ID + '_ASP_' + str(self._resolution) + 'm' + self._L2A_ImageExtention)
         self._L2A_Tile_DEM_File = os.path.join(self._L2A_AuxDataDir     , L2A_TILE_ID + '_DEM_' + str(self._resolution) + 'm' + self._L2A_ImageExtention)
-        self._imgdb = os.path.join(self.config.img_database_dir, L2A_TILE_ID + '_imgdb.h5')
-        if not os.path.exists(self._imgdb):
+        if self.config.db_backend == 'NPY':
+            self._bandStore = L2A_NpyBandStore(config)
+        else:
+            self._bandStore = L2A_BandStore(config)
+        self._bandCache = L2A_BandCache(config.band_cache_size)
+        # statistics of the bands being streamed into the image database:
+        self._ingest = {}
+        # union of the zero pixels of the bands imported on the target grid:
+        self._noDataMask = None
+        self._noDataBands = set()
+        try:
+            self._decodeCache = L2A_DecodeCache(config.decode_cache_dir, config.decode_cache_size)
+        except Exception as e:
+            self.logger.warning('decode cache %s cannot be used: %s' % (config.decode_cache_dir, e))
+            self._decodeCache = L2A_DecodeCache('NONE', 0)
+        try:
+            self._auxCache = L2A_AuxCache(config.aux_cache_dir)
+        except Exception as e:
+            self.logger.warning('aux cache %s cannot be used: %s' % (config.aux_cache_dir, e))
+            self._auxCache = L2A_AuxCache('NONE')
+        self._imgdb = os.path.join(self.config.img_database_dir, L2A_TILE_ID + '_imgdb' + self._bandStore.extension)
+        self._resdb = os.path.join(self.config.res_database_dir, L2A_TILE_ID + '_resdb' + self._bandStore.extension)
+        # stage manifest for resuming an interrupted tile, kept next to the scratch databases:
+        self._stageFn = os.path.join(self.config.res_database_dir, L2A_TILE_ID + '_stages.json')
+        if not self._bandStore.exists(self._imgdb) or not self._bandStore.exists(self._resdb):
+            # completed stages are meaningless without the databases they were written to:
+            self.resetStages()
+        if not self._bandStore.exists(self._imgdb):
             self.initTable(self._imgdb)
-        self._resdb = os.path.join(self.config.res_database_dir, L2A_TILE_ID + '_resdb.h5')
-        if not os.path.exists(self._resdb):
+        if not self._bandStore.exists(self._resdb):
             self.initTable(self._resdb)
         self._acMode = False # default setting for scene classification
 
@@ -374,9 +380,25 @@ class L2A_Tables(object):
     def del_db_name(self):
         del self._dbName
 
+
+    def get_band_store(self):
+        return self._bandStore
+
+
+    def set_band_store(self, value):
+        self._bandStore = value
+
+
+    def del_band_store(self):
+        del self._bandStore
+
         # end mapping of channels and bands
 
     def __del__(self):
+        try:
+            self._bandStore.close()
+        except:
+            pass
         try:
             shutil.rmtree(self._tmpdir)
         except:
@@ -871,6 +893,7 @@ class L2A_Tables(object):
     geoExtent = property(get_geo_extent, set_geo_extent, del_geo_extent, "geoExtent's docstring")
     projection = property(get_projection, set_projection, del_projection, "projection's docstring")
     acMode = property(get_ac_mode, set_ac_mode, del_ac_mode, "acMode's docstring")
+    bandStore = property(get_band_store, set_band_store, del_band_store, "bandStore's docstring")
 
 
     def checkAotMapIsPresent(self, resolution):
@@ -886,6 +909,43 @@ class L2A_Tables(object):
         except:
             return False
 
+    def readStages(self):
+        try:
+            with open(self._stageFn, 'r') as fp:
+                return json.load(fp)
+        except:
+            return {}
+
+    def stageCompleted(self, stage):
+        stages = self.readStages()
+        return stage in stages.get(str(self._resolution), [])
+
+    def setStageCompleted(self, stage):
+        if not self._bandStore.exists(self._resdb):
+            # the databases have been removed with the completed tile, no manifest is left behind:
+            return True
+        stages = self.readStages()
+        completed = stages.setdefault(str(self._resolution), [])
+        if stage not in completed:
+            completed.append(stage)
+        # write to a temporary file first and rename, so that the manifest is never left truncated:
+        try:
+            fd, tmpFn = tempfile.mkstemp(dir=os.path.dirname(self._stageFn))
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(stages, fp)
+            replaceFile(tmpFn, self._stageFn)
+            return True
+        except Exception as e:
+            self.logger.error('cannot update stage manifest: ' + str(e))
+            return False
+
+    def resetStages(self):
+        try:
+            os.remove(self._stageFn)
+        except:
+            pass
+        return
+
     def checkB2isPresent(self, resolution):
         sourceDir = os.path.join(self._L2A_ImgDataDir, 'R' + str(resolution) + 'm')
         try:
@@ -930,6 +990,7 @@ class L2A_Tables(object):
         self.config.timestamp('L2A_Tables: start import')
         dirs = sorted(os.listdir(sourceDir))
         bandIndex = self.bandIndex
+        jobs = []
         for i in bandIndex:
             for filename in dirs:
                 bandName = self.getBandNameFromIndex(i)
@@ -939,11 +1000,64 @@ class L2A_Tables(object):
                 if(rasterX == False):
                     self.setCornerCoordinates()
                     rasterX = True
-                res = self.importBandImg(i, os.path.join(sourceDir, filename))
-                if not res:
-                    return False
+                entry = self._bandStore.getEntry(self._imgdb, '/arrays', bandName)
+                if entry is not None:
+                    meta = self._bandStore.getMeta(self._imgdb, bandName)
+                    # decoded at reduced resolution for a coarser pass or for another region of interest,
+                    # or a band which was not streamed completely (the meta data are written last),
+                    # must be decoded again:
+                    if (entry[0][0] < self.config.nrows) or (meta is None) or (meta[0] != entry[0][0]) or \
+                            (entry[0] != self.getImportShape(os.path.join(sourceDir, filename), entry[0])):
+                        self.removeBandImg(i)
+                if self.hasBand(i):
+                    # avoid reread of already existing reflectance bands:
+                    self.logger.info('L2A_Tables: band ' + bandName + ' already present')
+                else:
+                    jobs.append((i, os.path.join(sourceDir, filename)))
                 break
 
+        # bands decoded by a previous run are taken from the decode cache:
+        if self._decodeCache.enabled:
+            jobs = [(i, filename) for i, filename in jobs if not self.importCachedBand(i, filename)]
+
+        # JPEG-2000 bands are streamed by strips of tile rows, all others are read as a whole.
+        # The strips are decoded concurrently and appended in order by this thread only,
+        # so the decoded data held in memory is bounded by the number of decoders:
+        tasks = []
+        for i, filename in jobs:
+            strips = self.getStrips(filename)
+            if strips is None:
+                tasks.append((i, filename, None, True, True))
+                continue
+            for k in range(len(strips)):
+                tasks.append((i, filename, strips[k], k == 0, k == len(strips) - 1))
+        nrDecodeThreads = min(self.config.nrDecodeThreads, len(tasks))
+        if nrDecodeThreads > 1:
+            self.logger.info('decoding %d bands with %d concurrent decoders' % (len(jobs), nrDecodeThreads))
+            pool = ThreadPool(nrDecodeThreads)
+            try:
+                pending = []
+                for task in tasks:
+                    pending.append((task, pool.apply_async(self.decodeTask, task[:3])))
+                    if len(pending) == nrDecodeThreads:
+                        task, result = pending.pop(0)
+                        if not self.writeTask(task, result.get()):
+                            return False
+                for task, result in pending:
+                    if not self.writeTask(task, result.get()):
+                        return False
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in tasks:
+                if not self.writeTask(task, self.decodeTask(*task[:3])):
+                    return False
+
+        if self._resolution > 10:
+            if not self.buildNoDataMask():
+                return False
+
         upsampling = False
         if(self._resolution == 10):
             # 10m bands only: perform an up sampling of SCL, AOT, WVP, and VIS from 20 m channels to 10
@@ -955,8 +1069,9 @@ class L2A_Tables(object):
             upsampling = True
         
         if upsampling:
-            tmpdb = self._resdb + '_tmp'
-            self.initTable(tmpdb)
+            # the bands are upsampled in place, everything else of the 20 m pass is dropped
+            # from the result database, instead of rebuilding it as a new file:
+            upsampled = []
             dirs = sorted(os.listdir(sourceDir))
             for i in channels:
                 for filename in dirs:
@@ -973,57 +1088,56 @@ class L2A_Tables(object):
                             pass
                     if not res:
                         return False
+                    upsampled.append(bandName)
                     break
-            if (os.path.isfile(tmpdb)):
-                if (os.path.isfile(self._resdb)):
-                    os.remove(self._resdb)
-                os.rename(tmpdb, self._resdb)
-                self.logger.info("renaming hd5 result database (size: %s)" % os.path.getsize(self._resdb))
+            self._bandCache.clear()
+            self._bandStore.prune(self._resdb, upsampled)
+            self._bandStore.flush(self._resdb)
+            self.logger.info("result database pruned (size: %s)" % self._bandStore.size(self._resdb))
+
+        self.config.timestamp('L2A_Tables: stop import of bands')
+        return True
 
+    def importAuxData(self):
+        # DEM preparation and the ESA CCI a priori information:
         self.dem = False
         demDir =  self.config.demDirectory
         if demDir == 'NONE':
             self.logger.info('DEM directory not specified, flat surface is used')
             return True
 
-        # check if DEM is a DTED type, these files must exist in the given directory:
-        if self.isDted():
-            # yes it is, run dem preparation for DTED:
-            demfile = self.gdalDEM_dted()
-            if(demfile == False):
-                self.config.demDirectory = 'NONE'
-                self.config.demType = 'NONE'
-                # continue with flat surface ...
-                return True
-            else:
-                self.config.demType = 'DTED'
-        else: # run DEM preparation for SRTM:
-            demfile = self.gdalDEM_srtm()
-            if(demfile == False):
-                self.config.demDirectory = 'NONE'
-                self.config.demType = 'NONE'
-                # continue with flat surface ...
-                return True
-            else:
-                self.config.demType = 'SRTM'
-        # generate hill shadow, slope and aspect using DEM:
-        if(self.gdalDEM_Shade(demfile) == False):
-            self.logger.fatal('shell execution error generating DEM shadow')
-            return False
+        # the DEM, slope and aspect do not depend on the acquisition, they may be read from the aux cache:
+        demfile = self.getCachedDem()
+        cached = demfile is not None
+        if not cached:
+            # check if DEM is a DTED type, these files must exist in the given directory:
+            if self.isDted():
+                # yes it is, run dem preparation for DTED:
+                demfile = self.gdalDEM_dted()
+                if(demfile == False):
+                    self.config.demDirectory = 'NONE'
+                    self.config.demType = 'NONE'
+                    # continue with flat surface ...
+                    return True
+                else:
+                    self.config.demType = 'DTED'
+            else: # run DEM preparation for SRTM:
+                demfile = self.gdalDEM_srtm()
+                if(demfile == False):
+                    self.config.demDirectory = 'NONE'
+                    self.config.demType = 'NONE'
+                    # continue with flat surface ...
+                    return True
+                else:
+                    self.config.demType = 'SRTM'
 
-        if(self.gdalDEM_Slope(demfile) == False):
-            self.logger.fatal('shell execution error generating DEM slope')
+        # hill shadow, and slope and aspect if not cached, using DEM:
+        if(self.importTerrain(demfile, cached) == False):
+            self.logger.fatal('error generating DEM shadow, slope and aspect')
             return False
 
-        if self._resolution > 10:
-            if(self.gdalDEM_Aspect(demfile) == False):
-                self.logger.fatal('shell execution error generating DEM aspect')
-                return False
-
-        try:
-            os.remove(demfile)
-        except:
-            pass
+        # release the in-memory DEM:
+        demfile = None
 
         if(self._resolution == 10):
             try:
@@ -1072,11 +1186,7 @@ class L2A_Tables(object):
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
         nrows = self.config.nrows
         ncols = self.config.ncols
-        idx = getResolutionIndex(self._resolution)
-        ulx = tg.Geoposition[idx].ULX
-        uly = tg.Geoposition[idx].ULY
-        res = float32(self._resolution)
-        geoTransformation = [ulx,res,0.0,uly,0.0,-res]
+        geoTransformation = self.config.getGeoTransformation(tg, self._resolution)
         extent = GetExtent(geoTransformation, ncols, nrows)
         self._cornerCoordinates = asarray(extent)
         return
@@ -1119,7 +1229,6 @@ class L2A_Tables(object):
         straux_src = os.path.join(self._L2A_AuxDataDir, self.aux_src)
         curdir = os.path.curdir
         head, tail = os.path.split(straux_src)
-        l.acquire()
         os.chdir(head)
         arr = False
         while True:
@@ -1134,7 +1243,6 @@ class L2A_Tables(object):
                 self.logger.error('error in reading ozone values from aux data')
             finally:
                 os.chdir(curdir)
-                l.release()
                 return arr
     
     def gdalDEM_dted(self):
@@ -1161,7 +1269,7 @@ class L2A_Tables(object):
         lonMax = int(round(lonMax))
         latMin = int(round(latMin))
         latMax = int(round(latMax))
-        dtedf_src = ''
+        dtedf_src = []
 
         filelist = sorted(os.listdir(sourceDir))
         found = False
@@ -1189,90 +1297,41 @@ class L2A_Tables(object):
                 for filename in filelist:
                     if(fnmatch.fnmatch(filename, file_mask) == True):
                         found = True
-                        dtedf_src += ' ' + os.path.join(sourceDir, filename)
+                        dtedf_src.append(os.path.join(sourceDir, filename))
                         break
 
         if not found:
             self.logger.info('DEM not found, flat surface is used')
             return False
 
-        if lonMin <= lonMax: # Fix for SIIMPC-944 VD-JL - International Date Line handling for DEM mosaicking
-            command = 'gdalwarp -r bilinear ' # fix for SIIMPC-1006.2 UMW
-        else:
-            command = 'gdalwarp -r bilinear -t_srs EPSG:4326 --config CENTER_LONG 180 '
-
-        arguments = '-ot Int16 '
-        # fix for SIIMPC-556.2 UMW:
-        tmpDir = self._tmpdir
-
-        dtedf_dest = os.path.join(tmpDir, 'dted_' + self.config.L2A_TILE_ID + '_src.tif')
-        callstr = command + arguments + dtedf_src + ' ' + dtedf_dest + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
-            self.logger.fatal('shell execution error using gdalwarp')
-            os.remove(dtedf_src)
+        # fix for SIIMPC-1006.2 UMW:
+        options = {'resampleAlg': 'bilinear', 'outputType': gdal.GDT_Int16}
+        centerLong = lonMin > lonMax # Fix for SIIMPC-944 VD-JL - International Date Line handling for DEM mosaicking
+        if centerLong:
+            options['dstSRS'] = 'EPSG:4326'
+        dted_src = self.gdalWarp(dtedf_src, centerLong, **options)
+        if dted_src is None:
+            self.logger.fatal('execution error using gdalwarp')
             return False
-        finally:
-            l.release()
-
-        dtedf_src = dtedf_dest
-        dtedf_dest = os.path.join(tmpDir, 'dted_' + self.config.L2A_TILE_ID + '_dem.tif')
-        hcsCode = tg.HORIZONTAL_CS_CODE.text
-        t_srs = '-t_srs ' + hcsCode
 
-        te = ' -te %f %f %f %f' % (xy[0,0], xy[2,1], xy[2,0], xy[0,1])
-        tr = ' -tr %d %d' % (self._resolution, self._resolution)
-        t_warp = te + tr + ' -r cubicspline '
-
-        command = 'gdalwarp '
         # fix for SIIMPC-792, JL:
-        arguments = '-ot Float32 '
+        dted_dem = self.gdalWarp(dted_src, outputType=gdal.GDT_Float32, **self.getTileWarpOptions(tg, 'cubicspline'))
         # end of fix for SIIMPC-792
-        callstr = command + arguments + t_srs + t_warp + dtedf_src + ' ' + dtedf_dest + self._DEV0
-        # fix for SIIMPC-563.1, UMW:
-        l.acquire()
-        # end fix for SIIMPC-563.1
-        try:
-            p =subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        dted_src = None
+        if dted_dem is None:
             self.logger.fatal('Error reading DEM, flat surface will be used')
-            os.remove(dtedf_src)
             return False
-        finally:
-            l.release()
 
         # fix for SIIMPC-792, JL:
-        command = 'gdal_translate '
-        arguments = '-ot Int16 '
-        dtedf_dst_int16 = os.path.join(tmpDir, 'dted_' + self.config.L2A_TILE_ID + '_dem_int16.tif')
-        callstr = command + arguments + dtedf_dest + ' ' + dtedf_dst_int16 + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        dted_int16 = self.gdalTranslate(dted_dem, outputType=gdal.GDT_Int16)
+        if dted_int16 is None:
             self.logger.fatal('Error reading DEM, flat surface will be used')
-            os.remove(dtedf_dest)
             return False
-        finally:
-            l.release()
-        # end of fix for SIIMPC-792
-
-        self.importBandRes(self.DEM, dtedf_dst_int16) # fix for SIIMPC-792, JL
-        # fix for SIIMPC-563.2, UMW:
-        os.remove(dtedf_src)
-        # end fix for SIIMPC-563.2
-
-        # fix for SIIMPC-792, JL
-        os.remove(dtedf_dst_int16)
         # end of fix for SIIMPC-792
 
+        self.importBandRes(self.DEM, dted_int16) # fix for SIIMPC-792, JL
         self.logger.info('DEM received and prepared')
-        return dtedf_dest
+        return dted_dem
 
 
     def gdalCCI_wb(self):
@@ -1282,110 +1341,16 @@ class L2A_Tables(object):
             self.logger.warning('ESA CCI Water Bodies map not present, water detection will be performed without a priori information')
             return True
 
-        xy = self.cornerCoordinates
         xp = L2A_XmlParser(self.config, 'T2A')
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
-        hcsName = tg.HORIZONTAL_CS_NAME.text
-        zone = hcsName.split()[4]
-        zone1 = int(zone[:-1])
-        zone2 = zone[-1:].upper()
-        lonMin, latMin, dummy = transform_utm_to_wgs84(xy[1,0], xy[1,1], zone1, zone2)
-        lonMax, latMax, dummy = transform_utm_to_wgs84(xy[3,0], xy[3,1], zone1, zone2)
-
-        tmpDir = self._tmpdir
-
-        # step 1: check if the S2 tile crosses the International Date Line:
-
-        if lonMin <= lonMax:
-            command = 'gdalwarp '
-            arguments = ''
-        else:
-            self.logger.warning('International Date Line is crossed, ESA CCI map reframing is performed')
-
-            ymin = clip(latMin - 0.5, -90.0, 90.0)
-            ymax = clip(latMax + 0.5, -90.0, 90.0)
-
-            cci_wb_dst_east = os.path.join(tmpDir, 'cci_wb' + self.config.L2A_TILE_ID + '_{0}m_east.tif'.format(self._resolution))
-            cci_wb_dst_west = os.path.join(tmpDir, 'cci_wb' + self.config.L2A_TILE_ID + '_{0}m_west.tif'.format(self._resolution))
-            cci_wb_dst_dateline = os.path.join(tmpDir, 'cci_wb' + self.config.L2A_TILE_ID + '_{0}m_dateline.tif'.format(self._resolution))
-
-            command = 'gdalwarp '
-            arguments = ' -te 178.5 {0} 180 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciWaterBodies + ' ' + cci_wb_dst_east + self._DEV0
-
-            #self.logger.warning(callstr)
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 1, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -te -180 {0} -178.5 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciWaterBodies + ' ' + cci_wb_dst_west + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 2, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -t_srs EPSG:4326 --config CENTER_LONG 180 '
-            callstr = command + arguments + cci_wb_dst_west + ' ' + cci_wb_dst_east + ' ' + cci_wb_dst_dateline + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 3, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            esacciWaterBodies = cci_wb_dst_dateline
-            command = 'gdalwarp '
-            arguments = ''
-
-        # step 2: extraction and reprojection into S2 tile geometry:
-        hcsCode = tg.HORIZONTAL_CS_CODE.text
-        t_srs = '-t_srs ' + hcsCode
-
-        te = ' -te %f %f %f %f' % (xy[0,0], xy[2,1], xy[2,0], xy[0,1])
-        tr = ' -tr %d %d' % (self._resolution, self._resolution)
-        t_warp = te + tr + ' -r cubicspline '
-
-        cci_wb_dst = os.path.join(tmpDir, 'cci_wb' + self.config.L2A_TILE_ID + '_{0}m.tif'.format(self._resolution))
-        callstr = command + arguments + t_srs + t_warp + esacciWaterBodies + ' ' + cci_wb_dst + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        dst = self.gdalCCI(esacciWaterBodies, tg, 'cubicspline')
+        if dst is None:
             self.logger.warning('Cannot read esa cci, no water bodies a priori information will be used')
             return False
-        finally:
-            l.release()
-
-        self.importBandRes(self.WBI, cci_wb_dst)
-        try:
-            os.remove(cci_wb_dst)
-            os.remove(cci_wb_dst_east)
-            os.remove(cci_wb_dst_west)
-            os.remove(cci_wb_dst_dateline)
-        except:
-            pass
 
+        self.importBandRes(self.WBI, dst)
         self.logger.info('ESA CCI Water Bodies received and prepared')
-        return cci_wb_dst
+        return True
 
 
     def gdalCCI_lccs(self):
@@ -1395,111 +1360,16 @@ class L2A_Tables(object):
             self.logger.warning('ESA CCI Land Cover map not present, cloud detection over urban areas will be performed without a priori information')
             return True
 
-        xy = self.cornerCoordinates
         xp = L2A_XmlParser(self.config, 'T2A')
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
-        hcsName = tg.HORIZONTAL_CS_NAME.text
-        zone = hcsName.split()[4]
-        zone1 = int(zone[:-1])
-        zone2 = zone[-1:].upper()
-        lonMin, latMin, dummy = transform_utm_to_wgs84(xy[1,0], xy[1,1], zone1, zone2)
-        lonMax, latMax, dummy = transform_utm_to_wgs84(xy[3,0], xy[3,1], zone1, zone2)
-
-        tmpDir = self._tmpdir
-
-        # step 1: check if the S2 tile crosses the International Date Line:
-
-        if lonMin <= lonMax:
-            command = 'gdalwarp '
-            arguments = ''
-        else:
-            self.logger.warning('International Date Line is crossed, ESA CCI map reframing is performed')
-
-            ymin = clip(latMin - 0.5, -90.0, 90.0)
-            ymax = clip(latMax + 0.5, -90.0, 90.0)
-
-            cci_lccs_dst_east = os.path.join(tmpDir, 'cci_lccs' + self.config.L2A_TILE_ID + '_{0}m_east.tif'.format(self._resolution))
-            cci_lccs_dst_west = os.path.join(tmpDir, 'cci_lccs' + self.config.L2A_TILE_ID + '_{0}m_west.tif'.format(self._resolution))
-            cci_lccs_dst_dateline = os.path.join(tmpDir, 'cci_lccs' + self.config.L2A_TILE_ID + '_{0}m_dateline.tif'.format(self._resolution))
-
-            command = 'gdalwarp '
-            arguments = ' -te 178.5 {0} 180 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciLandCover + ' ' + cci_lccs_dst_east + self._DEV0
-
-            #self.logger.warning(callstr)
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 1, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -te -180 {0} -178.5 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciLandCover + ' ' + cci_lccs_dst_west + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 2, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -t_srs EPSG:4326 --config CENTER_LONG 180 '
-            callstr = command + arguments + cci_lccs_dst_west + ' ' + cci_lccs_dst_east + ' ' + cci_lccs_dst_dateline + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 3, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            esacciLandCover = cci_lccs_dst_dateline
-            command = 'gdalwarp '
-            arguments = ''
-
-        # step 2: extraction and reprojection into S2 tile geometry:
-        hcsCode = tg.HORIZONTAL_CS_CODE.text
-        t_srs = '-t_srs ' + hcsCode
-
-        te = ' -te %f %f %f %f' % (xy[0,0], xy[2,1], xy[2,0], xy[0,1])
-        tr = ' -tr %d %d' % (self._resolution, self._resolution)
-        #t_warp = te + tr + ' -r cubicspline '
-        t_warp = te + tr + ' -r near '
-
-        cci_lccs_dst = os.path.join(tmpDir, 'cci_lccs_' + self.config.L2A_TILE_ID + '_{0}m.tif'.format(self._resolution))
-        callstr = command + arguments + t_srs + t_warp + esacciLandCover + ' ' + cci_lccs_dst + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        dst = self.gdalCCI(esacciLandCover, tg, 'near')
+        if dst is None:
             self.logger.warning('Cannot read esa cci lccs, no land cover a priori information will be used')
             return False
-        finally:
-            l.release()
-
-        self.importBandRes(self.LCM, cci_lccs_dst)
-        try:
-            os.remove(cci_lccs_dst)
-            os.remove(cci_lccs_dst_east)
-            os.remove(cci_lccs_dst_west)
-            os.remove(cci_lccs_dst_dateline)
-        except:
-            pass
 
+        self.importBandRes(self.LCM, dst)
         self.logger.info('ESA CCI Land Cover map prepared')
-        return cci_lccs_dst
+        return True
 
 
     def gdalCCI_snowc(self):
@@ -1531,131 +1401,33 @@ class L2A_Tables(object):
             self.logger.warning('ESA CCI Snow Condition map not present, no snow map post-processing will be done')
             return True
 
-        xy = self.cornerCoordinates
         xp = L2A_XmlParser(self.config, 'T2A')
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
-        hcsName = tg.HORIZONTAL_CS_NAME.text
-        zone = hcsName.split()[4]
-        zone1 = int(zone[:-1])
-        zone2 = zone[-1:].upper()
-        lonMin, latMin, dummy = transform_utm_to_wgs84(xy[1,0], xy[1,1], zone1, zone2)
-        lonMax, latMax, dummy = transform_utm_to_wgs84(xy[3,0], xy[3,1], zone1, zone2)
-
-        tmpDir = self._tmpdir
-
-        # step 1: check if the S2 tile crosses the International Date Line:
-
-        if lonMin <= lonMax:
-            command = 'gdalwarp '
-            arguments = ''
-        else:
-            self.logger.warning('International Date Line is crossed, ESA CCI map reframing is performed')
-
-            ymin = clip(latMin - 0.5, -90.0, 90.0)
-            ymax = clip(latMax + 0.5, -90.0, 90.0)
-
-            cci_snowc_dst_east = os.path.join(tmpDir, 'cci_snowc' + self.config.L2A_TILE_ID + '_{0}m_east.tif'.format(self._resolution))
-            cci_snowc_dst_west = os.path.join(tmpDir, 'cci_snowc' + self.config.L2A_TILE_ID + '_{0}m_west.tif'.format(self._resolution))
-            cci_snowc_dst_dateline = os.path.join(tmpDir, 'cci_snowc' + self.config.L2A_TILE_ID + '_{0}m_dateline.tif'.format(self._resolution))
-
-            command = 'gdalwarp '
-            arguments = ' -te 178.5 {0} 180 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciSnowCondition + ' ' + cci_snowc_dst_east + self._DEV0
-
-            #self.logger.warning(callstr)
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 1, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -te -180 {0} -178.5 {1} '.format(ymin, ymax)
-            callstr = command + arguments + esacciSnowCondition + ' ' + cci_snowc_dst_west + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 2, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            arguments = ' -t_srs EPSG:4326 --config CENTER_LONG 180 '
-            callstr = command + arguments + cci_snowc_dst_west + ' ' + cci_snowc_dst_east + ' ' + cci_snowc_dst_dateline + self._DEV0
-
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except:
-                self.logger.warning('Cannot perform reframing step 3, no water bodies a priori information will be used')
-                return False
-            finally:
-                l.release()
-
-            esacciSnowCondition = cci_snowc_dst_dateline
-            command = 'gdalwarp '
-            arguments = ''
-
-        # step 2: extraction and reprojection into S2 tile geometry:
-        hcsCode = tg.HORIZONTAL_CS_CODE.text
-        t_srs = '-t_srs ' + hcsCode
-
-        te = ' -te %f %f %f %f' % (xy[0,0], xy[2,1], xy[2,0], xy[0,1])
-        tr = ' -tr %d %d' % (self._resolution, self._resolution)
-        #t_warp = te + tr + ' -r cubicspline '
-        t_warp = te + tr + ' -r near '
-
-        cci_snowc_dst = os.path.join(tmpDir, 'cci_snowc_' + self.config.L2A_TILE_ID + '_{0}m.tif'.format(self._resolution))
-        callstr = command + arguments + t_srs + t_warp + esacciSnowCondition + ' ' + cci_snowc_dst + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        dst = self.gdalCCI(esacciSnowCondition, tg, 'near')
+        if dst is None:
             self.logger.warning('Cannot read esa cci snowc, no snow condition a priori information will be used')
             return False
-        finally:
-            l.release()
-
-        self.importBandRes(self.SNC, cci_snowc_dst)
-        try:
-            os.remove(cci_snowc_dst)
-            os.remove(cci_snowc_dst_east)
-            os.remove(cci_snowc_dst_west)
-            os.remove(cci_snowc_dst_dateline)
-        except:
-            pass
 
+        self.importBandRes(self.SNC, dst)
         self.logger.info('ESA CCI Snow Condition map prepared')
-        return cci_snowc_dst
+        return True
 
 
     def gdalDEM_srtm(self):
-        import urllib
-        import zipfile
-        isTemporary = False
         demDir = self.config.demDirectory
         if demDir == 'NONE':
             self.logger.info('DEM directory not specified, flat surface is used')
             return False
         self.logger.info('Start DEM alignment for tile')
         sourceDir = os.path.join(self.config.home, demDir)
-        tmpDir = self._tmpdir
-        l.acquire()
-        try:
-            if(os.path.exists(sourceDir) == False):
+        if(os.path.exists(sourceDir) == False):
+            try:
                 os.makedirs(sourceDir)
-        finally:
-            l.release()
- 
+            except OSError:
+                # created meanwhile by a concurrent process:
+                if not os.path.isdir(sourceDir):
+                    raise
+
         xy = self.cornerCoordinates
         xp = L2A_XmlParser(self.config, 'T2A')
         tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
@@ -1687,102 +1459,43 @@ class L2A_Tables(object):
         for i in lons:
             for j in range(latMinId, latMaxId+1):
                 tifFn = 'srtm_{:0>2d}_{:0>2d}.tif'.format(i,j)
-                zipFn = 'srtm_{:0>2d}_{:0>2d}.zip'.format(i,j)
+                if not fetchSrtm(self.config.demReference, sourceDir, tifFn, self._tmpdir, self.logger):
+                    return False
 
-                try: # does the tiff file already exist?
-                    with open (os.path.join(sourceDir, tifFn)) as fp:
-                        self.logger.info('Dem exists: %s', tifFn)
-                        continue
+        # step 1: performing mosaicking, if needed:
+        centerLong = lonMin > lonMax # Fix for SIIMPC-944 VD-JL - International Date Line handling for DEM mosaicking
 
-                except IOError:
-                    try:
-                        # zipfile needs to be downloaded ...
-                        self.logger.info('read zipfile: %s', zipFn)
-                        prefix = self.config._demReference
-                        self.logger.stream(
-                            'Trying to retrieve DEM from URL %s this may take some time ...', prefix)
-                        self.logger.info('Trying to retrieve DEM from URL: %s', prefix)
-                        url = prefix + zipFn
-                        webFile = urllib.urlopen(url)
-                        localFile = open(os.path.join(tmpDir, url.split('/')[-1]), 'wb')
-                        localFile.write(webFile.read())
-                        webFile.close()
-                        localFile.close()
-                        self.logger.info('zipfile downloaded: %s', zipFn)
-                    except Exception as e:
-                        self.logger.error(e)
-                        self.logger.error('Download error %s, flat surface will be used')
-                        return False
-                    try:
-                        zipf = zipfile.ZipFile(localFile.name, mode='r')
-                    except Exception as e:
-                        self.logger.error(e)
-                        self.logger.error('DEM not available, flat surface will be used')
-                        try:
-                            os.remove(localFile.name)
-                        except:
-                            pass
-                        return False
-                    if (zipf.testzip() == None):
-                        try:
-                            zipf.extract(tifFn, sourceDir)
-                            zipf.close()
-                            self.logger.info('DEM unpacked and moved: %s', tifFn)
-                            os.remove(localFile.name)
-                            self.logger.info('zipfile removed: %s', localFile.name)
-                        except Exception as e:
-                            self.logger.error(e)
-                            self.logger.error('Extraction error for DEM: %', localFile.name)
-
-                        # fix for SIIMPC-577, UMW:
-                        self.SIIMPC_577(os.path.join(sourceDir, tifFn))
-                        # end fix for SIIMPC-577
-                        continue
-
-        # step 1: performing mosaicking, if needed:
-        if lonMin <= lonMax: # Fix for SIIMPC-944 VD-JL - International Date Line handling for DEM mosaicking
-            command = 'gdalwarp '
-        else:
-            command = 'gdalwarp -t_srs EPSG:4326 --config CENTER_LONG 180 '
-        # end of fix for SIIMPC-944
-
-        arguments = '-ot Int16 '
-
-        if(lonMinId == lonMaxId) & (latMinId == latMaxId):
-            srtmf_src = os.path.join(sourceDir,'srtm_{:0>2d}_{:0>2d}.tif'.format(i,j))
+        tifFns = []
+        for i in lons:
+            for j in range(latMinId, latMaxId+1):
+                tifFns.append(os.path.join(sourceDir,'srtm_{:0>2d}_{:0>2d}.tif'.format(i,j)))
+        vrtFn = os.path.join(sourceDir, SRTM_VRT)
+
+        if (not centerLong) and vrtCovers(vrtFn, tifFns):
+            # the footprint of the tile is read from the VRT mosaic created by L2A_Dem (sen2cor-dem):
+            self.logger.info('DEM read from VRT: %s', vrtFn)
+            srtm_src = self.gdalTranslate(vrtFn, projWin=self.getDemWindow(tg), outputType=gdal.GDT_Int16)
+        elif(lonMinId == lonMaxId) & (latMinId == latMaxId):
+            # copied into memory, as it is modified below:
+            srtm_src = self.gdalTranslate(tifFns[0])
         else:
             # more than 1 DEM needs to be concatenated:
-            for i in lons:
-                for j in range(latMinId, latMaxId+1):
-                    tifFn = os.path.join(sourceDir,'srtm_{:0>2d}_{:0>2d}.tif'.format(i,j))
-                    arguments += tifFn + ' '
-
-            srtmf_src = os.path.join(tmpDir, 'srtm_' + self.config.L2A_TILE_ID + '_src.tif')
-            isTemporary = True
-            callstr = command + arguments + srtmf_src + self._DEV0
-            l.acquire()
-            try:
-                p = subprocess.Popen(callstr, shell=self._SHELL)
-                p.wait()
-            except Exception as e:
-                self.logger.fatal(e, exc_info=True)
-                self.logger.fatal('shell execution error using gdalwarp')
-                os.remove(srtmf_src)
-                return False
-            finally:
-                l.release()
+            options = {'outputType': gdal.GDT_Int16}
+            if centerLong:
+                options['dstSRS'] = 'EPSG:4326'
+            srtm_src = self.gdalWarp(tifFns, centerLong, **options)
+        if srtm_src is None:
+            self.logger.fatal('execution error using gdalwarp')
+            return False
 
         # The following fix (fix for SIIMPC-550, UMW)
         # needs to be performed on original srtm tiff data
         # i.e. moved before reprojection and resizing (see Jira SIIMPC-550 discussion)
         # done here ...
         # fix for SIIMPC-550, UMW:
-        src_ds = gdal.Open(srtmf_src, GA_Update)
-        if src_ds is None:
-            return False
-        src_band = src_ds.GetRasterBand(1)
-        rows = src_ds.RasterYSize
-        cols = src_ds.RasterXSize
+        src_band = srtm_src.GetRasterBand(1)
+        rows = srtm_src.RasterYSize
+        cols = srtm_src.RasterXSize
         src_arr = src_band.ReadAsArray(0,0,cols,rows)
         NODATA_DEM = -32768
 
@@ -1799,85 +1512,100 @@ class L2A_Tables(object):
         src_arr[(src_arr == NODATA_DEM)] = 0
         src_band.WriteArray(src_arr, 0, 0)
         src_band.FlushCache()
-        src_ds = None
+        del src_arr
         # end fix for SIIMPC-550
 
         # step 3: performing the resizing:
-        hcsCode = tg.HORIZONTAL_CS_CODE.text
-        t_srs = '-t_srs ' + hcsCode
- 
-        te = ' -te %f %f %f %f' % (xy[0,0], xy[2,1], xy[2,0], xy[0,1])
-        tr = ' -tr %d %d' % (self._resolution, self._resolution)
-        t_warp = te + tr + ' -r cubicspline '
         # fix for SIIMPC-792, JL:
-        arguments = '-ot Float32 '
+        srtm_dem = self.gdalWarp(srtm_src, centerLong, outputType=gdal.GDT_Float32,
+                                 **self.getTileWarpOptions(tg, 'cubicspline'))
         # end of fix for SIIMPC-792
-
-        srtmf_dst = os.path.join(tmpDir, 'srtm_' + self.config.L2A_TILE_ID + '_dem.tif')
-        callstr = command + arguments + t_srs + t_warp + srtmf_src + ' ' + srtmf_dst + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except:
+        srtm_src = None
+        if srtm_dem is None:
             self.logger.fatal('Error reading DEM, flat surface will be used')
-            os.remove(srtmf_src)
             return False
-        finally:
-            l.release()
 
         # fix for SIIMPC-792, JL:
-        command = 'gdal_translate '
-        arguments = '-ot Int16 '
-        srtmf_dst_int16 = os.path.join(tmpDir, 'srtm_' + self.config.L2A_TILE_ID + '_dem_int16.tif')
-        callstr = command + arguments + srtmf_dst + ' ' + srtmf_dst_int16 + self._DEV0
-        l.acquire()
-        try:
-            p = subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
-        except Exception as e:
-            self.logger.fatal(e, exc_info=True)
+        srtm_int16 = self.gdalTranslate(srtm_dem, outputType=gdal.GDT_Int16)
+        if srtm_int16 is None:
             self.logger.fatal('Error reading DEM, flat surface will be used')
-            os.remove(srtmf_src)
             return False
-        finally:
-            l.release()
-        # end of fix for SIIMPC-792
-
-        self.importBandRes(self.DEM, srtmf_dst_int16)  # fix for SIIMPC-792, JL, srtmf_dst_int16
-        if isTemporary:
-            os.remove(srtmf_src)
-        # fix for SIIMPC-792, JL
-        os.remove(srtmf_dst_int16)  # check if needed (JL)
         # end of fix for SIIMPC-792
 
+        self.importBandRes(self.DEM, srtm_int16)  # fix for SIIMPC-792, JL
         self.logger.info('DEM received and prepared')
-        return srtmf_dst
+        return srtm_dem
 
+    def getTileWarpOptions(self, tg, resampleAlg):
+        # gdal.Warp options for the geometry of the tile, or of the region of interest:
+        xy = self.cornerCoordinates
+        return {'dstSRS': tg.HORIZONTAL_CS_CODE.text,
+                'outputBounds': (xy[0,0], xy[2,1], xy[2,0], xy[0,1]),
+                'xRes': self._resolution, 'yRes': self._resolution,
+                'resampleAlg': resampleAlg}
+
+    def gdalWarp(self, src, centerLong=False, **options):
+        # gdalwarp in-process into an in-memory dataset, None on failure.
+        # centerLong: for sources crossing the International Date Line, the option is local to the process:
+        try:
+            if centerLong:
+                gdal.SetConfigOption('CENTER_LONG', '180')
+            return gdal.Warp('', src, format='MEM', **options)
+        except Exception as e:
+            self.logger.error(e)
+            return None
+        finally:
+            if centerLong:
+                gdal.SetConfigOption('CENTER_LONG', None)
 
-    def SIIMPC_577(self, filename):
-        # fix for SIIMPC-577, UMW:
-        dataset = gdal.Open(filename, gdal.GA_Update)
-        if dataset is None:
-            return False
+    def gdalTranslate(self, src, **options):
+        # gdal_translate in-process into an in-memory dataset, None on failure:
+        try:
+            return gdal.Translate('', src, format='MEM', **options)
+        except Exception as e:
+            self.logger.error(e)
+            return None
+
+    def gdalCCI(self, source, tg, resampleAlg):
+        # extraction and reprojection of an ESA CCI map into the tile geometry, None on failure:
+        xy = self.cornerCoordinates
+        hcsName = tg.HORIZONTAL_CS_NAME.text
+        zone = hcsName.split()[4]
+        zone1 = int(zone[:-1])
+        zone2 = zone[-1:].upper()
+        lonMin, latMin, dummy = transform_utm_to_wgs84(xy[1,0], xy[1,1], zone1, zone2)
+        lonMax, latMax, dummy = transform_utm_to_wgs84(xy[3,0], xy[3,1], zone1, zone2)
 
-        # display current
-        self.logger.info('Driver: %s / %s' % (dataset.GetDriver().ShortName, dataset.GetDriver().LongName))
-        self.logger.info('Size is: %d x %d x %d' % (dataset.RasterXSize, dataset.RasterYSize, dataset.RasterCount))
-        self.logger.info('Projection is: %s' % dataset.GetProjection())
-        geotransform = dataset.GetGeoTransform()
-        self.logger.info('Origin = (%f, %f)' % (geotransform[0], geotransform[3]))
-        self.logger.info('Pixel Size = (%f, %f)' % (geotransform[1], geotransform[5]))
-        dataset.SetGeoTransform(
-            [geotransform[0] - geotransform[1] / 2, geotransform[1], geotransform[2],
-             geotransform[3] + geotransform[5] / 2, geotransform[4], geotransform[5]])
-
-        geotransform = dataset.GetGeoTransform()
-        self.logger.info('Origin = (%f, %f)' % (geotransform[0], geotransform[3]))
-        self.logger.info('Pixel Size = (%f, %f)' % (geotransform[1], geotransform[5]))
-        dataset = None
+        # step 1: check if the S2 tile crosses the International Date Line:
+        if lonMin > lonMax:
+            self.logger.warning('International Date Line is crossed, ESA CCI map reframing is performed')
+            ymin = clip(latMin - 0.5, -90.0, 90.0)
+            ymax = clip(latMax + 0.5, -90.0, 90.0)
+            east = self.gdalWarp(source, outputBounds=(178.5, ymin, 180, ymax))
+            west = self.gdalWarp(source, outputBounds=(-180, ymin, -178.5, ymax))
+            if (east is None) or (west is None):
+                self.logger.warning('Cannot perform reframing of ESA CCI map')
+                return None
+            source = self.gdalWarp([west, east], True, dstSRS='EPSG:4326')
+            if source is None:
+                self.logger.warning('Cannot perform reframing of ESA CCI map')
+                return None
+
+        # step 2: extraction and reprojection into S2 tile geometry:
+        return self.gdalWarp(source, **self.getTileWarpOptions(tg, resampleAlg))
 
-        return True
+
+    def getDemWindow(self, tg):
+        # footprint of the tile in degrees with a margin, as projWin (ulx, uly, lrx, lry):
+        xy = self.cornerCoordinates
+        hcsName = tg.HORIZONTAL_CS_NAME.text
+        zone = hcsName.split()[4]
+        zone1 = int(zone[:-1])
+        zone2 = zone[-1:].upper()
+        corners = [transform_utm_to_wgs84(x, y, zone1, zone2) for x, y in xy]
+        lons = [c[0] for c in corners]
+        lats = [c[1] for c in corners]
+        return [min(lons) - MARGIN, max(lats) + MARGIN, max(lons) + MARGIN, min(lats) - MARGIN]
 
     def fileExists(self, filename):
         counter = 0
@@ -1896,162 +1624,462 @@ class L2A_Tables(object):
                 continue
 
 
-    def gdalDEM_Shade(self, demfile):
-        sdwfile = demfile.replace('_dem', '_sdw')
-        
-        altitude = 90.0 - float32(mean(self.config.solze_arr))
-        azimuth = float32(mean(self.config.solaz_arr))
-        command = 'gdaldem hillshade '
-        options = '-compute_edges -az ' + str(azimuth) + ' -alt ' + str(altitude)
-        callstr = command + options + ' ' + demfile + ' ' + sdwfile + self._DEV0
-        l.acquire()
+    def getSunPosition(self):
+        # sun azimuth and altitude for the hill shadow, the tile mean or per pixel:
+        solaz_arr = self.config.solaz_arr
+        solze_arr = self.config.solze_arr
+        if (self.config.demShadeSunAngles == 'GRID') and isinstance(solaz_arr, ndarray) and isinstance(solze_arr, ndarray):
+            step, rowOffset, colOffset = self.config.getSunGridGeometry()
+            scale = self._resolution / step
+            azimuth = sunAngleStrips(solaz_arr, self.config.ncols, scale, rowOffset / step, colOffset / step)
+            zenith = sunAngleStrips(solze_arr, self.config.ncols, scale, rowOffset / step, colOffset / step)
+            altitude = lambda row0, row1: 90.0 - zenith(row0, row1)
+            return azimuth, altitude
+        altitude = 90.0 - float32(mean(solze_arr))
+        azimuth = float32(mean(solaz_arr))
+        return azimuth, altitude
+
+    def importTerrain(self, dem, cached):
+        # hill shadow, and slope and aspect if not read from the aux cache,
+        # computed from the DEM in one pass with Horn's method, as gdaldem -compute_edges:
         try:
-            p =subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
+            demArr = dem.GetRasterBand(1).ReadAsArray()
+            azimuth, altitude = self.getSunPosition()
+            slp, asp, sdw = hornTerrain(demArr, self._resolution, azimuth, altitude,
+                                        slope=not cached, aspect=(not cached) and (self._resolution > 10))
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
-            self.logger.fatal('shell execution error using gdaldem shade')
             return False
-        finally:
-            l.release()
 
-        self.importBandRes(self.SDW, sdwfile)
-        os.remove(sdwfile)
+        self.importBandRes(self.SDW, sdw)
+        if not cached:
+            self.importBandRes(self.SLP, slp)
+            if asp is not None:
+                self.importBandRes(self.ASP, asp)
+            self.putCachedDem(demArr, slp, asp)
         return True
 
+    def getAuxCacheKey(self, tg):
+        # the tile, and an identification of the target grid and the DEM source:
+        match = re.search('_(T[0-9]{2}[A-Z]{3})_', self.config.L2A_TILE_ID + '_')
+        tileId = match.group(1) if match else 'TILE'
+        demDir = os.path.abspath(os.path.join(self.config.home, self.config.demDirectory))
+        ident = json.dumps([self.getTileWarpOptions(tg, 'cubicspline'), demDir, self.config.demReference], sort_keys=True)
+        return tileId, ident
+
+    def getCachedDem(self):
+        # imports DEM, slope and aspect from the aux cache, returns the DEM as in-memory dataset or None:
+        if not self._auxCache.enabled:
+            return None
+        xp = L2A_XmlParser(self.config, 'T2A')
+        tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
+        tileId, ident = self.getAuxCacheKey(tg)
+        # an entry of another tile size is ignored:
+        cached = self._auxCache.get(tileId, self._resolution, ident, (self.config.nrows, self.config.ncols))
+        if (cached is None) or ((self._resolution > 10) and ('ASP' not in cached)):
+            return None
 
-    def gdalDEM_Slope(self, demfile):
-        slpfile = demfile.replace('_dem', '_slp')
-                
-        command = 'gdaldem slope '
-        options = '-compute_edges'
-        callstr = command + options + ' ' + demfile + ' ' + slpfile + self._DEV0
-
-        l.acquire()
+        dem = gdal.GetDriverByName('MEM').Create('', self.config.ncols, self.config.nrows, 1, gdal.GDT_Float32)
+        xy = self.cornerCoordinates
+        dem.SetGeoTransform((xy[0,0], self._resolution, 0, xy[0,1], 0, -self._resolution))
+        srs = osr.SpatialReference()
+        srs.SetFromUserInput(tg.HORIZONTAL_CS_CODE.text)
+        dem.SetProjection(srs.ExportToWkt())
+        dem.GetRasterBand(1).WriteArray(cached['DEM'])
+        dem_int16 = self.gdalTranslate(dem, outputType=gdal.GDT_Int16)
+        if dem_int16 is None:
+            return None
+
+        self.importBandRes(self.DEM, dem_int16)
+        self.importBandRes(self.SLP, cached['SLP'])
+        if 'ASP' in cached:
+            self.importBandRes(self.ASP, cached['ASP'])
+        self.config.demType = str(cached['TYPE'])
+        self.logger.info('DEM, slope and aspect read from aux cache for tile %s' % tileId)
+        return dem
+
+    def putCachedDem(self, demArr, slp, asp):
+        if not self._auxCache.enabled:
+            return
+        xp = L2A_XmlParser(self.config, 'T2A')
+        tg = xp.getTree('Geometric_Info', 'Tile_Geocoding')
+        tileId, ident = self.getAuxCacheKey(tg)
+        arrays = {'DEM': demArr, 'SLP': slp, 'TYPE': array(self.config.demType)}
+        if asp is not None:
+            arrays['ASP'] = asp
         try:
-            p =subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
+            self._auxCache.put(tileId, self._resolution, ident, arrays)
         except Exception as e:
-            self.logger.fatal(e, exc_info=True)
-            self.logger.fatal('shell execution error using gdaldem slope')
-            return False
-        finally:
-            l.release()
+            self.logger.warning('DEM cannot be added to aux cache: %s' % e)
+        return
 
-        self.importBandRes(self.SLP, slpfile)
-        os.remove(slpfile)
-        return True
+    def importBandImg(self, index, filename):
+        bandName = self.getBandNameFromIndex(index)
+        if self.hasBand(index):
+            # avoid reread of already existing reflectance bands:
+            self.logger.info('L2A_Tables: band ' + bandName + ' already present')
+            return True
+        if self._decodeCache.enabled and self.importCachedBand(index, filename):
+            return True
+        return self.writeTask((index, filename, None, True, True), self.decodeBandImg(index, filename))
 
+    def setDecoderThreads(self):
+        warnings.filterwarnings("ignore")
+        if self.config.nrThreads == 'AUTO':
+            nrThreads = cpu_count()
+        else:
+            nrThreads = int(self.config.nrThreads)
+        # the OpenJPEG threads are shared between the concurrent decoders:
+        nrThreads = max(1, nrThreads // self.config.nrDecodeThreads)
+        try: # to be compatible with OpenJPEG < 2.3:
+            glymur.set_option('lib.num_threads', nrThreads)
+        except:
+            pass
+        return
 
-    def gdalDEM_Aspect(self, demfile):
-        aspfile = demfile.replace('_dem', '_asp')
-        command = 'gdaldem aspect '
-        options = '-compute_edges'
-        callstr = command + options + ' ' + demfile + ' ' + aspfile + self._DEV0
+    def getStrips(self, filename):
+        # returns the strips of JPEG-2000 tile rows as (first row, last row + 1, first col, last col + 1, step),
+        # or None if the band is read as a whole:
+        if self.config.TESTMODE or not fnmatch.fnmatch(filename, '*.jp2'):
+            return None
+        try:
+            jp2 = glymur.Jp2k(filename)
+            # the SIZ segment follows the SOC marker:
+            tileRows = jp2.codestream.segment[1].ytsiz
+        except:
+            return None
+        step = self.getImportStep(jp2)
+        row0, row1, col0, col1 = self.getImportWindow(jp2.shape)
+        if tileRows % step != 0:
+            # the strips would not line up with the reduced resolution grid:
+            tileRows = jp2.shape[0]
+        strips = []
+        row = row0
+        while row < row1:
+            # a strip ends at the next tile row boundary:
+            end = min((row // tileRows + 1) * tileRows, row1)
+            strips.append((row, end, col0, col1, step))
+            row = end
+        return strips
+
+    def getImportWindow(self, shape):
+        # returns (first row, last row + 1, first col, last col + 1) of a band of the given tile shape
+        # to be imported, this is the region of interest if one is selected:
+        window = self.config.getRoiWindow(shape[0])
+        if window is None:
+            return 0, shape[0], 0, shape[1]
+        row, col, nrows, ncols = window
+        return row, row + nrows, col, col + ncols
+
+    def getImportShape(self, filename, default):
+        # the shape a band is imported with, default if it cannot be determined:
+        if self.config.TESTMODE:
+            return default
+        try:
+            jp2 = glymur.Jp2k(filename)
+        except:
+            return default
+        step = self.getImportStep(jp2)
+        row0, row1, col0, col1 = self.getImportWindow(jp2.shape)
+        return (-(-(row1 - row0) // step), -(-(col1 - col0) // step))
+
+    def getDecodeVariant(self, jp2):
+        # the decode cache keeps the bands per decoding step and region of interest:
+        step = self.getImportStep(jp2)
+        window = self.config.getRoiWindow(jp2.shape[0])
+        if window is None:
+            return step
+        return '%d:%d,%d,%d,%d' % ((step,) + window)
+
+    def decodeTask(self, index, filename, strip):
+        if strip is None:
+            return self.decodeBandImg(index, filename)
+        return self.decodeBandStrip(filename, strip)
+
+    def writeTask(self, task, decoded):
+        index, filename, strip, first, last = task
+        if strip is None:
+            if not self.writeBandImg(index, decoded):
+                return False
+            if self._decodeCache.enabled and not self.config.TESTMODE and fnmatch.fnmatch(filename, '*.jp2'):
+                try:
+                    self._decodeCache.put(filename, self.getDecodeVariant(glymur.Jp2k(filename)), decoded[0])
+                except Exception as e:
+                    self.logger.warning('cannot add band to decode cache: %s' % e)
+            return True
+        return self.writeBandStrip(index, filename, strip, decoded, first, last)
 
-        l.acquire()
+    def decodeBandStrip(self, filename, strip):
+        row0, row1, col0, col1, step = strip
         try:
-            p =subprocess.Popen(callstr, shell=self._SHELL)
-            p.wait()
+            self.setDecoderThreads()
+            jp2 = glymur.Jp2k(filename)
+            if step > 1:
+                # a stride of a power of 2 is decoded by glymur from the reduced resolution level:
+                return jp2[row0:row1:step, col0:col1:step]
+            return jp2[row0:row1, col0:col1]
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
-            self.logger.fatal('shell execution error using gdaldem aspect')
             return False
-        finally:
-            l.release()
-
-        self.importBandRes(self.ASP, aspfile)
-        os.remove(aspfile)
-        return True
 
-    def importBandImg(self, index, filename):
-        h5file = None
+    def writeBandStrip(self, index, filename, strip, data, first, last):
         bandName = self.getBandNameFromIndex(index)
-        if self.hasBand(index):
-            # avoid reread of already existing reflectance bands:
-            self.logger.info('L2A_Tables: band ' + bandName + ' already present')
-            return True
-        if fnmatch.fnmatch(filename,'*.tif'):
-            # the new input for JP2 data (or TIFF in raw mode):
-            ds = gdal.Open(filename, GA_ReadOnly)
-            indataset = ds.GetRasterBand(1).ReadAsArray()
-        else:
-            warnings.filterwarnings("ignore")
-            if self.config.nrThreads == 'AUTO':
-                nrThreads = cpu_count()
+        if data is False:
+            self.logger.fatal('decoding of band ' + bandName + ' failed')
+            return False
+        try:
+            if first:
+                jp2 = glymur.Jp2k(filename)
+                shape = self.getImportShape(filename, None)
+                if index in [0, 1, 5]:
+                    geobox = jp2.box[3]
+                else:
+                    geobox = None
+                variant = self.getDecodeVariant(jp2)
+                self._bandCache.invalidate(index)
+                self.removePyramid(index)
+                self._bandStore.createNode(self._imgdb, '/arrays', bandName, self.setDataType(data.dtype), shape)
+                self._ingest[index] = {'shape': shape, 'geobox': geobox, 'stats': L2A_BandStatistics(), 'row': 0,
+                                       'variant': variant,
+                                       'cache': self.createDecodeCacheEntry(filename, variant, shape, data.dtype)}
+            ingest = self._ingest[index]
+            self._bandStore.appendNode(self._imgdb, '/arrays', bandName, data)
+            ingest['stats'].update(data)
+            self.addToNoDataMask(ingest['shape'], ingest['row'], data)
+            if ingest['cache'] is not None:
+                ingest['cache'][ingest['row']:ingest['row'] + data.shape[0]] = data
+            ingest['row'] += data.shape[0]
+            if not last:
+                return True
+            del self._ingest[index]
+            self._bandStore.finishNode(self._imgdb, '/arrays', bandName)
+            if ingest.pop('cache') is not None:
+                self._decodeCache.commit(filename, ingest['variant'])
+            return self.finishBandImg(index, ingest)
+        except Exception as e:
+            self.logger.fatal(e, exc_info=True)
+            # no partial band must be left behind:
+            ingest = self._ingest.pop(index, None)
+            if (ingest is not None) and (ingest.pop('cache') is not None):
+                self._decodeCache.discard(filename, ingest['variant'])
+            self.removeBandImg(index)
+            return False
+
+    def createDecodeCacheEntry(self, filename, variant, shape, dtype):
+        try:
+            return self._decodeCache.create(filename, variant, shape, dtype)
+        except Exception as e:
+            self.logger.warning('cannot add band to decode cache: %s' % e)
+            return None
+
+    def importCachedBand(self, index, filename):
+        # returns True if the band was taken from the decode cache:
+        if self.config.TESTMODE or not fnmatch.fnmatch(filename, '*.jp2'):
+            return False
+        try:
+            jp2 = glymur.Jp2k(filename)
+            array = self._decodeCache.get(filename, self.getDecodeVariant(jp2))
+            if array is None:
+                return False
+            if index in [0, 1, 5]:
+                geobox = jp2.box[3]
             else:
-                nrThreads = int(self.config.nrThreads)
-            try: # to be compatible with OpenJPEG < 2.3:
-                glymur.set_option('lib.num_threads', nrThreads)
-            except:
-                pass
-            indataset = glymur.Jp2k(filename)
-        if self.config.TESTMODE:
-            if (indataset.shape[0] == 183) or (indataset.shape[0] == 1830):
-                rowcol = 183
-            elif (indataset.shape[0] == 549) or (indataset.shape[0] == 5490):
-                rowcol = 549
-            elif (indataset.shape[0] == 1098) or (indataset.shape[0] ==  10980):
-                rowcol = 1098
-            src_nrows = rowcol
-            src_ncols = rowcol
-            if self._resolution == 60:
-                self.config.nrows = 183
-                self.config.ncols = 183
-            elif self._resolution == 20:
-                self.config.nrows = 549
-                self.config.ncols = 549
-            elif self._resolution == 10:
-                self.config.nrows = 1098
-                self.config.ncols = 1098
-            indataArr = indataset[0:src_nrows,0:src_ncols]
-        else:
-            src_nrows = indataset.shape[0]
-            src_ncols = indataset.shape[1]
-            indataArr = indataset[:]
+                geobox = None
+        except:
+            return False
+        self.logger.info('L2A_Tables: band ' + self.getBandNameFromIndex(index) + ' taken from decode cache')
+        return self.writeBandImg(index, (array, array.shape[0], array.shape[1], geobox))
 
-        if (indataArr.max() == 0):
+    def finishBandImg(self, index, ingest):
+        # the statistics of the band are collected while writing it
+        # and kept as attributes of the band node:
+        bandName = self.getBandNameFromIndex(index)
+        nrows, ncols = ingest['shape']
+        stats = ingest['stats'].result()
+        stats['nrows'] = nrows
+        stats['ncols'] = ncols
+        self._bandStore.setAttrs(self._imgdb, '/arrays', bandName, stats)
+        self.logger.debug('Band %s: min %s, max %s, mean %.1f, zero pixels %d',
+                          bandName, stats['min'], stats['max'], stats['mean'], stats['zeros'])
+        if (stats['max'] == 0):
             self.logger.warning('Band ' + bandName + ' does not contain any data')
 
         # update the geobox according to resolutions:
         if (index == 0):
-            self.config.set_geobox(indataset.box[3], 60)
+            self.config.set_geobox(ingest['geobox'], 60)
         elif (index == 1):
-            self.config.set_geobox(indataset.box[3], 10)
+            self.config.set_geobox(ingest['geobox'], 10)
         elif (index == 5):
-            self.config.set_geobox(indataset.box[3], 20)
+            self.config.set_geobox(ingest['geobox'], 20)
 
+        self._bandStore.setMeta(self._imgdb, bandName, nrows, ncols)
+        if (self._noDataMask is not None) and (self._noDataMask.shape == (nrows, ncols)):
+            self._noDataBands.add(index)
+        self.config.timestamp('L2A_Tables: band ' + bandName + ' imported')
+        return True
+
+    def addToNoDataMask(self, shape, row, data):
+        # only needed for the scene classification, which is not performed at 10 m:
+        if (self._resolution == 10) or (shape != (self.config.nrows, self.config.ncols)):
+            return
+        if self._noDataMask is None:
+            self._noDataMask = zeros(shape, bool)
+        self._noDataMask[row:row + data.shape[0]] |= (data == 0)
+        return
+
+    def buildNoDataMask(self):
+        # completes the union of the zero pixels of all bands and stores it packed into the image database.
+        # Bands not imported on the target grid are read resampled, if they contain zeros at all:
+        nrows = self.config.nrows
+        ncols = self.config.ncols
+        mask = self._noDataMask
+        if (mask is None) or (mask.shape != (nrows, ncols)):
+            mask = zeros((nrows, ncols), bool)
+            self._noDataBands = set()
+        for i in self.bandIndex:
+            if (i in self._noDataBands) or not self.hasBand(i):
+                continue
+            stats = self.getBandStats(i)
+            if stats and (stats['zeros'] == 0) and (stats['nrows'] >= nrows):
+                continue
+            result = self.getBandDN(i)
+            if result is False:
+                return False
+            mask |= (result[0] == 0)
+        self._noDataMask = None
+        self._noDataBands = set()
         try:
-            h5file = open_file(self._imgdb, mode='a', title =  'input bands')
-            arrays = h5file.root.arrays
-            filters = Filters(complib='zlib', complevel=self.config.db_compression_level)
-            dtOut = self.setDataType(indataArr.dtype)
-            eArray = h5file.create_earray(arrays, bandName, dtOut, (0, src_ncols), bandName, filters=filters)
-            eArray.append(indataArr)
-            table = h5file.root.metadata.META
-            particle = table.row
-            particle['bandName'] = bandName
-            particle['rasterYSize'] = src_nrows
-            particle['rasterXSize'] = src_ncols
-            particle['rasterCount'] = 1
-            particle.append()
-            table.flush()
-            self.config.timestamp('L2A_Tables: band ' + bandName + ' imported')
+            self._bandStore.writeNode(self._imgdb, '/arrays', 'NODATA', packbits(mask, axis=1), UInt8Atom())
+            self._bandStore.setAttrs(self._imgdb, '/arrays', 'NODATA', {'nrows': nrows, 'ncols': ncols})
+            self.logger.info('no data mask created, %d pixels without data' % count_nonzero(mask))
             return True
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
             return False
-        finally:
-            if h5file:
-                h5file.close()
+
+    def getNoDataMask(self):
+        # returns the union of the zero pixels of all bands of bandIndex on the target grid as boolean array,
+        # the mask is created if not present for the current resolution. False if it cannot be created:
+        nrows = self.config.nrows
+        ncols = self.config.ncols
+        try:
+            present = False
+            if self._bandStore.hasNode(self._imgdb, '/arrays', 'NODATA'):
+                attrs = self._bandStore.getAttrs(self._imgdb, '/arrays', 'NODATA')
+                present = (attrs.get('nrows') == nrows) and (attrs.get('ncols') == ncols)
+            if not present and not self.buildNoDataMask():
+                return False
+            packed = self._bandStore.readNode(self._imgdb, '/arrays', 'NODATA')
+            return unpackbits(packed, axis=1)[:, :ncols].astype(bool)
+        except Exception as e:
+            self.logger.error(e, exc_info=True)
+            return False
+
+    def decodeBandImg(self, index, filename):
+        # decodes a band without touching the band store, this can run concurrently
+        # for several bands, the decoded bands are stored by writeBandImg:
+        try:
+            if fnmatch.fnmatch(filename,'*.tif'):
+                # the new input for JP2 data (or TIFF in raw mode):
+                ds = gdal.Open(filename, GA_ReadOnly)
+                indataset = ds.GetRasterBand(1).ReadAsArray()
+            else:
+                self.setDecoderThreads()
+                indataset = glymur.Jp2k(filename)
+            row0, row1, col0, col1 = self.getImportWindow(indataset.shape)
+            if self.config.TESTMODE:
+                if (indataset.shape[0] == 183) or (indataset.shape[0] == 1830):
+                    rowcol = 183
+                elif (indataset.shape[0] == 549) or (indataset.shape[0] == 5490):
+                    rowcol = 549
+                elif (indataset.shape[0] == 1098) or (indataset.shape[0] ==  10980):
+                    rowcol = 1098
+                src_nrows = rowcol
+                src_ncols = rowcol
+                if self._resolution == 60:
+                    self.config.nrows = 183
+                    self.config.ncols = 183
+                elif self._resolution == 20:
+                    self.config.nrows = 549
+                    self.config.ncols = 549
+                elif self._resolution == 10:
+                    self.config.nrows = 1098
+                    self.config.ncols = 1098
+                indataArr = indataset[0:src_nrows,0:src_ncols]
+            else:
+                step = 1
+                if isinstance(indataset, glymur.Jp2k):
+                    step = self.getImportStep(indataset)
+                if step > 1:
+                    # a stride of a power of 2 is decoded by glymur from the reduced resolution level:
+                    indataArr = indataset[row0:row1:step, col0:col1:step]
+                else:
+                    indataArr = indataset[row0:row1, col0:col1]
+                src_nrows = indataArr.shape[0]
+                src_ncols = indataArr.shape[1]
+
+            if index in [0, 1, 5]:
+                geobox = indataset.box[3]
+            else:
+                geobox = None
+            return indataArr, src_nrows, src_ncols, geobox
+        except Exception as e:
+            self.logger.fatal(e, exc_info=True)
+            return False
+
+    def getImportStep(self, jp2):
+        if self.config.reducedResolutionDecoding:
+            row0, row1, col0, col1 = self.getImportWindow(jp2.shape)
+            return self.getDecodingStep(row1 - row0)
+        return 1
+
+    def getDecodingStep(self, src_nrows):
+        # largest power of 2 the source rows can be reduced by, without passing the target grid.
+        # Any remaining factor, e.g. 3 for 10 m bands at 60 m, is block averaged by resampleBand:
+        tgt_nrows = self.config.nrows
+        if (tgt_nrows <= 0) or (src_nrows % tgt_nrows != 0):
+            return 1
+        ratio = src_nrows // tgt_nrows
+        step = 1
+        while ratio % (step * 2) == 0:
+            step *= 2
+        return step
+
+    def writeBandImg(self, index, decoded):
+        bandName = self.getBandNameFromIndex(index)
+        if decoded is False:
+            self.logger.fatal('decoding of band ' + bandName + ' failed')
+            return False
+        indataArr, src_nrows, src_ncols, geobox = decoded
+        try:
+            dtOut = self.setDataType(indataArr.dtype)
+            self._bandCache.invalidate(index)
+            self.removePyramid(index)
+            self._bandStore.writeNode(self._imgdb, '/arrays', bandName, indataArr, dtOut)
+            stats = L2A_BandStatistics()
+            stats.update(indataArr)
+            self.addToNoDataMask((src_nrows, src_ncols), 0, indataArr)
+            ingest = {'shape': (src_nrows, src_ncols), 'geobox': geobox, 'stats': stats}
+            return self.finishBandImg(index, ingest)
+        except Exception as e:
+            self.logger.fatal(e, exc_info=True)
+            return False
 
     def importBandRes(self, index, filename):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         if ((index in[14,17,18,19]) and (self._resolution == 10)) and self.hasBand(index):
             # resample SCL, AOT, WVP, VIS and DEM related bands:
-            self.config.timestamp('L2A_Tables: band ' + bandName + ' needs to be resampled')
-            indataset = self.resampleBand(index, self.getBand(index))
+            indataset = self.getBand(index)
+            # an interrupted import may have upsampled the band already:
+            if indataset.shape[0] != self.config.nrows:
+                self.config.timestamp('L2A_Tables: band ' + bandName + ' needs to be resampled')
+                indataset = self.resampleBand(index, indataset)
+        elif isinstance(filename, gdal.Dataset):
+            # an in-memory dataset of the DEM and ESA CCI preparation:
+            indataset = filename.GetRasterBand(1).ReadAsArray()
+        elif isinstance(filename, ndarray):
+            # read from the aux cache:
+            indataset = filename
         elif fnmatch.fnmatch(filename,'*.tif'):
             # the new input for JP2 data (or TIFF in raw mode):
             ds = gdal.Open(filename, GA_ReadOnly)
@@ -2090,71 +2118,49 @@ class L2A_Tables(object):
         elif (index == 5):
             self.config.set_geobox(indataset.box[3], 20)
         try:
-            if ((index in [14, 17, 18, 19]) and (self._resolution == 10)) and self.hasBand(index):
-                h5file = open_file(self._resdb + '_tmp', mode='a', title = 'resampled bands')
-            else:
-                h5file = open_file(self._resdb, mode='a', title = 'resampled bands')
-            arrays = h5file.root.arrays
-            filters = Filters(complib='zlib', complevel=self.config.db_compression_level)
             dtOut = self.setDataType(indataArr.dtype)
-            eArray = h5file.create_earray(arrays, bandName, dtOut, (0, src_ncols), bandName, filters=filters)
-            eArray.append(indataArr)
-            table = h5file.root.metadata.META
-            particle = table.row
-            particle['bandName'] = bandName
-            particle['rasterYSize'] = src_nrows
-            particle['rasterXSize'] = src_ncols
-            particle['rasterCount'] = 1
-            particle.append()
-            table.flush()
+            self._bandCache.invalidate(index)
+            self._bandStore.writeNode(self._resdb, '/arrays', bandName, indataArr, dtOut)
+            self._bandStore.setMeta(self._resdb, bandName, src_nrows, src_ncols)
             self.config.timestamp('L2A_Tables: band ' + bandName + ' imported')
             return True
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def initTable(self, filename):
         try:
-            h5file = open_file(filename, mode='w', title =  str(self._resolution) + 'm bands')
-            group = h5file.create_group('/', 'metadata', 'metadata information')
-            h5file.create_table(group, 'META', Particle, "Meta Data")
-            h5file.create_group('/', 'arrays', 'band arrays')
-            h5file.create_group('/', 'tmp', 'temporary arrays')
+            self._bandStore.create(filename, str(self._resolution) + 'm bands')
             return True
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def resampleBand(self, index, indataArr):
         src_nrows = indataArr.shape[0]
         tgt_nrows = self.config.nrows
         if (src_nrows / tgt_nrows) == 2:
             # mean per 2x2 block of pixels of 10m band for 20m res
-            return uint16(block_reduce(indataArr, block_size=(2, 2), func=mean) + 0.5)
+            return blockMean(indataArr, 2)
         elif (src_nrows / tgt_nrows) == 3:
             # mean per 3x3 block of pixels of 20m band for 60m res
-            return uint16(block_reduce(indataArr, block_size=(3, 3), func=mean) + 0.5)
+            return blockMean(indataArr, 3)
         elif (src_nrows / tgt_nrows) == 6:
             # mean per 6x6 block of pixels of 10m band for 60m res
-            return uint16(block_reduce(indataArr, block_size=(6, 6), func=mean) + 0.5)
+            return blockMean(indataArr, 6)
         elif tgt_nrows > src_nrows:
             # upsampling is required:
-            sizeUp = tgt_nrows
+            # a region of interest may not be square:
+            tgt_ncols = self.config.ncols
             if index in [14, 17, 18, 19]:
                 # order=0 is for nearest neighbor (SCL, AOT, WVP, VIS):
-                return (skit_resize(indataArr.astype(uint16), ([sizeUp, sizeUp]), order=0) * 65535.).round().astype(uint16)
+                return upsample(indataArr, tgt_nrows, tgt_ncols, 0)
             elif (index == 10) | (index == 9):
                 # order=1 is for bi-linear interpolation (B10 upsampling from 60 m to 20 m):
-                return (skit_resize(indataArr.astype(uint16), ([sizeUp, sizeUp]), order=1) * 65535.).round().astype(uint16)
+                return upsample(indataArr, tgt_nrows, tgt_ncols, 1)
             else:
-                # order=3 is for bi-cubic spline (other bands):
-                return (skit_resize(indataArr.astype(uint16), ([sizeUp, sizeUp]), order=3) * 65535.).round().astype(uint16)
+                # order=3 is for bi-cubic interpolation (other bands):
+                return upsample(indataArr, tgt_nrows, tgt_ncols, 3)
         return
 
     def downsampleBandList_20to60_andExport(self):
@@ -2215,8 +2221,8 @@ class L2A_Tables(object):
                     filename = self._L2A_Tile_DEM_File
                     indataset = (indataset + 10000).astype(uint16)
                     # SIIMPC-1427, to be activated in a later version:
-                    # mask = self.tables.getBand(self.tables.DEM)
-                    # band[mask == self.config.noData] = self.config.noData
+                    # mask = self.getNoDataMask()
+                    # band[mask] = self.config.noData
                     # del mask
                 elif bandName == 'DDV':
                     if (self.config.ddvOutput == False):
@@ -2225,15 +2231,14 @@ class L2A_Tables(object):
                 # special treatment for scene class:
                 if bandName == 'SCL':
                     filename = self._L2A_Tile_SCL_File
-                    if self.config.TESTMODE:
-                        rowcol = 183
-                    else:
-                        rowcol = 1830
+                    # 1830 x 1830 for the whole tile, 183 x 183 in TESTMODE, else the region of interest:
+                    nrows = indataset.shape[0] // 3
+                    ncols = indataset.shape[1] // 3
                     band = median_filter(indataset, 3)
                     band = (skit_resize(band.astype(uint8),
-                        ([rowcol, rowcol]), order=0) * 255.).round().astype(uint8)
+                        ([nrows, ncols]), order=0) * 255.).round().astype(uint8)
                 elif bandName != 'TCI':  # any other band except SCL or TCI:
-                    band = uint16(block_reduce(indataset, block_size=(3, 3), func=mean) + 0.5)
+                    band = blockMean(indataset, 3)
 
                 # set to 60m resolution for creation of RGB image:
                 self._resolution = 60
@@ -2311,7 +2316,6 @@ class L2A_Tables(object):
         return result
 
     def exportBandList(self):
-        h5file = None
         sourceDir = self._L2A_bandDir
         if(os.path.exists(sourceDir) == False):
             self.logger.fatal('missing directory %s:' % sourceDir)
@@ -2379,7 +2383,7 @@ class L2A_Tables(object):
                 except:
                     pass
         try:
-            h5file = open_file(self._resdb, mode='r')
+            self._bandStore.flush()
             for index in bandIndex:
                 bandName = self.getBandNameFromIndex(index)
                 filename = self._L2A_Tile_BND_File
@@ -2408,33 +2412,35 @@ class L2A_Tables(object):
                     if(self.config.ddvOutput == False):
                         continue
                     filename = self._L2A_Tile_DDV_File
+                database = self._resdb
+                where = '/arrays'
+                name = bandName
                 if index < 13:
-                    try:
-                        node = h5file.get_node('/tmp', bandName)
-                    except:
-                        try:
-                            node = h5file.get_node('/arrays', bandName)
-                        except Exception as e:
-                            self.logger.fatal(e, exc_info=True)
-                            return False
-                elif self._resolution == 10 and (bandName == 'AOT' or bandName == 'WVP'):
-                    node = h5file.get_node('/arrays', bandName)
-                elif bandName != 'TCI':
-                    node = h5file.get_node('/arrays', bandName)
+                    if self._bandStore.hasNode(self._resdb, '/tmp', bandName):
+                        where = '/tmp'
+                    elif self._bandStore.hasNode(self._resdb, '/arrays', bandName):
+                        # a band explicitly written to the result database takes precedence:
+                        pass
+                    elif self._bandStore.hasNode(self._imgdb, '/pyramid', self.getPyramidName(index)):
+                        # a resampled L1C band:
+                        database = self._imgdb
+                        where = '/pyramid'
+                        name = self.getPyramidName(index)
+                    else:
+                        self.logger.fatal('band ' + bandName + ' not present in result database')
+                        return False
                 if (self._resolution == 60):
                     filename = filename.replace('R20', 'R60')
                     filename = filename.replace('20m', '60m')
                 if bandName != 'TCI':
-                    band = node.read()
-                    if self.config.logLevel == 'DEBUG':
-                        self.readoutStatistics(bandName)
+                    band = self._bandStore.readNode(database, where, name)
                     # fix for SIIMPC-551, to avoid negative values where OpenJPEG cannot cope with, UMW,
                     # att offset of 10.000 and convert to uint16
                     if bandName == 'DEM':
                         band = (band + 10000).astype(uint16)
                         # SIIMPC-1427, to be activated in a later version:
-                        # mask = self.tables.getBand(self.tables.DEM)
-                        # band[mask == self.config.noData] = self.config.noData
+                        # mask = self.getNoDataMask()
+                        # band[mask] = self.config.noData
                         # del mask
 
                     elif bandName == 'WVP':
@@ -2464,9 +2470,6 @@ class L2A_Tables(object):
         except Exception as e:
             self.logger.fatal(e, exc_info=True)
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
         if self.config.operationMode == 'TOOLBOX':
             # update on UP level:
@@ -2524,17 +2527,18 @@ class L2A_Tables(object):
         if not self.createRgbImages():
             result = False
         # cleanup:
-        if (self._resolution == 10) and (os.path.isfile(self._imgdb)):
-            self.logger.info("removing hd5 result database (size: %s)" % os.path.getsize(self._resdb))
-            os.remove(self._resdb)
-            self.logger.info("removing hd5 image database (size: %s)" % os.path.getsize(self._imgdb))
-            os.remove(self._imgdb)
+        if (self._resolution == 10) and self._bandStore.exists(self._imgdb):
+            self.logger.info("removing result database (size: %s)" % self._bandStore.size(self._resdb))
+            self._bandStore.remove(self._resdb)
+            self.logger.info("removing image database (size: %s)" % self._bandStore.size(self._imgdb))
+            self._bandStore.remove(self._imgdb)
+            # the tile is complete, there is nothing left to resume:
+            self.resetStages()
 
         self.config.timestamp('L2A_Tables: stop export')
         return result
 
     def updateBandInfo(self):
-        l.acquire()
         # SIITBX-64: remove unsupported bands 8 and 10:
         try:
             xp = L2A_XmlParser(self.config, 'UP2A')
@@ -2585,8 +2589,6 @@ class L2A_Tables(object):
                         bl.insert(7, b8)
         except:
             self.logger.info('Unsupported band entries already removed or not found')
-        finally:
-            l.release()
 
         # SIIMPC-1390: next lines removed for 2.7.2 to be consistent with DHUS
         return
@@ -2608,9 +2610,11 @@ class L2A_Tables(object):
         boxes_L2A = jp2_L2A.box
         if 'PVI' in filename:
             # fix wrong resolution in preview image:
-            boxes_L2A.insert(3, self.config.geoboxPvi)
+            geobox = self.config.geoboxPvi
         else:
-            boxes_L2A.insert(3, self.config.get_geobox())
+            geobox = self.config.get_geobox()
+        # the geobox of the L1C tile is moved to the region of interest, if selected:
+        boxes_L2A.insert(3, self.config.getRoiGeobox(geobox, band.shape[0], band.shape[1]))
         boxes_L2A[1] = glymur.jp2box.FileTypeBox(brand='jpx ', compatibility_list=['jpxb', 'jp2 '])
         file_L2A_geo = os.path.splitext(filename)[0] + '_geo.jp2'
         jp2_L2A.wrap(file_L2A_geo, boxes=boxes_L2A)
@@ -2634,7 +2638,7 @@ class L2A_Tables(object):
         isDDV = 'DDV' in os.path.basename(filename)
 
         if not isVIS:
-            self.generateGmlHeader(GMLFn, pvi = isPVI)   
+            self.generateGmlHeader(GMLFn, pvi = isPVI, shape = band.shape)
 
         driver = gdal.GetDriverByName('ENVI')
         if isPVI or isTCI:
@@ -2662,12 +2666,14 @@ class L2A_Tables(object):
         
         return
     
-    def generateGmlHeader(self,GMLFn, pvi = False):
+    def generateGmlHeader(self,GMLFn, pvi = False, shape = None):
 
         if pvi:
             geobox = self.config.geoboxPvi
         else:
             geobox = self.config.get_geobox()
+        if shape is not None:
+            geobox = self.config.getRoiGeobox(geobox, shape[0], shape[1])
 
         #geobox.write(fptr)
         for box in geobox.box:
@@ -2778,232 +2784,276 @@ class L2A_Tables(object):
         scaledArr[arr == 0.0] = 0
         return scaledArr
 
+    def flushBandStore(self):
+        try:
+            self._bandStore.flush()
+            return True
+        except Exception as e:
+            self.logger.fatal(e, exc_info=True)
+            return False
+
+    def closeBandStore(self):
+        try:
+            if self.config.band_cache_size > 0:
+                self.logger.info('L2A_Tables: band cache %d hits, %d misses' % (self._bandCache.hits, self._bandCache.misses))
+            self._bandCache.clear()
+            self._bandStore.close()
+            return True
+        except Exception as e:
+            self.logger.fatal(e, exc_info=True)
+            return False
+
     def testDb(self, filename):
-        h5file = None
         try:
-            h5file = open_file(filename, mode='r')
-            h5file.get_node('/arrays', 'B02')
+            self._bandStore.getNode(filename, '/arrays', 'B02')
             self.logger.info('Database ' + filename + ' exists and can be used')
             return True
         except:
             self.logger.info('Database  ' + filename + ' will be removed due to corruption')
-            os.remove(filename)
+            self._bandStore.remove(filename)
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def hasBand(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
             if index < 13:
-                h5file = open_file(self._imgdb, mode='r')
+                present = self._bandStore.hasNode(self._imgdb, '/arrays', bandName)
             else:
-                h5file = open_file(self._resdb, mode='r')
-            h5file.get_node('/arrays', bandName)
+                present = self._bandStore.hasNode(self._resdb, '/arrays', bandName)
+            if not present:
+                raise KeyError(bandName)
             self.logger.debug('Channel %s is present', self.getBandNameFromIndex(index))
             return True
         except:
             self.logger.debug('Channel %s is not available', self.getBandNameFromIndex(index))
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def getBandSize(self, index, resampled=False):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
+            # served from the band catalogue, no table scan is needed:
             if resampled:
-                h5file = open_file(self._resdb, mode='r')
+                entry = self._bandStore.getEntry(self._resdb, '/arrays', bandName)
+                if (entry is None) and (index < 13):
+                    # a resampled L1C band is kept as pyramid level in the image database:
+                    entry = self._bandStore.getEntry(self._imgdb, '/pyramid', self.getPyramidName(index))
             else:
-                h5file = open_file(self._imgdb, mode='r')
-            table = h5file.root.metadata.META
-            for x in table.iterrows():
-                if(x['bandName'] == bandName):
-                    if resampled:
-                        src_nrows = x['rasterYSize']
-                        tgt_nrows = self.config.nrows
-                        if src_nrows == tgt_nrows:
-                            nrows = x['rasterYSize']
-                            ncols = x['rasterXSize']
-                            count = x['rasterCount']
-                        elif (src_nrows / tgt_nrows) == 2:
-                            nrows = x['rasterYSize'] * 2
-                            ncols = x['rasterXSize'] * 2
-                            count = x['rasterCount'] * 2
-                        elif (src_nrows / tgt_nrows) == 3:
-                            nrows = x['rasterYSize'] * 3
-                            ncols = x['rasterXSize'] * 3
-                            count = x['rasterCount'] * 3
-                        elif (src_nrows / tgt_nrows) == 6:
-                            nrows = x['rasterYSize'] * 6
-                            ncols = x['rasterXSize'] * 6
-                            count = x['rasterCount'] * 6
-                    else:
-                        nrows = x['rasterYSize']
-                        ncols = x['rasterXSize']
-                        count = x['rasterCount']
-                    break
-            table.flush()
+                entry = self._bandStore.getEntry(self._imgdb, '/arrays', bandName)
+            nrows, ncols = entry[0]
+            count = 1
+            if resampled:
+                src_nrows = nrows
+                tgt_nrows = self.config.nrows
+                if src_nrows == tgt_nrows:
+                    pass
+                elif (src_nrows / tgt_nrows) == 2:
+                    nrows *= 2
+                    ncols *= 2
+                    count *= 2
+                elif (src_nrows / tgt_nrows) == 3:
+                    nrows *= 3
+                    ncols *= 3
+                    count *= 3
+                elif (src_nrows / tgt_nrows) == 6:
+                    nrows *= 6
+                    ncols *= 6
+                    count *= 6
+                else:
+                    return False
             return(nrows, ncols, count)
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def getBand(self, index):
         # the output is context sensitive
         # it will return TOA_reflectance (0:1) if index < 13
         # it will return the unmodified value if index > 12
-        h5file = None
+        # decoded bands are served from the band cache, if present:
+        key = (index, self._resolution)
+        array = self._bandCache.get(key)
+        if array is not None:
+            self._bandStore.statistics.record('cache_hit', self.getBandNameFromIndex(index), array.nbytes)
+            return array
+        if self.config.band_cache_size > 0:
+            self._bandStore.statistics.record('cache_miss', self.getBandNameFromIndex(index))
+        array = self.readBand(index)
+        if array is not False:
+            self._bandCache.put(key, array)
+        return array
+
+    def getBandDN(self, index):
+        # returns the stored digital numbers of a band together with the scale factor
+        # to TOA reflectance (0:1), this avoids the float32 conversion of getBand.
+        # Bands with index > 12 are returned unmodified with a scale factor of 1:
+        key = (index, self._resolution, 'DN')
+        array = self._bandCache.get(key)
+        if array is not None:
+            self._bandStore.statistics.record('cache_hit', self.getBandNameFromIndex(index), array.nbytes)
+        else:
+            if self.config.band_cache_size > 0:
+                self._bandStore.statistics.record('cache_miss', self.getBandNameFromIndex(index))
+            array = self.readBandDN(index)
+            if array is False:
+                return False
+            self._bandCache.put(key, array)
+        if index > 12:
+            return array, float32(1.0)
+        return array, float32(self.config.dnScale)
+
+    def readBand(self, index):
+        array = self.readBandDN(index)
+        if (array is False) or (index > 12):
+            return array # no further modification
+        # return reflectance value:
+        array = float32(array)
+        return (array / float32(self.config.dnScale))  # scaling from 0:1
+
+    def readBandDN(self, index):
         bandName = self.getBandNameFromIndex(index)
         try:
-            if index < 13:
-                h5file = open_file(self._imgdb, mode='r')
-                node = h5file.get_node('/arrays', bandName)
-                array = node.read()
-                h5file.close()
-                h5file = None
-                if self.config.logLevel == 'DEBUG':
-                    self.readoutStatistics(bandName)
-                src_nrows = array.shape[0]
-                tgt_nrows = self.config.nrows
-                if src_nrows == tgt_nrows:
-                    array = float32(array)
-                    return (array / float32(self.config.dnScale))  # scaling from 0:1
+            if index > 12:
+                return self.getResampledBand(index)
+            array = self._bandStore.readNode(self._imgdb, '/arrays', bandName)
+            if array.shape[0] == self.config.nrows:
+                return array
             # else:
-            resArr = self.getResampledBand(index)
-            try:
-                if resArr == False:
-                    self.config.timestamp('L2A_Tables: band ' + bandName + ' must be resampled')
-                    array = self.resampleBand(index, array)
-                    if not self.setResampledBand(index, array):
-                        return False
-            except:
-                array = resArr
+            return self.getPyramidLevel(index, array)
+        except:
+            return False
+
+    def getPyramidName(self, index):
+        return self.getBandNameFromIndex(index) + '_' + str(self._resolution) + 'm'
+
+    def getPyramidLevel(self, index, array):
+        # a L1C band is resampled from the native band only once per resolution. The levels are kept
+        # in the image database, which is shared by all resolution passes of a tile:
+        name = self.getPyramidName(index)
+        entry = self._bandStore.getEntry(self._imgdb, '/pyramid', name)
+        if (entry is not None) and (tuple(entry[0]) == (self.config.nrows, self.config.ncols)):
+            return self._bandStore.readNode(self._imgdb, '/pyramid', name)
+        self.config.timestamp('L2A_Tables: band ' + self.getBandNameFromIndex(index) + ' must be resampled')
+        level = self.resampleBand(index, array)
+        self._bandStore.writeNode(self._imgdb, '/pyramid', name, level, self.setDataType(level.dtype))
+        self.logger.debug('Resampled band ' + name + ' added to pyramid')
+        return level
+
+    def removePyramid(self, index):
+        # the levels are outdated, if the native band is imported again or removed:
+        bandName = self.getBandNameFromIndex(index)
+        for resolution in [10, 20, 60]:
+            self._bandStore.removeNode(self._imgdb, '/pyramid', bandName + '_' + str(resolution) + 'm')
+        return
+
+    def getBandWindow(self, index, rows, cols):
+        # returns the window [rows, cols] of a band, scaled as in getBand.
+        # A native band of a different resolution is resampled once as a whole,
+        # the window is then read from its pyramid level:
+        bandName = self.getBandNameFromIndex(index)
+        try:
+            filename = self._resdb
+            where = '/arrays'
+            name = bandName
+            if index < 13:
+                filename = self._imgdb
+                entry = self._bandStore.getEntry(self._imgdb, '/arrays', bandName)
+                if entry is None or entry[0][0] != self.config.nrows:
+                    where = '/pyramid'
+                    name = self.getPyramidName(index)
+                    entry = self._bandStore.getEntry(self._imgdb, where, name)
+                    if (entry is None) or (tuple(entry[0]) != (self.config.nrows, self.config.ncols)):
+                        if self.readBandDN(index) is False:
+                            return False
+            array = self._bandStore.readWindow(filename, where, name, rows, cols)
+        except:
+            return False
+        if index > 12:
+            return array # no further modification
+        # return reflectance value:
+        array = float32(array)
+        return (array / float32(self.config.dnScale))  # scaling from 0:1
 
-            if(index > 12):
-                return array # no further modification
-            else: # return reflectance value:
-                array = float32(array)
-                return (array / float32(self.config.dnScale))  # scaling from 0:1
+    def setBandWindow(self, index, rows, cols, array):
+        bandName = self.getBandNameFromIndex(index)
+        self._bandCache.invalidate(index)
+        try:
+            if not self._bandStore.hasNode(self._resdb, '/arrays', bandName):
+                # the band is created with the full tile size by the first window written,
+                # without holding it in memory:
+                dtIn = self.setDataType(array.dtype)
+                self._bandStore.allocateNode(self._resdb, '/arrays', bandName, dtIn,
+                                             (self.config.nrows, self.config.ncols))
+                self._bandStore.setMeta(self._resdb, bandName, self.config.nrows, self.config.ncols)
+                self.logger.debug('Channel %02d %s added to table', index, bandName)
+            self._bandStore.writeWindow(self._resdb, '/arrays', bandName, rows, cols, array)
+            return True
+        except:
+            return False
+
+    def getBandStats(self, index):
+        # returns the statistics collected during the import of a L1C band: count, zeros, min, max,
+        # mean, histogram and the imported size nrows, ncols. False if not available:
+        if index > 12:
+            return False
+        bandName = self.getBandNameFromIndex(index)
+        try:
+            stats = self._bandStore.getAttrs(self._imgdb, '/arrays', bandName)
+            if 'zeros' not in stats:
+                return False
+            return stats
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def getDataType(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
             if index < 13:
-                h5file = open_file(self._imgdb, mode='r')
+                entry = self._bandStore.getEntry(self._imgdb, '/arrays', bandName)
             else:
-                h5file = open_file(self._resdb, mode='r')
-            node = h5file.get_node('/arrays', bandName)
-            dt = node.dtype
+                entry = self._bandStore.getEntry(self._resdb, '/arrays', bandName)
+            dt = entry[1]
             return(dt)
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def setBand(self, index, array):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
-        if self.config.logLevel == 'DEBUG':
-            self.readoutStatistics(bandName, read = False)
+        self._bandCache.invalidate(index)
         try:
-            h5file = open_file(self._resdb, mode='a')
-            if(h5file.__contains__('/arrays/' + bandName)):
-                node = h5file.get_node('/arrays', bandName)
-                node.remove()
-
-            arr = h5file.root.arrays
             dtIn = self.setDataType(array.dtype)
-            filters = Filters(complib='zlib', complevel=self.config.db_compression_level)
-            node = h5file.create_earray(arr, bandName, dtIn, (0,array.shape[1]), bandName, filters=filters)
+            self._bandStore.writeNode(self._resdb, '/arrays', bandName, array, dtIn)
             self.logger.debug('Channel %02d %s added to table', index, self.getBandNameFromIndex(index))
-            node.append(array)
-
-            table = h5file.root.metadata.META
-            update = False
-            # if row exists, change it:
-            for row in table.iterrows():
-                if(row['bandName'] == bandName):
-                    row['rasterYSize'] = array.shape[0]
-                    row['rasterXSize'] = array.shape[1]
-                    row['rasterCount'] = 1
-                    row.update()
-                    update = True
-            # else append it:
-            if(update == False):
-                row = table.row
-                row['bandName'] = bandName
-                row['rasterYSize'] = array.shape[0]
-                row['rasterXSize'] = array.shape[1]
-                row['rasterCount'] = 1
-                row.append()
-            table.flush()
+            self._bandStore.setMeta(self._resdb, bandName, array.shape[0], array.shape[1])
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeBandImg(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
+        self._bandCache.invalidate(index)
         try:
-            h5file = open_file(self._imgdb, mode='a')
-            table = h5file.root.metadata.META
-            if(h5file.__contains__('/arrays/' + bandName)):
-                node = h5file.get_node('/arrays', bandName)
-                node.remove()
-                table.flush()
+            self.removePyramid(index)
+            if self._bandStore.removeNode(self._imgdb, '/arrays', bandName):
                 self.logger.debug('Channel %02d %s removed from table', index, self.getBandNameFromIndex(index))
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeBandRes(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
+        self._bandCache.invalidate(index)
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
-            if(h5file.__contains__('/arrays/' + bandName)):
-                node = h5file.get_node('/arrays', bandName)
-                node.remove()
-                table.flush()
+            if self._bandStore.removeNode(self._resdb, '/arrays', bandName):
                 self.logger.debug('Channel %02d %s removed from table', index, self.getBandNameFromIndex(index))
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeAllBands(self):
-        h5file = None
+        self._bandCache.clear()
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
             for index in range(0,37):
                 bandName = self.getBandNameFromIndex(index)
-                if(h5file.__contains__('/arrays/' + bandName)):
-                    node = h5file.get_node('/arrays', bandName)
-                    node.remove()
-            table.flush()
+                self._bandStore.removeNode(self._resdb, '/arrays', bandName)
             self.logger.debug('All channels removed from table')
             result = self.removeAllTmpBands()
             if result == False:
@@ -3011,149 +3061,67 @@ class L2A_Tables(object):
             return self.removeAllResampledBands()
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def getTmpBand(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
-            h5file = open_file(self._resdb, mode='r')
-            node = h5file.get_node('/tmp', bandName)
-            array = node.read()
-            if self.config.logLevel == 'DEBUG':
-                self.readoutStatistics(bandName)
+            array = self._bandStore.readNode(self._resdb, '/tmp', bandName)
             return array
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def setTmpBand(self, index, array):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
-            if(h5file.__contains__('/tmp/' + bandName)):
-                node = h5file.get_node('/tmp', bandName)
-                node.remove()
-                table.flush()
-            tmp = h5file.root.tmp
             dtIn = self.setDataType(array.dtype)
-            filters = Filters(complib='zlib', complevel=self.config.db_compression_level)
-            node = h5file.create_earray(tmp, bandName, dtIn, (0,array.shape[1]), bandName, filters=filters)
+            self._bandStore.writeNode(self._resdb, '/tmp', bandName, array, dtIn)
             self.logger.debug('Temporary channel ' + str(index) + ' added to table')
-            node.append(array)
-            if self.config.logLevel == 'DEBUG':
-                self.readoutStatistics(bandName, read = False)
-            table.flush()
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeTmpBand(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
-            if(h5file.__contains__('/tmp/' + bandName)):
-                node = h5file.get_node('/tmp', bandName)
-                node.remove()
-                table.flush()
+            if self._bandStore.removeNode(self._resdb, '/tmp', bandName):
                 self.logger.debug('Temporary channel ' + str(index) + ' removed from table')
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeAllTmpBands(self):
-        h5file = None
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
             for index in range(0,37):
                 bandName = self.getBandNameFromIndex(index)
-                if(h5file.__contains__('/tmp/' + bandName)):
-                    node = h5file.get_node('/tmp', bandName)
-                    node.remove()
-            table.flush()
+                self._bandStore.removeNode(self._resdb, '/tmp', bandName)
             self.logger.debug('All temporary bands removed from table')
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def getResampledBand(self, index):
-        h5file = None
         bandName = self.getBandNameFromIndex(index)
         try:
-            h5file = open_file(self._resdb, mode='r')
-            node = h5file.get_node('/arrays', bandName)
-            array = node.read()
-            if self.config.logLevel == 'DEBUG':
-                self.readoutStatistics(bandName)
+            if (index < 13) and not self._bandStore.hasNode(self._resdb, '/arrays', bandName):
+                # a resampled L1C band is kept as pyramid level in the image database:
+                return self._bandStore.readNode(self._imgdb, '/pyramid', self.getPyramidName(index))
+            array = self._bandStore.readNode(self._resdb, '/arrays', bandName)
             return array
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
-
-    def setResampledBand(self, index, array):
-        h5file = None
-        bandName = self.getBandNameFromIndex(index)
-        try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
-            if(h5file.__contains__('/arrays/' + bandName)):
-                node = h5file.get_node('/arrays', bandName)
-                node.remove()
-                table.flush()
-            arrays = h5file.root.arrays
-            dtIn = self.setDataType(array.dtype)
-            filters = Filters(complib='zlib', complevel=self.config.db_compression_level)
-            node = h5file.create_earray(arrays, bandName, dtIn, (0,array.shape[1]), bandName, filters=filters)
-            self.logger.debug('Resampled band ' + str(index) + ' added to table')
-            node.append(array)
-            if self.config.logLevel == 'DEBUG':
-                self.readoutStatistics(bandName, read = False)
-            table.flush()
-            return True
-        except:
-            return False
-        finally:
-            if h5file:
-                h5file.close()
 
     def removeAllResampledBands(self):
-        h5file = None
+        self._bandCache.clear()
         try:
-            h5file = open_file(self._resdb, mode='a')
-            table = h5file.root.metadata.META
             for index in range(0,37):
                 bandName = self.getBandNameFromIndex(index)
-                if(h5file.__contains__('/arrays/' + bandName)):
-                    node = h5file.get_node('/arrays', bandName)
-                    node.remove()
-            table.flush()
+                self._bandStore.removeNode(self._resdb, '/arrays', bandName)
+                if index < 13:
+                    self.removePyramid(index)
             self.logger.debug('All resampled bands removed from table')
             return True
         except:
             return False
-        finally:
-            if h5file:
-                h5file.close()
 
 
     def setDataType(self, dtIn):
@@ -3220,18 +3188,8 @@ class L2A_Tables(object):
             self.logger.info('File ' + filename + ' saved to disk')
         return
 
-    def readoutStatistics(self, bandname, read = True):
-        if read:
-            key = 'read'
-        else:
-            key ='write'
-
-        if bandname not in self.config._stat[key]:
-            self.config._stat[key][bandname] = 1
-        else:
-            self.config._stat[key][bandname] += 1
-
     def appendTile(self):
+        # the datastrip metadata is written by all tile processes of the product:
         l.acquire()
         try:
             xp = L2A_XmlParser(self.config, 'DS2A')
@@ -3262,12 +3220,7 @@ class L2A_Tables(object):
             self.logger.error('global snow map not present, snow detection will be performed')
             return True
         
-        l.acquire()
-        try:
-            img = Image.open(globalSnowMapFn)
-        finally:
-            l.release()
-            
+        img = Image.open(globalSnowMapFn)
         globalSnowMap = array(img)
         xy = self.cornerCoordinates
         xp = L2A_XmlParser(self.config, 'T2A')
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+from numpy import *
+
+# number of DEM pixels processed at once by hornTerrain:
+STRIP_PIXELS = 4 * 1024 * 1024
+
+
+def hornTerrain(dem, resolution, azimuth, altitude, slope=True, aspect=True):
+    ''' Slope, aspect and hill shade of a DEM with Horn's method, as gdaldem with -compute_edges.
+
+        dem: 2D array in the projected tile grid, resolution: pixel size in m.
+        azimuth, altitude: sun position in degrees, either scalars or functions (row0, row1)
+        returning the per-pixel angles of these rows, see sunAngleStrips.
+        The gradients are computed once in float32 by strips of rows and shared by the three products:
+        slope in degrees (float32), aspect as azimuth in degrees, -9999 for flat areas (float32)
+        and hill shade 1..255 (uint8), like the Byte output of gdaldem. Returns (slope, aspect, shade),
+        products which are not requested are None.
+    '''
+    nrows, ncols = dem.shape
+    slp = empty(dem.shape, float32) if slope else None
+    asp = empty(dem.shape, float32) if aspect else None
+    sdw = empty(dem.shape, uint8)
+    for row0, row1 in _strips(nrows, ncols):
+        gx, gy = _gradients(dem, row0, row1)
+        # the slope components of gdaldem, the rows of the image point to the south:
+        p = gx / float32(8.0 * resolution)
+        q = gy / float32(-8.0 * resolution)
+        pq = p * p
+        pq += q * q
+        if slope:
+            slp[row0:row1] = degrees(arctan(sqrt(pq)))
+        if aspect:
+            asp[row0:row1] = _aspect(gx, gy)
+        az = radians(_strip(azimuth, row0, row1)).astype(float32)
+        alt = radians(_strip(altitude, row0, row1)).astype(float32)
+        cang = (sin(alt) - cos(alt) * (q * cos(az) - p * sin(az))) * float32(254.0)
+        cang /= sqrt(pq + float32(1.0))
+        # 1 for the pixels facing away from the sun, rounded to Byte by GDAL:
+        cang = where(cang <= 0.0, float32(1.0), cang + float32(1.0))
+        sdw[row0:row1] = minimum(floor(cang + float32(0.5)), 255)
+    return slp, asp, sdw
+
+
+def sunAngleStrips(grid, ncols, scale, rowOffset=0.0, colOffset=0.0):
+    ''' Bi-linear interpolation of a sun angle grid to the pixel centres, by strips of rows.
+
+        scale: pixel size / grid step, rowOffset, colOffset: position of the first pixel edge in grid steps.
+        Pixels beyond the outer nodes get the values of these nodes. Returns a function (row0, row1)
+        returning the float32 angles of these rows, as accepted by hornTerrain.
+    '''
+    grid = asarray(grid, float64)
+    nodeRows, nodeCols = grid.shape
+    colPos = clip((arange(ncols) + 0.5) * scale + colOffset, 0, nodeCols - 1)
+    # the columns are interpolated once, one row per grid row:
+    cols = array([interp(colPos, arange(nodeCols), row) for row in grid], float32)
+
+    def strip(row0, row1):
+        if nodeRows == 1:
+            return repeat(cols, row1 - row0, axis=0)
+        rowPos = clip((arange(row0, row1) + 0.5) * scale + rowOffset, 0, nodeRows - 1)
+        first = minimum(floor(rowPos).astype(int32), nodeRows - 2)
+        weight = (rowPos - first).astype(float32)[:, newaxis]
+        return (float32(1.0) - weight) * cols[first] + weight * cols[first + 1]
+
+    return strip
+
+
+def _strip(angle, row0, row1):
+    if callable(angle):
+        return angle(row0, row1)
+    return float32(angle)
+
+
+def _strips(nrows, ncols):
+    # the first and the last row have their own edge handling in gdaldem:
+    if nrows < 3:
+        return [(row, row + 1) for row in range(nrows)]
+    # the builtins max and min are shadowed by numpy:
+    step = (STRIP_PIXELS // ncols) or 1
+    strips = [(0, 1)]
+    strips += [(row, int(minimum(row + step, nrows - 1))) for row in range(1, nrows - 1, step)]
+    strips.append((nrows - 1, nrows))
+    return strips
+
+
+def _window(dem, row0, row1):
+    # rows row0 - 1 .. row1 of the DEM with one pixel outside on each side, filled like gdaldem -compute_edges:
+    # outside rows are extrapolated linearly with the columns clamped, this is done for the first and last row only.
+    # Outside columns of the other rows are extrapolated linearly.
+    nrows, ncols = dem.shape
+    win = empty((row1 - row0 + 2, ncols + 2), float32)
+    if (nrows < 2) or (ncols < 2):
+        # gdaldem needs 2 x 2 pixels for the edges, the surface is taken as flat:
+        win[:] = dem[row0, 0]
+        return win
+    if row0 == 0:
+        win[1:3, 1:-1] = dem[0:2]
+        win[0, 1:-1] = 2 * win[1, 1:-1] - win[2, 1:-1]
+    elif row1 == nrows:
+        win[0:2, 1:-1] = dem[nrows - 2:nrows]
+        win[2, 1:-1] = 2 * win[1, 1:-1] - win[0, 1:-1]
+    else:
+        win[:, 1:-1] = dem[row0 - 1:row1 + 1]
+        win[:, 0] = 2 * win[:, 1] - win[:, 2]
+        win[:, -1] = 2 * win[:, -2] - win[:, -3]
+        return win
+    win[:, 0] = win[:, 1]
+    win[:, -1] = win[:, -2]
+    return win
+
+
+def _gradients(dem, row0, row1):
+    # Horn's weighted differences of the 3 x 3 windows, gx from west to east, gy from north to south:
+    win = _window(dem, row0, row1)
+    # smoothing across the direction of the difference, shared by both gradients:
+    vs = win[:-2] + 2 * win[1:-1] + win[2:]
+    hs = win[:, :-2] + 2 * win[:, 1:-1] + win[:, 2:]
+    gx = vs[:, :-2] - vs[:, 2:]
+    gy = hs[2:] - hs[:-2]
+    return gx, gy
+
+
+def _aspect(gx, gy):
+    # azimuth of the downslope direction in degrees as gdaldem, -9999 for flat areas:
+    asp = degrees(arctan2(gy, gx)).astype(float32)
+    asp = where(asp > 90.0, float32(450.0) - asp, float32(90.0) - asp)
+    asp[asp == 360.0] = 0.0
+    asp[(gx == 0) & (gy == 0)] = -9999.0
+    return asp
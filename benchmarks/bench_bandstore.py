@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+'''
+Benchmark of the scratch database backends: the HDF5 band store against the
+memory mapped NPY band store, for the band access pattern of a resolution pass.
+For each backend, the bands are written, read in full and read by windows,
+the wall times and the size on disk are reported.
+
+usage: python benchmarks/bench_bandstore.py [--size 5490] [--bands 13] [--dir /tmp]
+'''
+import os, sys, logging, shutil, tempfile
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+from tables import UInt16Atom
+from L2A_BandStore import L2A_BandStore, L2A_NpyBandStore
+
+
+class BenchConfig(object):
+    ''' The configuration items read by the band stores. '''
+    def __init__(self, codec='ZLIB', level=0, chunkSize=0):
+        self.logger = logging.getLogger('sen2cor.bench')
+        self._stat = None
+        self.db_compression_codec = codec
+        self.db_compression_level = level
+        self.db_chunk_size = chunkSize
+
+
+def syntheticBand(nrows, ncols, seed=0):
+    # a smooth surface with noise, compressing roughly like a 16 bit reflectance band:
+    random.seed(seed)
+    block = 61
+    coarse = random.randint(500, 4000, ((nrows // block) + 1, (ncols // block) + 1)).astype(uint16)
+    band = repeat(repeat(coarse, block, axis=0), block, axis=1)[:nrows, :ncols]
+    band += random.randint(0, 64, (nrows, ncols)).astype(uint16)
+    return ascontiguousarray(band)
+
+
+def windows(nrows, ncols, size=512):
+    return [(slice(r, min(r + size, nrows)), slice(c, min(c + size, ncols)))
+            for r in range(0, nrows, size * 3) for c in range(0, ncols, size * 3)]
+
+
+def timeStore(store, filename, bands):
+    ''' Wall times of writing, reading and window reading the bands and the size on disk. '''
+    result = {}
+    start = time()
+    store.create(filename, 'benchmark')
+    for i, band in enumerate(bands):
+        store.writeNode(filename, '/arrays', 'B%02d' % i, band, UInt16Atom())
+        store.setMeta(filename, 'B%02d' % i, band.shape[0], band.shape[1])
+    store.close(filename)
+    result['write'] = time() - start
+    start = time()
+    total = 0
+    for i in range(len(bands)):
+        # the sum forces the memory mapped pages to be read:
+        total += int(store.readNode(filename, '/arrays', 'B%02d' % i).sum(dtype=uint64))
+    store.close(filename)
+    result['read'] = time() - start
+    start = time()
+    for i, band in enumerate(bands):
+        for rows, cols in windows(band.shape[0], band.shape[1]):
+            store.readWindow(filename, '/arrays', 'B%02d' % i, rows, cols)
+    store.close(filename)
+    result['window'] = time() - start
+    result['size'] = store.size(filename)
+    store.remove(filename)
+    return result
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark of the HDF5 and NPY scratch databases.')
+    parser.add_argument('--size', type=int, default=5490, help='rows and columns of a band, 5490 for 20 m')
+    parser.add_argument('--bands', type=int, default=13, help='number of bands')
+    parser.add_argument('--dir', default=None, help='directory of the databases, e.g. on the work disk')
+    args = parser.parse_args(args)
+
+    bands = [syntheticBand(args.size, args.size, seed) for seed in range(args.bands)]
+    tmpDir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        sys.stdout.write('%-24s %10s %10s %10s %12s\n' % ('backend', 'write[s]', 'read[s]', 'window[s]', 'size[MB]'))
+        backends = [('HDF5', L2A_BandStore(BenchConfig())),
+                    ('HDF5 ZLIB:1, 1024 chunk', L2A_BandStore(BenchConfig('ZLIB', 1, 1024))),
+                    ('NPY', L2A_NpyBandStore(BenchConfig()))]
+        for name, store in backends:
+            filename = os.path.join(tmpDir, 'bench_imgdb' + store.extension)
+            result = timeStore(store, filename, bands)
+            sys.stdout.write('%-24s %10.3f %10.3f %10.3f %12.1f\n' % (name, result['write'], result['read'],
+                             result['window'], result['size'] / 1048576.0))
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+'''
+Benchmark of the HDF5 band database layouts: compression codecs and levels
+(Database_Compression_Codec, Database_Compression_Level) against chunk sizes
+(Database_Chunk_Size). For each combination, the bands are written, read in full
+and read by windows, the wall times and the size on disk are reported.
+
+usage: python benchmarks/bench_codecs.py [--size 5490] [--bands 4] [--dir /tmp]
+'''
+import os, sys, shutil, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tables import which_lib_version
+from L2A_BandStore import L2A_BandStore
+from bench_bandstore import BenchConfig, syntheticBand, timeStore
+
+# the codecs of the GIPP, with the levels benchmarked:
+CODECS = [('NONE', [0]), ('ZLIB', [1, 5]), ('BLOSC:LZ4', [1, 5]), ('BLOSC:ZSTD', [1, 5])]
+CHUNK_SIZES = [0, 256, 512, 1024]
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark of the codecs and chunk sizes of the HDF5 databases.')
+    parser.add_argument('--size', type=int, default=5490, help='rows and columns of a band, 5490 for 20 m')
+    parser.add_argument('--bands', type=int, default=4, help='number of bands')
+    parser.add_argument('--dir', default=None, help='directory of the databases, e.g. on the work disk')
+    args = parser.parse_args(args)
+
+    bands = [syntheticBand(args.size, args.size, seed) for seed in range(args.bands)]
+    tmpDir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        sys.stdout.write('%-12s %6s %6s %10s %10s %10s %12s\n' %
+                         ('codec', 'level', 'chunk', 'write[s]', 'read[s]', 'window[s]', 'size[MB]'))
+        for codec, levels in CODECS:
+            if (codec != 'NONE') and which_lib_version(codec.lower().split(':')[0]) is None:
+                sys.stdout.write('%-12s not available\n' % codec)
+                continue
+            for level in levels:
+                for chunkSize in CHUNK_SIZES:
+                    store = L2A_BandStore(BenchConfig(codec, level, chunkSize))
+                    filename = os.path.join(tmpDir, 'bench_imgdb' + store.extension)
+                    result = timeStore(store, filename, bands)
+                    sys.stdout.write('%-12s %6d %6d %10.3f %10.3f %10.3f %12.1f\n' %
+                                     (codec, level, chunkSize, result['write'], result['read'],
+                                      result['window'], result['size'] / 1048576.0))
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+'''
+Benchmark of the resamplers of L2A_Resample against the skimage based
+resampling of L2A_Tables.resampleBand they replace. Wall times, the number
+of pixels differing from the skimage result and the largest difference are reported.
+
+usage: python benchmarks/bench_resample.py [--size 5490] [--repeat 3]
+'''
+import os, sys
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+from skimage.measure import block_reduce
+from skimage.transform import resize as skit_resize
+from L2A_Resample import blockMean, upsample
+
+
+def best(repeat, function, *args):
+    # the fastest of repeat runs, and the result:
+    seconds = []
+    for i in range(repeat):
+        start = time()
+        result = function(*args)
+        seconds.append(time() - start)
+    return sorted(seconds)[0], result
+
+
+def benchBlockMean(arr, repeat):
+    for factor in [2, 3, 6]:
+        baseline = lambda a, f: uint16(block_reduce(a, (f, f), func=mean) + 0.5)
+        t0, expected = best(repeat, baseline, arr, factor)
+        t1, result = best(repeat, blockMean, arr, factor)
+        report('blockMean %d' % factor, t0, t1, result, expected)
+
+
+def benchUpsample(arr, repeat):
+    # the source bands are upsampled to the size of arr:
+    nrows, ncols = arr.shape
+    baseline = lambda a, n, m, o: (skit_resize(a.astype(uint16), [n, m], order=o) * 65535.).round().astype(uint16)
+    for factor in [2, 3, 6]:
+        src = ascontiguousarray(arr[::factor, ::factor])
+        for order in [0, 1, 3]:
+            t0, expected = best(repeat, baseline, src, nrows, ncols, order)
+            t1, result = best(repeat, upsample, src, nrows, ncols, order)
+            report('upsample %d order %d' % (factor, order), t0, t1, result, expected)
+
+
+def report(name, t0, t1, result, expected):
+    diff = abs(result.astype(int32) - expected)
+    sys.stdout.write('%-20s %12.3f %12.3f %8.1f %10d %8d\n' % (name, t0, t1, t0 / t1, count_nonzero(diff), diff.max()))
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark of the resamplers of L2A_Resample.')
+    parser.add_argument('--size', type=int, default=5490, help='rows and columns of the source band')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per resampler, the fastest is reported')
+    args = parser.parse_args(args)
+
+    random.seed(0)
+    # a 16 bit band with a no data border:
+    arr = random.randint(1, 10000, (args.size, args.size)).astype(uint16)
+    arr[:, :args.size // 10] = 0
+    sys.stdout.write('%-20s %12s %12s %8s %10s %8s\n' % ('resampler', 'skimage[s]', 'new[s]', 'speedup', 'differing', 'max[DN]'))
+    benchBlockMean(arr, args.repeat)
+    benchUpsample(arr, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+'''
+Equivalence check of Reduced_Resolution_Decoding: a L1C band is imported at
+a coarser target resolution once as in the baseline (full resolution decoding,
+block mean by resampleBand) and once as with Reduced_Resolution_Decoding TRUE
+(decoding of the reduced JPEG-2000 resolution level, block mean of the remaining
+factor). The differences of the DN and the TOA reflectance are reported, the
+exit status is 0 only if both are identical.
+
+The reduced resolution level is the wavelet low pass of the codestream, sampled
+at the even pixels, and not the block mean of the baseline. The results are not
+expected to be identical, this script quantifies the difference for a reference tile.
+
+usage: python benchmarks/compare_decoding.py GRANULE/.../IMG_DATA/*_B02.jp2 --resolution 20
+       python benchmarks/compare_decoding.py --synthetic 2400 --resolution 60
+'''
+import os, sys, shutil, tempfile
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+import glymur
+from L2A_Resample import blockMean
+
+# native resolution of the L1C bands by their rows, other sizes (e.g. synthetic bands) are taken as 10 m:
+NATIVE = {10980: 10, 5490: 20, 1830: 60}
+
+
+def decodingStep(src_nrows, tgt_nrows):
+    # as L2A_Tables.getDecodingStep:
+    if (tgt_nrows <= 0) or (src_nrows % tgt_nrows != 0):
+        return 1
+    ratio = src_nrows // tgt_nrows
+    step = 1
+    while ratio % (step * 2) == 0:
+        step *= 2
+    return step
+
+
+def baselineImport(jp2, ratio):
+    # full resolution decoding, block mean by resampleBand:
+    return blockMean(jp2[:], ratio)
+
+
+def reducedImport(jp2, ratio, step):
+    arr = jp2[::step, ::step]
+    if ratio // step > 1:
+        arr = blockMean(arr, ratio // step)
+    return arr
+
+
+def syntheticBand(filename, size):
+    # a smooth surface with noise and a no data border, encoded lossless as the L1C bands:
+    random.seed(0)
+    block = 40
+    coarse = random.randint(500, 4000, ((size // block) + 1, (size // block) + 1)).astype(float64)
+    band = repeat(repeat(coarse, block, axis=0), block, axis=1)[:size, :size]
+    # a moving average keeps the surface smooth:
+    for axis in [0, 1]:
+        band = (band + roll(band, 1, axis) + roll(band, -1, axis)) / 3.0
+    band += random.normal(0, 30, band.shape)
+    band = clip(band, 1, 65535).astype(uint16)
+    band[:, :size // 10] = 0
+    glymur.Jp2k(filename, data=band, numres=6)
+    return filename
+
+
+def compare(filename, resolution, dnScale):
+    jp2 = glymur.Jp2k(filename)
+    src_nrows = jp2.shape[0]
+    tgt_nrows = src_nrows * NATIVE.get(src_nrows, 10) // resolution
+    ratio = src_nrows // tgt_nrows
+    step = decodingStep(src_nrows, tgt_nrows)
+    sys.stdout.write('%s: %d rows to %d rows, ratio %d, decoding step %d\n' %
+                     (os.path.basename(filename), src_nrows, tgt_nrows, ratio, step))
+    if (ratio < 2) or (step == 1):
+        sys.stdout.write('  not decoded at reduced resolution, identical by construction\n')
+        return True
+    start = time()
+    baseline = baselineImport(jp2, ratio)
+    t0 = time() - start
+    start = time()
+    reduced = reducedImport(jp2, ratio, step)
+    t1 = time() - start
+    diff = abs(reduced.astype(int32) - baseline)
+    valid = (baseline > 0) & (reduced > 0)
+    sys.stdout.write('  time baseline %.3f s, reduced %.3f s\n' % (t0, t1))
+    sys.stdout.write('  differing pixels: %d of %d (%.2f %%)\n' % (count_nonzero(diff), diff.size,
+                     100.0 * count_nonzero(diff) / diff.size))
+    sys.stdout.write('  no data differing: %d pixels\n' % count_nonzero((baseline == 0) != (reduced == 0)))
+    if valid.any():
+        d = diff[valid]
+        sys.stdout.write('  DN, valid pixels: max %d, mean %.2f, 99th percentile %.1f\n' %
+                         (d.max(), d.mean(), percentile(d, 99)))
+        sys.stdout.write('  reflectance, valid pixels: max %.5f, mean %.5f\n' % (d.max() / dnScale, d.mean() / dnScale))
+    return not diff.any()
+
+
+def main(args=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Equivalence check of the reduced resolution decoding.')
+    parser.add_argument('bands', nargs='*', help='L1C band JPEG-2000 files')
+    parser.add_argument('--resolution', type=int, choices=[20, 60], default=20, help='target resolution in m')
+    parser.add_argument('--dn_scale', type=float, default=10000.0, help='QUANTIFICATION_VALUE of the L1C product')
+    parser.add_argument('--synthetic', type=int, metavar='SIZE', help='checks a synthetic 10 m band of SIZE rows')
+    args = parser.parse_args(args)
+
+    tmpDir = tempfile.mkdtemp()
+    try:
+        bands = list(args.bands)
+        if args.synthetic:
+            bands.append(syntheticBand(os.path.join(tmpDir, 'synthetic_B02.jp2'), args.synthetic))
+        if not bands:
+            parser.error('no bands given')
+        identical = True
+        for filename in bands:
+            identical &= compare(filename, args.resolution, args.dn_scale)
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+import L2A_BandStore
+from L2A_BandStore import L2A_AuxCache
+
+
+class TestAuxCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = L2A_AuxCache(os.path.join(self.directory, 'aux'))
+        random.seed(0)
+        self.arrays = {'DEM': random.randint(-100, 4000, (6, 7)).astype(float32),
+                       'SLP': random.random((6, 7)).astype(float32),
+                       'TYPE': array('SRTM')}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def tmpFiles(self):
+        return [fn for fn in os.listdir(self.cache._directory) if fn.endswith('.tmp')]
+
+    def test_disabled(self):
+        cache = L2A_AuxCache('NONE')
+        self.assertFalse(cache.enabled)
+        cache.put('T32TNR', 20, 'ident', self.arrays)
+        self.assertTrue(cache.get('T32TNR', 20, 'ident') is None)
+
+    def test_put_get(self):
+        self.cache.put('T32TNR', 20, 'ident', self.arrays)
+        cached = self.cache.get('T32TNR', 20, 'ident')
+        self.assertEqual(sorted(cached.keys()), ['DEM', 'SLP', 'TYPE'])
+        self.assertTrue(array_equal(cached['DEM'], self.arrays['DEM']))
+        self.assertTrue(array_equal(cached['SLP'], self.arrays['SLP']))
+        self.assertEqual(str(cached['TYPE']), 'SRTM')
+        self.assertEqual(self.tmpFiles(), [])
+
+    def test_keys(self):
+        self.cache.put('T32TNR', 20, 'ident', self.arrays)
+        self.assertTrue(self.cache.get('T32TNR', 60, 'ident') is None)
+        self.assertTrue(self.cache.get('T32TNR', 20, 'other') is None)
+        self.assertTrue(self.cache.get('T33TTG', 20, 'ident') is None)
+
+    def test_tile_size(self):
+        # an entry of another tile size, e.g. after a change of the region of interest, is ignored:
+        self.cache.put('T32TNR', 20, 'ident', self.arrays)
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident', (6, 7)) is not None)
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident', (7, 6)) is None)
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident', (12, 14)) is None)
+
+    def test_incomplete_entry(self):
+        with open(self.cache.path('T32TNR', 20, 'ident'), 'wb') as f:
+            f.write(b'PK\x03\x04 truncated')
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident') is None)
+
+    def test_write_error(self):
+        # e.g. with the disk full, the error is raised and no temporary file is left behind:
+        def savez_compressed(f, **arrays):
+            f.write(b'PK\x03\x04')
+            raise IOError(28, 'No space left on device')
+
+        original = L2A_BandStore.savez_compressed
+        L2A_BandStore.savez_compressed = savez_compressed
+        try:
+            self.assertRaises(IOError, self.cache.put, 'T32TNR', 20, 'ident', self.arrays)
+        finally:
+            L2A_BandStore.savez_compressed = original
+        self.assertEqual(self.tmpFiles(), [])
+        self.assertFalse(os.path.exists(self.cache.path('T32TNR', 20, 'ident')))
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident') is None)
+
+    def test_concurrent_put(self):
+        # an entry added by a concurrent process is kept, the rename error is not raised:
+        self.cache.put('T32TNR', 20, 'ident', self.arrays)
+        original = os.rename
+
+        def rename(src, dst):
+            raise OSError(17, 'File exists')
+
+        os.rename = rename
+        try:
+            self.cache.put('T32TNR', 20, 'ident', self.arrays)
+        finally:
+            os.rename = original
+        self.assertEqual(self.tmpFiles(), [])
+        self.assertTrue(self.cache.get('T32TNR', 20, 'ident') is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import os, sys, logging, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+from tables import UInt16Atom
+from L2A_BandStore import L2A_BandStore, L2A_NpyBandStore, replaceFile
+
+
+class Config(object):
+    # the configuration items read by the band stores:
+    def __init__(self, codec='NONE', level=0, chunkSize=0):
+        self.logger = logging.getLogger('sen2cor.test')
+        self.logger.addHandler(logging.NullHandler())
+        self._stat = None
+        self.db_compression_codec = codec
+        self.db_compression_level = level
+        self.db_chunk_size = chunkSize
+
+
+def windowsRename(src, dst, rename=os.rename):
+    # os.rename on Windows does not replace an existing file:
+    if os.path.exists(dst):
+        raise OSError(17, 'File exists', dst)
+    rename(src, dst)
+
+
+class TestNpyBandStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test_imgdb.npy')
+        self.store = L2A_NpyBandStore(Config())
+        self.store.create(self.filename, 'test')
+        self.rename = os.rename
+        os.rename = windowsRename
+
+    def tearDown(self):
+        os.rename = self.rename
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_replace_file(self):
+        src = os.path.join(self.directory, 'src')
+        dst = os.path.join(self.directory, 'dst')
+        for content in ['first', 'second']:
+            with open(src, 'w') as f:
+                f.write(content)
+            replaceFile(src, dst)
+        self.assertFalse(os.path.exists(src))
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'second')
+
+    def test_rewrite_meta(self):
+        self.store.setMeta(self.filename, 'B02', 4, 5)
+        self.store.setMeta(self.filename, 'B03', 4, 5)
+        self.store.close(self.filename)
+        self.assertEqual(sorted(self.store.listMeta(self.filename)), ['B02', 'B03'])
+
+    def test_rewrite_node(self):
+        for value in [1, 2]:
+            self.store.writeNode(self.filename, '/arrays', 'B02', full((4, 5), value, uint16), UInt16Atom())
+        self.assertTrue((self.store.readNode(self.filename, '/arrays', 'B02') == 2).all())
+
+    def test_rewrite_attrs(self):
+        self.store.writeNode(self.filename, '/arrays', 'B02', zeros((4, 5), uint16), UInt16Atom())
+        self.store.setAttrs(self.filename, '/arrays', 'B02', {'min': 0})
+        self.store.setAttrs(self.filename, '/arrays', 'B02', {'max': 0})
+        self.assertEqual(self.store.getAttrs(self.filename, '/arrays', 'B02'), {'min': 0, 'max': 0})
+
+    def test_rewrite_appended_node(self):
+        for value in [1, 2]:
+            self.store.createNode(self.filename, '/arrays', 'B02', UInt16Atom(), (4, 5))
+            for row in range(0, 4, 2):
+                self.store.appendNode(self.filename, '/arrays', 'B02', full((2, 5), value, uint16))
+            node = self.store.finishNode(self.filename, '/arrays', 'B02')
+            self.assertTrue((node == value).all())
+            del node
+
+
+class TestAllocateNode(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def stores(self):
+        return [L2A_BandStore(Config('ZLIB', 1, 64)), L2A_NpyBandStore(Config())]
+
+    def test_windows(self):
+        # a band written by windows only, as by setBandWindow:
+        window = arange(20, dtype=uint16).reshape(4, 5) + 1
+        for store in self.stores():
+            filename = os.path.join(self.directory, 'test_resdb' + store.extension)
+            store.create(filename, 'test')
+            store.allocateNode(filename, '/arrays', 'B02', UInt16Atom(), (300, 200))
+            self.assertEqual(store.getEntry(filename, '/arrays', 'B02')[:2], ((300, 200), dtype(uint16)))
+            store.writeWindow(filename, '/arrays', 'B02', slice(100, 104), slice(50, 55), window)
+            store.close(filename)
+            band = store.readNode(filename, '/arrays', 'B02')
+            self.assertEqual(band.shape, (300, 200))
+            self.assertTrue(array_equal(band[100:104, 50:55], window))
+            self.assertEqual(int(band.sum()), int(window.sum()))
+            del band
+            store.close()
+
+    def test_chunks_written(self):
+        # only the chunks of the window written are stored in the HDF5 database:
+        store = L2A_BandStore(Config('NONE', 0, 64))
+        filename = os.path.join(self.directory, 'test_resdb.h5')
+        store.create(filename, 'test')
+        node = store.allocateNode(filename, '/arrays', 'B02', UInt16Atom(), (1024, 1024))
+        store.writeWindow(filename, '/arrays', 'B02', slice(0, 64), slice(0, 64), ones((64, 64), uint16))
+        self.assertEqual(node.size_on_disk, 64 * 64 * 2)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+from L2A_Resample import blockMean
+
+try:
+    import glymur
+    if glymur.lib.openjp2.OPENJP2 is None:
+        glymur = None
+except ImportError:
+    glymur = None
+
+# Reduced_Resolution_Decoding is not radiometrically equivalent to the full resolution decoding.
+# Tolerated absolute difference in DN of the valid pixels, (mean, 99th percentile), per 10 m band
+# and target resolution. The synthetic bands stay below 2/3 of these:
+TOLERANCE = {'B02': {20: (20, 160), 60: (10, 90)},
+             'B03': {20: (30, 220), 60: (15, 110)},
+             'B04': {20: (40, 300), 60: (25, 170)},
+             'B08': {20: (75, 600), 60: (45, 380)}}
+# seed, range of the surface and noise of the synthetic bands, in DN:
+BANDS = {'B02': (2, 800, 1600, 20),
+         'B03': (3, 600, 1800, 25),
+         'B04': (4, 400, 2200, 30),
+         'B08': (8, 1500, 5000, 50)}
+SIZE = 240
+TILE_ROWS = 60
+
+
+def syntheticBand(seed, low, high, noise):
+    # a smooth surface with noise and a no data border, as the L1C bands:
+    random.seed(seed)
+    block = 40
+    coarse = random.randint(low, high, ((SIZE // block) + 1, (SIZE // block) + 1)).astype(float64)
+    band = repeat(repeat(coarse, block, axis=0), block, axis=1)[:SIZE, :SIZE]
+    for axis in [0, 1]:
+        band = (band + roll(band, 1, axis) + roll(band, -1, axis)) / 3.0
+    band += random.normal(0, noise, band.shape)
+    band = clip(band, 1, 65535).astype(uint16)
+    band[:, :SIZE // 10] = 0
+    return band
+
+
+def fullImport(jp2, ratio):
+    # full resolution decoding, block mean by resampleBand:
+    return blockMean(jp2[:], ratio)
+
+
+def reducedImport(jp2, ratio, step):
+    # decoding by strips of tile rows at the reduced resolution level, as decodeBandStrip,
+    # block mean of the remaining factor:
+    arr = vstack([jp2[row:row + TILE_ROWS:step, ::step] for row in range(0, SIZE, TILE_ROWS)])
+    if ratio // step > 1:
+        arr = blockMean(arr, ratio // step)
+    return arr
+
+
+@unittest.skipUnless(glymur, 'glymur with OpenJPEG is not available')
+class TestReducedResolutionDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def encode(self, name, band):
+        # lossless with tiles, as the L1C bands:
+        filename = os.path.join(self.directory, name + '.jp2')
+        glymur.Jp2k(filename, data=band, numres=4, tilesize=(TILE_ROWS, TILE_ROWS))
+        return glymur.Jp2k(filename)
+
+    def test_tolerance(self):
+        for name in sorted(BANDS.keys()):
+            jp2 = self.encode(name, syntheticBand(*BANDS[name]))
+            # 10 m bands: the ratio 2 for 20 m is decoded, for 60 m the remaining 3 is averaged:
+            for resolution, ratio in [(20, 2), (60, 6)]:
+                full = fullImport(jp2, ratio)
+                reduced = reducedImport(jp2, ratio, 2)
+                self.assertEqual(reduced.shape, full.shape)
+                self.assertEqual(reduced.dtype, full.dtype)
+                # the no data pixels are the same:
+                self.assertTrue(array_equal(full == 0, reduced == 0))
+                valid = full > 0
+                diff = abs(reduced[valid].astype(int32) - full[valid])
+                meanTolerance, percentileTolerance = TOLERANCE[name][resolution]
+                self.assertTrue(diff.mean() <= meanTolerance, '%s at %d m: mean %.1f DN' %
+                                (name, resolution, diff.mean()))
+                self.assertTrue(percentile(diff, 99) <= percentileTolerance, '%s at %d m: 99th percentile %.1f DN' %
+                                (name, resolution, percentile(diff, 99)))
+
+    def test_homogeneous(self):
+        # homogeneous areas are decoded identically:
+        jp2 = self.encode('flat', full((SIZE, SIZE), 1234, uint16))
+        for ratio in [2, 6]:
+            self.assertTrue(array_equal(reducedImport(jp2, ratio, 2), fullImport(jp2, ratio)))
+
+    def test_strips(self):
+        # the strips of tile rows give the band decoded at once:
+        jp2 = self.encode('B02', syntheticBand(*BANDS['B02']))
+        self.assertTrue(array_equal(reducedImport(jp2, 2, 2), jp2[::2, ::2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
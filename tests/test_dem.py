@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import os, sys, logging, shutil, struct, tempfile, unittest, urllib, zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import osgeo
+except ImportError:
+    osgeo = None
+if osgeo:
+    from L2A_Dem import *
+
+
+@unittest.skipUnless(osgeo, 'GDAL is not available')
+class TestMgrs(unittest.TestCase):
+
+    def assertBounds(self, bounds, expected):
+        # expected from the UTM corners of the 100 km squares with pyproj, including MARGIN:
+        for value, ref in zip(bounds, expected):
+            self.assertAlmostEqual(value, ref, places=3)
+
+    def test_bounds(self):
+        # Milan:
+        self.assertBounds(mgrsBounds('T32TNR'), (8.9500, 45.0067, 10.4692, 46.1036))
+        # Rome, Paris:
+        self.assertBounds(mgrsBounds('T33TTG'), (11.3052, 41.3574, 12.7733, 42.4790))
+        self.assertBounds(mgrsBounds('31UDQ'), (1.5648, 48.6068, 3.1858, 49.7025))
+
+    def test_tile_id(self):
+        self.assertEqual(mgrsBounds('32tnr'), mgrsBounds('T32TNR'))
+
+    def test_contains_tile_origin(self):
+        # upper left pixel corner of 31UDQ: 399960, 5500020 in UTM 31N:
+        lon, lat = transform_utm_to_wgs84(399960.0, 5500020.0, 31, 'N')[:2]
+        lonMin, latMin, lonMax, latMax = mgrsBounds('31UDQ')
+        self.assertTrue(lonMin < lon < lonMax)
+        self.assertTrue(latMin < lat < latMax)
+
+    def test_date_line(self):
+        # Fiji, the tile crosses the International Date Line:
+        lonMin, latMin, lonMax, latMax = mgrsBounds('T01KAB')
+        self.assertTrue(lonMin > lonMax)
+        self.assertBounds((lonMin, latMin, lonMax, latMax), (179.1896, -17.3049, -179.6651, -16.1978))
+        # the neighbour west of the date line does not cross it:
+        lonMin, latMin, lonMax, latMax = mgrsBounds('T60KYF')
+        self.assertTrue(lonMin < lonMax)
+
+    def test_srtm_tiles(self):
+        self.assertEqual(sorted(srtmTileIds(*mgrsBounds('T32TNR'))), [(38, 3), (39, 3)])
+        self.assertEqual(sorted(srtmTileIds(*mgrsBounds('T33TTG'))), [(39, 4)])
+        self.assertEqual(srtmTileName(38, 3), 'srtm_38_03.tif')
+
+    def test_srtm_tiles_date_line(self):
+        self.assertEqual(sorted(srtmTileIds(*mgrsBounds('T01KAB'))), [(1, 16), (72, 16)])
+        self.assertEqual(srtmTileIds(178.0, -17.0, -178.0, -16.0), [(72, 16), (1, 16)])
+
+    def test_srtm_coverage(self):
+        # SRTM covers the latitudes between -60 and 60 degrees only:
+        self.assertEqual(srtmTileIds(10.0, 62.0, 11.0, 63.0), [])
+        self.assertEqual(srtmTileIds(10.0, 59.0, 11.0, 61.0), [(39, 1)])
+
+
+@unittest.skipUnless(osgeo, 'GDAL is not available')
+class TestFetchSrtm(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.referenceDir = os.path.join(self.directory, 'reference')
+        self.demDir = os.path.join(self.directory, 'dem')
+        self.tmpDir = os.path.join(self.directory, 'tmp')
+        for directory in [self.referenceDir, self.demDir, self.tmpDir]:
+            os.mkdir(directory)
+        self.reference = 'file:' + urllib.pathname2url(self.referenceDir) + '/'
+        self.logger = logging.getLogger('sen2cor.test')
+        self.logger.addHandler(logging.NullHandler())
+        self.tifFn = srtmTileName(38, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def createTif(self, filename):
+        dataset = gdal.GetDriverByName('GTiff').Create(filename, 4, 4, 1, gdal.GDT_Int16)
+        dataset.SetGeoTransform((5.0, 1.25, 0.0, 50.0, 0.0, -1.25))
+        dataset.GetRasterBand(1).Fill(100)
+        dataset = None
+
+    def createZip(self, tifFn):
+        tifPath = os.path.join(self.directory, tifFn)
+        self.createTif(tifPath)
+        zipPath = os.path.join(self.referenceDir, tifFn[:-4] + '.zip')
+        with zipfile.ZipFile(zipPath, 'w', zipfile.ZIP_STORED) as zipf:
+            zipf.write(tifPath, tifFn)
+        os.remove(tifPath)
+        return zipPath
+
+    def fetch(self):
+        return fetchSrtm(self.reference, self.demDir, self.tifFn, self.tmpDir, self.logger)
+
+    def assertNoLeftovers(self):
+        self.assertEqual(os.listdir(self.tmpDir), [])
+        self.assertEqual([fn for fn in os.listdir(self.demDir) if fn.endswith('.part') or fn.endswith('.lock')], [])
+
+    def test_download(self):
+        self.createZip(self.tifFn)
+        self.assertTrue(self.fetch())
+        dataset = gdal.Open(os.path.join(self.demDir, self.tifFn))
+        # fix for SIIMPC-577, the origin is moved by half a pixel:
+        self.assertEqual(dataset.GetGeoTransform(), (4.375, 1.25, 0.0, 49.375, 0.0, -1.25))
+        dataset = None
+        self.assertNoLeftovers()
+
+    def test_existing(self):
+        # a tile present in the DEM directory is not downloaded again:
+        self.createTif(os.path.join(self.demDir, self.tifFn))
+        self.assertTrue(self.fetch())
+        dataset = gdal.Open(os.path.join(self.demDir, self.tifFn))
+        self.assertEqual(dataset.GetGeoTransform()[0], 5.0)
+        dataset = None
+        self.assertNoLeftovers()
+
+    def test_missing_tile(self):
+        # e.g. a tile over sea, which does not exist on the server:
+        self.assertFalse(self.fetch())
+        self.assertFalse(os.path.exists(os.path.join(self.demDir, self.tifFn)))
+        self.assertNoLeftovers()
+
+    def test_not_a_zip(self):
+        with open(os.path.join(self.referenceDir, self.tifFn[:-4] + '.zip'), 'wb') as f:
+            f.write(b'<html>404 Not Found</html>')
+        self.assertFalse(self.fetch())
+        self.assertFalse(os.path.exists(os.path.join(self.demDir, self.tifFn)))
+        self.assertNoLeftovers()
+
+    def test_corrupt_zip(self):
+        # a damaged member fails the CRC check of testzip:
+        zipPath = self.createZip(self.tifFn)
+        with zipfile.ZipFile(zipPath, 'r') as zipf:
+            info = zipf.getinfo(self.tifFn)
+        with open(zipPath, 'r+b') as f:
+            # the member data follows the local file header, its name and extra field:
+            f.seek(info.header_offset + 26)
+            nameLength, extraLength = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + nameLength + extraLength + info.compress_size // 2)
+            byte = f.read(1)
+            f.seek(-1, 1)
+            f.write(chr(ord(byte) ^ 0xff))
+        self.assertFalse(self.fetch())
+        self.assertFalse(os.path.exists(os.path.join(self.demDir, self.tifFn)))
+        self.assertNoLeftovers()
+
+    def test_missing_member(self):
+        # the archive does not contain the expected tile:
+        self.createZip(srtmTileName(39, 3))
+        os.rename(os.path.join(self.referenceDir, 'srtm_39_03.zip'),
+                  os.path.join(self.referenceDir, 'srtm_38_03.zip'))
+        self.assertFalse(self.fetch())
+        self.assertFalse(os.path.exists(os.path.join(self.demDir, self.tifFn)))
+        self.assertNoLeftovers()
+
+
+if __name__ == '__main__':
+    unittest.main()
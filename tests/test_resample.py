@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+from skimage.measure import block_reduce
+from skimage.transform import resize as skit_resize
+import skimage
+import L2A_Resample
+from L2A_Resample import blockMean, upsample
+
+# the upsampling of L2A_Tables.resampleBand relies on the resize defaults of skimage 0.14 (mode 'constant',
+# uint16 converted to float in 0..1), which have changed with later versions:
+SKIMAGE_014 = tuple(int(v) for v in skimage.__version__.split('.')[:2]) < (0, 15)
+
+
+def baselineBlockMean(arr, factor):
+    # the downsampling of L2A_Tables.resampleBand before blockMean:
+    return uint16(block_reduce(arr, (factor, factor), func=mean) + 0.5)
+
+
+def blockSum(arr, factor):
+    nrows, ncols = arr.shape
+    return arr.astype(int64).reshape(nrows // factor, factor, ncols // factor, factor).sum(axis=3).sum(axis=1)
+
+
+class TestBlockMean(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.stripPixels = L2A_Resample.STRIP_PIXELS
+
+    def tearDown(self):
+        L2A_Resample.STRIP_PIXELS = self.stripPixels
+
+    def assertBaseline(self, arr, factor):
+        # identical to the baseline, except for block means of exactly x.5 which the float64 mean
+        # of older skimage versions may compute as slightly less than x.5 and round down:
+        result = blockMean(arr, factor)
+        expected = baselineBlockMean(arr, factor)
+        self.assertEqual(result.dtype, uint16)
+        self.assertEqual(result.shape, expected.shape)
+        differs = result != expected
+        if differs.any():
+            n = factor * factor
+            total = blockSum(arr, factor)
+            ties = (total * 2) % (n * 2) == n
+            self.assertTrue(ties[differs].all(), 'factor %d, shape %s' % (factor, arr.shape))
+            self.assertTrue((result[differs].astype(int32) - expected[differs] == 1).all())
+        if (arr.dtype.kind == 'u') and not (array(arr.shape) % factor).any():
+            # rounded half up in integers:
+            n = factor * factor
+            self.assertTrue(array_equal(result, (blockSum(arr, factor) * 2 + n) // (n * 2)))
+
+    def test_random(self):
+        for factor in [2, 3, 6]:
+            arr = random.randint(0, 65536, (factor * 37, factor * 23)).astype(uint16)
+            self.assertBaseline(arr, factor)
+
+    def test_odd_shapes(self):
+        # divisible odd shapes and shapes which are not divisible by the factor, passed to block_reduce:
+        for factor, shape in [(3, (63, 45)), (2, (61, 95)), (3, (61, 95)), (6, (35, 13)), (6, (1, 1))]:
+            arr = random.randint(0, 65536, shape).astype(uint16)
+            self.assertBaseline(arr, factor)
+
+    def test_nodata(self):
+        # zeros of the no data area, scattered and in whole blocks:
+        for factor in [2, 3, 6]:
+            arr = random.randint(1, 10000, (factor * 20, factor * 20)).astype(uint16)
+            arr[random.random(arr.shape) < 0.2] = 0
+            arr[:factor * 5] = 0
+            arr[:, -factor * 3 - 1:] = 0
+            self.assertBaseline(arr, factor)
+
+    def test_rounding(self):
+        # block means of exactly x.5 are rounded up, the maximum does not overflow:
+        for factor in [2, 3, 6]:
+            arr = zeros((factor * 4, factor * 4), uint16)
+            arr[0, 0] = 1
+            arr[:factor, factor:2 * factor] = 65535
+            arr[factor, 2 * factor] = factor * factor // 2
+            arr[factor, 3 * factor] = factor * factor // 2 - 1
+            self.assertBaseline(arr, factor)
+            self.assertEqual(blockMean(arr, factor)[0, 1], 65535)
+
+    def test_strips(self):
+        # strips of a few rows, the last one is shorter:
+        L2A_Resample.STRIP_PIXELS = 3 * 60 * 2
+        arr = random.randint(0, 65536, (42, 60)).astype(uint16)
+        self.assertBaseline(arr, 2)
+        self.assertBaseline(arr, 6)
+
+    def test_types(self):
+        arr = random.randint(0, 256, (36, 48)).astype(uint8)
+        self.assertBaseline(arr, 3)
+        arr = random.random((36, 48)).astype(float32) * 1000.0
+        self.assertBaseline(arr, 6)
+
+
+def baselineUpsample(arr, nrows, ncols, order):
+    # the upsampling of L2A_Tables.resampleBand before upsample:
+    return (skit_resize(arr.astype(uint16), [nrows, ncols], order=order) * 65535.).round().astype(uint16)
+
+
+@unittest.skipUnless(SKIMAGE_014, 'the baseline needs the resize defaults of skimage 0.14')
+class TestUpsample(unittest.TestCase):
+    # bi-linear and bi-cubic are computed in float32 instead of float64, the rounded results may
+    # differ by 1 DN from the baseline. Nearest neighbour and the skimage fallback are bit-identical:
+    tolerance = {0: 0, 1: 1, 3: 1}
+
+    def setUp(self):
+        random.seed(0)
+
+    def assertBaseline(self, arr, nrows, ncols, order):
+        result = upsample(arr, nrows, ncols, order)
+        expected = baselineUpsample(arr, nrows, ncols, order)
+        self.assertEqual(result.dtype, uint16)
+        self.assertEqual(result.shape, (nrows, ncols))
+        diff = abs(result.astype(int32) - expected)
+        message = 'order %d, shape %s to %s' % (order, arr.shape, (nrows, ncols))
+        self.assertTrue(diff.max() <= self.tolerance[order], message)
+        # the edges, where the zeros outside of the image are part of the interpolation:
+        for edge in [diff[0], diff[-1], diff[:, 0], diff[:, -1]]:
+            self.assertTrue(edge.max() <= self.tolerance[order], message)
+
+    def test_factors(self):
+        # 20 to 10 m, 60 to 20 m and 60 to 10 m:
+        for factor in [2, 3, 6]:
+            arr = random.randint(0, 10000, (30, 40)).astype(uint16)
+            for order in [0, 1, 3]:
+                self.assertBaseline(arr, 30 * factor, 40 * factor, order)
+
+    def test_odd_shapes(self):
+        for shape in [(31, 17), (1, 5), (5, 1), (2, 2)]:
+            arr = random.randint(0, 10000, shape).astype(uint16)
+            for order in [0, 1, 3]:
+                self.assertBaseline(arr, shape[0] * 3, shape[1] * 2, order)
+
+    def test_nodata(self):
+        arr = random.randint(1, 10000, (24, 24)).astype(uint16)
+        arr[random.random(arr.shape) < 0.1] = 0
+        arr[:, :5] = 0
+        arr[-3:] = 0
+        for order in [0, 1, 3]:
+            self.assertBaseline(arr, 144, 144, order)
+
+    def test_edges(self):
+        # steps at the first and last rows and columns, and the maximum of the image as clip limit:
+        arr = zeros((12, 12), uint16)
+        arr[0] = 65535
+        arr[:, -1] = 40000
+        arr[5:7, 5:7] = 1
+        for order in [0, 1, 3]:
+            self.assertBaseline(arr, 72, 72, order)
+
+    def test_fallback(self):
+        # no integer factor, or another interpolation order, is passed to skimage:
+        arr = random.randint(0, 10000, (20, 30)).astype(uint16)
+        for nrows, ncols, order in [(50, 75, 1), (40, 60, 2), (30, 45, 3)]:
+            self.assertTrue(array_equal(upsample(arr, nrows, ncols, order), baselineUpsample(arr, nrows, ncols, order)))
+
+    def test_types(self):
+        arr = random.randint(0, 256, (10, 10)).astype(uint8)
+        for order in [0, 1, 3]:
+            self.assertBaseline(arr, 20, 20, order)
+
+
+if __name__ == '__main__':
+    unittest.main()
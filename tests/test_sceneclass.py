@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import os, sys, logging, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+
+try:
+    import osgeo
+except ImportError:
+    osgeo = None
+if osgeo:
+    from L2A_SceneClass import L2A_SceneClass
+
+
+class Config(object):
+    # the attributes of L2A_Config used by the cloud shadow detection, for a non square region of interest:
+    def __init__(self, nrows, ncols):
+        self.logger = logging.getLogger('sen2cor.test')
+        self.logger.addHandler(logging.NullHandler())
+        self.nrows = nrows
+        self.ncols = ncols
+        self.T_B02_B12 = 0.25
+        self.noData = 0
+        self.saturatedDefective = 1
+        self.darkFeatures = 2
+        self.cloudShadows = 3
+        self.vegetation = 4
+        self.bareSoils = 5
+        self.water = 6
+        self.lowProbaClouds = 7
+        self.medProbaClouds = 8
+        self.highProbaClouds = 9
+        self.thinCirrus = 10
+        self.snowIce = 11
+
+
+class Tables(object):
+    # reflectance bands of a bright surface with a dark 3 x 3 block in the lower right corner:
+    B02, B03, B04, B8A, B11, B12 = 1, 2, 3, 8, 11, 12
+
+    def __init__(self, nrows, ncols):
+        self.band = full((nrows, ncols), 0.5, float32)
+        self.band[-3:, -3:] = 0.01
+
+    def getBand(self, index):
+        return self.band.copy()
+
+
+@unittest.skipUnless(osgeo, 'GDAL is not available')
+class TestCloudShadows(unittest.TestCase):
+
+    def sceneClass(self, nrows, ncols):
+        return L2A_SceneClass(Config(nrows, ncols), Tables(nrows, ncols))
+
+    def test_non_square_roi(self):
+        # the region of interest of --roi is not square in general:
+        for nrows, ncols in [(5, 8), (8, 5)]:
+            msd = self.sceneClass(nrows, ncols).L2A_CSHD_1()
+            self.assertEqual(msd.shape, (nrows, ncols))
+            # the dark block is a potential cloud shadow, the bright surface is not:
+            self.assertTrue((msd[-2:, -2:] == 1.0).all())
+            self.assertEqual(msd[0, 0], 0.0)
+
+    def test_square_equivalence(self):
+        # the non square result is the corresponding part of a square one:
+        msd = self.sceneClass(8, 8).L2A_CSHD_1()
+        self.assertTrue(array_equal(self.sceneClass(8, 5).L2A_CSHD_1(), msd[:, 3:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
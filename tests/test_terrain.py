@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy import *
+import L2A_Terrain
+from L2A_Terrain import hornTerrain, sunAngleStrips
+
+# A small DEM with a flat area in rows 3 and 4, 20 m pixels:
+DEM = array([[100, 102, 105, 109, 114, 120, 127],
+             [101, 103, 107, 112, 118, 125, 133],
+             [ 99, 100, 100, 100, 100, 122, 130],
+             [ 98, 100, 100, 100, 100, 119, 126],
+             [ 97, 100, 100, 100, 100, 115, 121],
+             [ 95,  96,  98, 101, 105, 110, 116]], float32)
+RESOLUTION = 20.0
+
+# Reference outputs of gdaldem (GDAL 3.10.3) for DEM, written as Float32 GeoTIFF with 20 m pixels:
+# gdaldem slope -compute_edges
+SLOPE = array([[4.0447, 7.9558, 11.3957, 15.1318, 18.7799, 22.2951, 18.6018],
+               [5.1997, 7.3334, 11.5335, 16.7879, 23.2073, 24.6240, 21.5387],
+               [6.0545, 6.7255, 10.7457, 17.4256, 30.2291, 33.9119, 23.0344],
+               [6.3794, 2.9503, 0.0000, 0.0000, 25.2105, 33.4090, 22.5914],
+               [7.7002, 6.0753, 3.0775, 3.0775, 19.9365, 27.2145, 21.8111],
+               [7.2646, 9.5202, 8.6754, 10.5270, 13.3424, 16.8083, 16.2539]], float32)
+# gdaldem aspect -compute_edges
+ASPECT = array([[315.0000, 296.5651, 299.7449, 303.6901, 306.0274, 307.5686, 328.6713],
+                [254.0546, 240.9454, 229.9697, 219.9576, 239.3227, 264.5226, 280.9540],
+                [225.0000, 212.0054, 197.2415, 192.6526, 234.6052, 249.8804, 245.6954],
+                [243.4350, 255.9638, -9999.0000, -9999.0000, 264.6678, 257.4123, 237.2648],
+                [236.3099, 220.2364, 215.5377, 305.5377, 271.9749, 253.7677, 231.3402],
+                [191.3099, 206.5650, 235.0080, 289.6538, 288.4349, 245.5560, 210.9637]], float32)
+# gdaldem hillshade -compute_edges -az 315 -alt 45
+SHADE_315_45 = array([[193, 202, 211, 220, 228, 235, 227],
+                      [188, 185, 180, 168, 184, 212, 223],
+                      [180, 175, 162, 144, 171, 192, 191],
+                      [186, 185, 181, 181, 212, 204, 181],
+                      [184, 178, 179, 190, 215, 200, 175],
+                      [167, 169, 183, 207, 213, 191, 161]], uint8)
+# gdaldem hillshade -compute_edges -az 150 -alt 30
+SHADE_150_30 = array([[113, 101, 88, 72, 57, 41, 51],
+                      [123, 126, 133, 144, 119, 78, 66],
+                      [133, 139, 154, 171, 121, 85, 109],
+                      [126, 125, 128, 128, 77, 71, 122],
+                      [129, 135, 133, 117, 81, 90, 131],
+                      [148, 146, 129, 95, 87, 116, 153]], uint8)
+
+
+class TestHornTerrain(unittest.TestCase):
+
+    def setUp(self):
+        self.stripPixels = L2A_Terrain.STRIP_PIXELS
+
+    def tearDown(self):
+        L2A_Terrain.STRIP_PIXELS = self.stripPixels
+
+    def assertReference(self, azimuth, altitude, shade):
+        slp, asp, sdw = hornTerrain(DEM, RESOLUTION, azimuth, altitude)
+        self.assertEqual(slp.dtype, float32)
+        self.assertEqual(asp.dtype, float32)
+        self.assertEqual(sdw.dtype, uint8)
+        # the references are given with 4 decimals:
+        self.assertTrue(allclose(slp, SLOPE, rtol=0, atol=1e-3))
+        self.assertTrue(allclose(asp, ASPECT, rtol=0, atol=1e-3))
+        self.assertTrue(array_equal(sdw, shade))
+
+    def test_reference(self):
+        self.assertReference(315.0, 45.0, SHADE_315_45)
+        self.assertReference(150.0, 30.0, SHADE_150_30)
+
+    def test_first_last_rows(self):
+        # the edge rows are extrapolated with the columns clamped, as gdaldem -compute_edges:
+        slp, asp, sdw = hornTerrain(DEM, RESOLUTION, 315.0, 45.0)
+        for row in [0, -1]:
+            self.assertTrue(allclose(slp[row], SLOPE[row], rtol=0, atol=1e-3))
+            self.assertTrue(allclose(asp[row], ASPECT[row], rtol=0, atol=1e-3))
+            self.assertTrue(array_equal(sdw[row], SHADE_315_45[row]))
+        for col in [0, -1]:
+            self.assertTrue(allclose(slp[:, col], SLOPE[:, col], rtol=0, atol=1e-3))
+            self.assertTrue(array_equal(sdw[:, col], SHADE_315_45[:, col]))
+
+    def test_flat(self):
+        # the aspect of flat areas is -9999, the slope 0:
+        slp, asp, sdw = hornTerrain(DEM, RESOLUTION, 315.0, 45.0)
+        self.assertTrue((asp[3, 2:4] == -9999.0).all())
+        self.assertTrue((slp[3, 2:4] == 0.0).all())
+        slp, asp, sdw = hornTerrain(full((4, 5), 250.0, float32), RESOLUTION, 315.0, 45.0)
+        self.assertTrue((asp == -9999.0).all())
+        self.assertTrue((slp == 0.0).all())
+        # the shade of a flat surface is 254 * sin(altitude) + 1:
+        self.assertTrue((sdw == 181).all())
+
+    def test_strips(self):
+        # one row per strip, and strips of two rows:
+        for stripPixels in [7, 14]:
+            L2A_Terrain.STRIP_PIXELS = stripPixels
+            self.assertReference(315.0, 45.0, SHADE_315_45)
+
+    def test_products(self):
+        slp, asp, sdw = hornTerrain(DEM, RESOLUTION, 315.0, 45.0, slope=False, aspect=False)
+        self.assertTrue(slp is None)
+        self.assertTrue(asp is None)
+        self.assertTrue(array_equal(sdw, SHADE_315_45))
+
+    def test_sun_angle_strips(self):
+        # per-pixel sun angles give the shade of the scalar angles of each pixel:
+        azimuth = sunAngleStrips([[140.0, 150.0], [155.0, 170.0]], 7, 0.2)
+        altitude = sunAngleStrips([[25.0, 30.0], [35.0, 32.0]], 7, 0.2)
+        slp, asp, sdw = hornTerrain(DEM, RESOLUTION, azimuth, altitude)
+        self.assertTrue(allclose(slp, SLOPE, rtol=0, atol=1e-3))
+        az = azimuth(0, 6)
+        alt = altitude(0, 6)
+        for row in range(6):
+            for col in range(7):
+                expected = hornTerrain(DEM, RESOLUTION, float(az[row, col]), float(alt[row, col]),
+                                       slope=False, aspect=False)[2]
+                self.assertEqual(sdw[row, col], expected[row, col])
+        # a constant grid is the same as the scalar angles:
+        azimuth = sunAngleStrips(full((3, 3), 150.0), 7, 0.3)
+        altitude = sunAngleStrips(full((3, 3), 30.0), 7, 0.3)
+        sdw = hornTerrain(DEM, RESOLUTION, azimuth, altitude)[2]
+        self.assertTrue(array_equal(sdw, SHADE_150_30))
+
+
+class TestSunAngleStrips(unittest.TestCase):
+
+    def test_interpolation(self):
+        # 4 x 4 pixels per grid step, the pixel centres are at 0.125, 0.375, ... grid steps:
+        strip = sunAngleStrips([[10.0, 20.0], [30.0, 40.0]], 4, 0.25)
+        angles = strip(0, 4)
+        self.assertEqual(angles.dtype, float32)
+        pos = (arange(4) + 0.5) * 0.25
+        expected = 10.0 + 20.0 * pos[:, newaxis] + 10.0 * pos[newaxis, :]
+        self.assertTrue(allclose(angles, expected, rtol=0, atol=1e-4))
+
+    def test_offset_and_clamp(self):
+        # beyond the outer nodes, the values of the nodes are taken:
+        strip = sunAngleStrips([[10.0, 20.0], [30.0, 40.0]], 4, 1.0, rowOffset=-1.0, colOffset=-1.0)
+        angles = strip(0, 4)
+        self.assertTrue(allclose(angles[0], [10.0, 15.0, 20.0, 20.0]))
+        self.assertTrue(allclose(angles[:, 0], [10.0, 20.0, 30.0, 30.0]))
+        self.assertTrue(allclose(angles[3], [30.0, 35.0, 40.0, 40.0]))
+
+    def test_strips(self):
+        strip = sunAngleStrips(arange(20.0).reshape(4, 5), 9, 0.4, 0.1, 0.2)
+        self.assertTrue(array_equal(vstack([strip(0, 1), strip(1, 6), strip(6, 8)]), strip(0, 8)))
+
+    def test_single_row(self):
+        strip = sunAngleStrips([[10.0, 20.0]], 3, 0.5)
+        angles = strip(2, 5)
+        self.assertEqual(angles.shape, (3, 3))
+        self.assertTrue(allclose(angles, [[12.5, 17.5, 20.0]] * 3))
+
+
+if __name__ == '__main__':
+    unittest.main()